@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Format binaire des embeddings : un dossier mappable en mémoire.
+
+    climate_embeddings/
+        vectors.npy          matrice (n, dim) float32 ou float16
+        chunks.jsonl         un chunk par ligne (id, source(s), texte...), même ordre
+        chunks_offsets.npy   n + 1 positions en octets des lignes de chunks.jsonl
+        meta.json            modèle, dimension, dtype, nombre de chunks, empreinte du contenu
+
+vectors.npy s'ouvre avec np.load(mmap_mode='r') : rien n'est lu avant d'être
+utilisé, et une ligne de chunks.jsonl se relit sans parcourir le fichier.
+
+    python artifacts.py [dossier]                       infos, taille et temps de chargement
+    python artifacts.py --convert climate_embeddings_data.json [dossier]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+EMBEDDINGS_DIR = "climate_embeddings"
+VECTORS_FILE = "vectors.npy"
+CHUNKS_FILE = "chunks.jsonl"
+OFFSETS_FILE = "chunks_offsets.npy"
+META_FILE = "meta.json"
+FORMAT_VERSION = 1
+
+
+def write_artifact(path, records, vectors, model_name, dtype="float32"):
+    """Écrit records (dicts, sans 'embedding') et vectors (n, dim) dans le dossier path.
+
+    Le dossier est construit à côté puis mis en place par renommage : un
+    lecteur ne voit jamais un artefact à moitié écrit (voir recover_artifact).
+    """
+    vectors = np.asarray(vectors)
+    tmp_path = _new_tmp_dir(path)
+    np.save(os.path.join(tmp_path, VECTORS_FILE), vectors.astype(dtype, copy=False))
+    dim = int(vectors.shape[1]) if vectors.ndim == 2 else 0
+    return _finish_artifact(path, tmp_path, records, len(vectors), dim, model_name, dtype)
+
+
+def assemble_artifact(path, records, shard_paths, model_name, dtype="float32"):
+    """Comme write_artifact, mais les vecteurs viennent de fichiers .npy (n_i, dim) mis bout à bout.
+
+    vectors.npy est rempli par memmap, shard par shard : la mémoire reste bornée
+    par la taille d'un shard.
+    """
+    shapes = [np.load(shard, mmap_mode='r').shape for shard in shard_paths]
+    count = sum(shape[0] for shape in shapes)
+    dim = shapes[0][1] if shapes else 0
+    tmp_path = _new_tmp_dir(path)
+    vectors = np.lib.format.open_memmap(os.path.join(tmp_path, VECTORS_FILE), mode='w+',
+                                        dtype=dtype, shape=(count, dim))
+    row = 0
+    for shard in shard_paths:
+        block = np.load(shard, mmap_mode='r')
+        vectors[row:row + len(block)] = block
+        row += len(block)
+    vectors.flush()
+    del vectors
+    return _finish_artifact(path, tmp_path, records, count, dim, model_name, dtype)
+
+
+def recover_artifact(path):
+    """Remet en place path.old si un crash est survenu entre les deux renommages de _finish_artifact.
+
+    path est alors absent et path.old contient l'artefact précédent, complet.
+    Si path existe, path.old n'est qu'un reste du remplacement : il est supprimé.
+    """
+    old_path = path + '.old'
+    if not os.path.exists(old_path):
+        return
+    if os.path.exists(path):
+        shutil.rmtree(old_path, ignore_errors=True)
+    else:
+        os.replace(old_path, path)
+
+
+def _new_tmp_dir(path):
+    tmp_path = path + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    return tmp_path
+
+
+def _finish_artifact(path, tmp_path, records, count, dim, model_name, dtype):
+    """Écrit chunks.jsonl, les offsets et meta.json dans tmp_path, puis le met à la place de path.
+
+    content_sha256 couvre vectors.npy et chunks.jsonl : deux artefacts aux mêmes
+    octets ont la même empreinte, quelle que soit leur date de création.
+    """
+    digest = hashlib.sha256()
+    with open(os.path.join(tmp_path, VECTORS_FILE), 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    offsets = [0]
+    with open(os.path.join(tmp_path, CHUNKS_FILE), 'wb') as f:
+        for record in records:
+            line = json.dumps(record, ensure_ascii=False).encode('utf-8') + b'\n'
+            f.write(line)
+            digest.update(line)
+            offsets.append(f.tell())
+    if len(offsets) - 1 != count:
+        raise ValueError(f"{len(offsets) - 1} chunks pour {count} vecteurs")
+    np.save(os.path.join(tmp_path, OFFSETS_FILE), np.asarray(offsets, dtype=np.int64))
+
+    meta = {
+        "format_version": FORMAT_VERSION,
+        "model": model_name,
+        "count": int(count),
+        "dim": int(dim),
+        "dtype": np.dtype(dtype).name,
+        "content_sha256": digest.hexdigest(),
+        "created_at": time.time(),
+    }
+    with open(os.path.join(tmp_path, META_FILE), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+
+    recover_artifact(path)
+    old_path = path + '.old'
+    if os.path.exists(path):
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+    return meta
+
+
+class EmbeddingsArtifact:
+    """Lecture d'un artefact : vectors est un memmap, les chunks sont relus à la demande."""
+
+    def __init__(self, path=EMBEDDINGS_DIR):
+        self.path = path
+        recover_artifact(path)
+        with open(os.path.join(path, META_FILE), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.vectors = np.load(os.path.join(path, VECTORS_FILE), mmap_mode='r')
+        self.offsets = np.load(os.path.join(path, OFFSETS_FILE), mmap_mode='r')
+
+    def __len__(self):
+        return self.meta["count"]
+
+    @property
+    def chunks_path(self):
+        return os.path.join(self.path, CHUNKS_FILE)
+
+    def iter_records(self):
+        """Chunks dans l'ordre des lignes de vectors."""
+        with open(self.chunks_path, 'rb') as f:
+            for line in f:
+                yield json.loads(line)
+
+    def records(self, indices):
+        """Chunks des lignes indices (dans cet ordre), lus par position dans chunks.jsonl."""
+        records = []
+        with open(self.chunks_path, 'rb') as f:
+            for index in indices:
+                start, end = int(self.offsets[index]), int(self.offsets[index + 1])
+                f.seek(start)
+                records.append(json.loads(f.read(end - start)))
+        return records
+
+    def float32_vectors(self, start=0, stop=None):
+        """Tranche de vectors en float32 (copie seulement si stockée en float16)."""
+        return np.asarray(self.vectors[start:stop], dtype=np.float32)
+
+
+def artifact_size(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def convert_legacy_json(json_path, path=EMBEDDINGS_DIR, model_name=None, dtype="float32"):
+    """Convertit un ancien climate_embeddings_data.json (liste de chunks + 'embedding')."""
+    with open(json_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    vectors = np.array([item.pop('embedding') for item in data], dtype=np.float32)
+    return write_artifact(path, data, vectors, model_name, dtype)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect or create a memory-mapped embeddings artifact.")
+    parser.add_argument("path", nargs="?", default=EMBEDDINGS_DIR, help="artifact folder")
+    parser.add_argument("--convert", metavar="JSON", help="convert a legacy embeddings JSON file")
+    parser.add_argument("--float16", action="store_true", help="store the vectors in float16 (--convert)")
+    args = parser.parse_args(argv)
+
+    if args.convert:
+        convert_legacy_json(args.convert, args.path, dtype="float16" if args.float16 else "float32")
+
+    start = time.perf_counter()
+    artifact = EmbeddingsArtifact(args.path)
+    open_time = time.perf_counter() - start
+    artifact.float32_vectors()
+    records = list(artifact.iter_records())
+    load_time = time.perf_counter() - start
+    meta = artifact.meta
+    print(f"{args.path}: {meta['count']} chunks x {meta['dim']} {meta['dtype']} ({meta['model']})")
+    print(f"size {artifact_size(args.path) / (1024 * 1024):.1f} MB, "
+          f"open {open_time * 1000:.1f} ms, full read {load_time * 1000:.1f} ms")
+    if records:
+        print(f"first chunk: {records[0]['id']}")
+
+    if args.convert:
+        start = time.perf_counter()
+        with open(args.convert, 'r', encoding='utf-8') as f:
+            json.load(f)
+        json_time = time.perf_counter() - start
+        json_size = os.path.getsize(args.convert)
+        print(f"{args.convert}: {json_size / (1024 * 1024):.1f} MB, json.load {json_time * 1000:.0f} ms "
+              f"-> x{json_size / artifact_size(args.path):.1f} smaller, "
+              f"x{json_time / load_time if load_time else float('inf'):.0f} faster to read")
+
+
+if __name__ == "__main__":
+    main()
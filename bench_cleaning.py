@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Benchmark du moteur de nettoyage (text_cleaning.py) contre les anciens nettoyeurs.
+
+Vérifie que la sortie est identique octet par octet et mesure le débit.
+Corpus par défaut : climate_articles.pdf (1.7 MB) + les .txt déjà extraits.
+
+    python bench_cleaning.py [fichiers .pdf/.txt ...]
+"""
+
+import glob
+import os
+import re
+import sys
+import time
+
+import text_cleaning
+
+DEFAULT_CORPUS = ["climate_articles.pdf"] + \
+    glob.glob(os.path.join("climate_facts_content", "*.txt")) + \
+    glob.glob(os.path.join("climate_facts_content_from_pdfs", "*.txt"))
+REPEAT = 3
+
+
+# --- Anciennes implémentations, gardées telles quelles comme référence ----
+
+def legacy_clean_rag_text(text):
+    patterns_to_remove = [
+        (r'^(Figure|Table|Box|FAQ|Cross-Chapter Box|Cross-Working Group Box)[\s\d.A-Za-z,|:]+.*$', ''),
+        (r'\{[^{}]+\}', ''),
+        (
+        r'^(Open section|Downloads|Authors|Figures|How to cite|Expand all sections|View|Open figure|Copy|doi|Share on .*|Share via .*|Read more|Explore more)$',
+        ''),
+        (
+        r'^(Coordinatin g Lead Authors:|Lead Authors:|Contri buting Authors:|Review Editors:|Chapter Scientists:|Contributing Authors:).*$',
+        ''),
+        (r'^This chapter should be cited as:.*$', ''),
+        (r'^\d+\s+.{,100}$', ''),
+        (r'^(Executive Summary|Technical Summary|Summary for Policymakers|Frequently Asked Questions)$', ''),
+        (r'Copyright National Academy of Sciences\. All rights reserved\.', ''),
+        (r'EVIDENCE & CAUSES 2020', ''),
+        (r'CLIMATE CHANGE', ''),
+    ]
+
+    for pattern, replacement in patterns_to_remove:
+        text = re.sub(pattern, replacement, text, flags=re.MULTILINE | re.IGNORECASE)
+
+    text = re.sub(r'\n{2,}', '\n', text)
+
+    return text.strip()
+
+
+def legacy_filter_figure_sections(text):
+    paragraphs = text.split('\n\n')
+    filtered_paragraphs = []
+
+    for paragraph in paragraphs:
+        paragraph = paragraph.strip()
+        if len(paragraph) < 20:
+            continue
+        figure_keywords = [
+            'Figure', 'Fig.', 'Table', 'Box', 'Panel',
+            'Chart', 'Graph', 'Diagram', 'Map', 'Image'
+        ]
+        words = paragraph.split()
+        figure_word_count = sum(1 for word in words if any(keyword in word for keyword in figure_keywords))
+        if len(words) > 0 and figure_word_count / len(words) > 0.2:
+            continue
+        if paragraph.count('(') > len(paragraph) / 20:
+            continue
+        alpha_chars = re.sub(r'[^a-zA-Z]', '', paragraph)
+        if len(alpha_chars) < len(paragraph) * 0.5:
+            continue
+        filtered_paragraphs.append(paragraph)
+
+    return '\n\n'.join(filtered_paragraphs)
+
+
+def legacy_clean_extracted_text(text):
+    lines = text.split('\n')
+    cleaned_lines = []
+    ignore_patterns = text_cleaning.IGNORE_LINE_PATTERNS
+
+    for line in lines:
+        line = line.strip()
+        if len(line) < 5:
+            continue
+        should_ignore = False
+        for pattern in ignore_patterns:
+            if re.match(pattern, line, re.IGNORECASE):
+                should_ignore = True
+                break
+        if should_ignore:
+            continue
+        if len(re.sub(r'[^a-zA-Z]', '', line)) < len(line) * 0.3:
+            continue
+        if line.count('.') > len(line) * 0.5:
+            continue
+        if line.count('_') > len(line) * 0.3:
+            continue
+        line = re.sub(r'\s+', ' ', line)
+        line = re.sub(r'[\x00-\x1f\x7f-\x9f]', '', line)
+        cleaned_lines.append(line)
+
+    return '\n'.join(cleaned_lines)
+
+
+def legacy_keep_long_lines(text):
+    final_lines = []
+    for line in text.split('\n'):
+        stripped_line = line.strip()
+        if stripped_line and len(stripped_line) > 25:
+            final_lines.append(stripped_line)
+    return '\n'.join(final_lines)
+
+
+# --- Benchmark ------------------------------------------------------------
+
+def load_pages(path):
+    if path.lower().endswith('.pdf'):
+        import fitz
+        with fitz.open(path) as doc:
+            return [page.get_text("text") for page in doc]
+    with open(path, 'r', encoding='utf-8') as f:
+        return [f.read()]
+
+
+def run_rag(clean, keep, documents):
+    return [keep(clean(doc)) for doc in documents]
+
+
+def run_pdf(filter_sections, clean, documents):
+    outputs = []
+    for pages in documents:
+        text_content = []
+        for page_num, text in enumerate(pages, 1):
+            filtered_text = filter_sections(text.strip())
+            if filtered_text.strip():
+                text_content.append(f"=== Page {page_num} ===\n{filtered_text}\n")
+        outputs.append(clean("\n".join(text_content)))
+    return outputs
+
+
+def timed(function, *args):
+    best = float('inf')
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        result = function(*args)
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def main():
+    paths = [path for path in (sys.argv[1:] or DEFAULT_CORPUS) if os.path.exists(path)]
+    if not paths:
+        print("❌ Aucun fichier de corpus trouvé")
+        return
+
+    page_sets = [load_pages(path) for path in paths]
+    documents = ["".join(pages) for pages in page_sets]
+    size_mb = sum(len(doc.encode('utf-8')) for doc in documents) / (1024 * 1024)
+    print(f"📚 Corpus: {len(paths)} fichier(s), {size_mb:.2f} MB de texte, meilleur temps sur {REPEAT} essais")
+
+    cases = [
+        ("clean_rag_text", run_rag,
+         (legacy_clean_rag_text, legacy_keep_long_lines, documents),
+         (text_cleaning.clean_rag_text, text_cleaning.keep_long_lines, documents)),
+        ("filter_figure_sections + clean_extracted_text", run_pdf,
+         (legacy_filter_figure_sections, legacy_clean_extracted_text, page_sets),
+         (text_cleaning.filter_figure_sections, text_cleaning.clean_extracted_text, page_sets)),
+    ]
+
+    identical = True
+    for name, runner, legacy_args, engine_args in cases:
+        legacy_output, legacy_time = timed(runner, *legacy_args)
+        engine_output, engine_time = timed(runner, *engine_args)
+        same = [a.encode('utf-8') for a in legacy_output] == [b.encode('utf-8') for b in engine_output]
+        identical &= same
+        print(f"\n🔧 {name}")
+        print(f"   ancien : {legacy_time * 1000:8.1f} ms ({size_mb / legacy_time:6.1f} MB/s)")
+        print(f"   moteur : {engine_time * 1000:8.1f} ms ({size_mb / engine_time:6.1f} MB/s)  x{legacy_time / engine_time:.1f}")
+        print(f"   sortie identique: {'✅' if same else '❌'}")
+
+    if not identical:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
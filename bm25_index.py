@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Index inversé BM25 sur les chunks, stocké en tableaux numpy (format CSR).
+
+    climate_bm25/
+        postings.npz   term_offsets (V + 1), doc_ids, term_freqs, doc_lengths, doc_offsets
+        vocab.json     termes dans l'ordre de leurs ids
+        meta.json      fichier de chunks indexé (+ SHA-256), k1, b, longueur moyenne
+
+Les postings d'un terme sont une tranche contiguë de doc_ids / term_freqs :
+une requête ne touche que les postings de ses termes. Les chunks sont relus
+par position (doc_offsets) dans le fichier JSON Lines indexé.
+
+Les termes techniques sont gardés entiers ("ssp5-8.5", "co2") en plus de
+leurs parties ("ssp5", "8.5"), que MiniLM tend à diluer.
+
+    python bm25_index.py build [--input climate_chunks_dedup.jsonl]
+    python bm25_index.py search "AMOC collapse SSP5-8.5" [-k 8]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+from array import array
+
+import numpy as np
+
+INPUT_CHUNKS_FILE = "climate_chunks_dedup.jsonl"  # Mêmes chunks que ceux embeddés
+BM25_DIR = "climate_bm25"
+K1 = 1.2
+B = 0.75
+RRF_K = 60  # Constante de la reciprocal rank fusion
+
+_TOKEN = re.compile(r"[0-9a-zà-öø-ÿ]+(?:[.\-–/][0-9a-zà-öø-ÿ]+)*")
+_TOKEN_PART = re.compile(r"[0-9a-zà-öø-ÿ]+(?:\.[0-9]+)?")
+STOPWORDS = frozenset("""
+a an and are as at be been but by for from has have in into is it its of on or that the their there these this
+those to was were which will with not no can than also such more most other over may between during
+le la les de des du un une et en est que qui dans pour par sur au aux ce ces il elle ils sont pas plus ou
+""".split())
+
+
+def tokenize(text):
+    """Termes d'un texte : minuscules, mots composés entiers et leurs parties, sans mots vides."""
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        if token not in STOPWORDS:
+            tokens.append(token)
+        parts = _TOKEN_PART.findall(token)
+        if len(parts) > 1:
+            tokens.extend(part for part in parts if part not in STOPWORDS)
+    return tokens
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def build_index(input_file=INPUT_CHUNKS_FILE, output_dir=BM25_DIR):
+    """Construit l'index en un passage sur le fichier de chunks ; retourne meta."""
+    vocab = {}
+    term_ids = array('i')
+    doc_ids = array('i')
+    freqs = array('i')
+    doc_lengths = array('i')
+    doc_offsets = array('q', [0])
+
+    with open(input_file, 'rb') as f:
+        for doc_id, line in enumerate(f):
+            doc_offsets.append(doc_offsets[-1] + len(line))
+            tokens = tokenize(json.loads(line)['text'])
+            doc_lengths.append(len(tokens))
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, count in counts.items():
+                term_ids.append(vocab.setdefault(token, len(vocab)))
+                doc_ids.append(doc_id)
+                freqs.append(count)
+
+    term_ids = np.frombuffer(term_ids, dtype=np.int32)
+    order = np.argsort(term_ids, kind='stable')  # Postings triés par terme, puis par document
+    term_offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(term_ids, minlength=len(vocab)), out=term_offsets[1:])
+    doc_lengths = np.frombuffer(doc_lengths, dtype=np.int32)
+
+    tmp_dir = output_dir + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    np.savez(os.path.join(tmp_dir, "postings.npz"),
+             term_offsets=term_offsets,
+             doc_ids=np.frombuffer(doc_ids, dtype=np.int32)[order],
+             term_freqs=np.frombuffer(freqs, dtype=np.int32)[order].astype(np.uint16),
+             doc_lengths=doc_lengths,
+             doc_offsets=np.frombuffer(doc_offsets, dtype=np.int64))
+    with open(os.path.join(tmp_dir, "vocab.json"), 'w', encoding='utf-8') as f:
+        json.dump(sorted(vocab, key=vocab.get), f, ensure_ascii=False)
+    meta = {
+        "input_file": input_file,
+        "input_sha256": file_sha256(input_file),
+        "documents": len(doc_lengths),
+        "terms": len(vocab),
+        "postings": len(order),
+        "avg_doc_length": float(doc_lengths.mean()) if len(doc_lengths) else 0.0,
+        "k1": K1,
+        "b": B,
+    }
+    with open(os.path.join(tmp_dir, "meta.json"), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.replace(tmp_dir, output_dir)
+    return meta
+
+
+class BM25Index:
+    def __init__(self, index_dir=BM25_DIR):
+        with open(os.path.join(index_dir, "meta.json"), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        with open(os.path.join(index_dir, "vocab.json"), 'r', encoding='utf-8') as f:
+            self.vocab = {term: term_id for term_id, term in enumerate(json.load(f))}
+        with np.load(os.path.join(index_dir, "postings.npz")) as data:
+            self.term_offsets = data['term_offsets']
+            self.doc_ids = data['doc_ids']
+            self.term_freqs = data['term_freqs'].astype(np.float32)
+            self.doc_offsets = data['doc_offsets']
+            doc_lengths = data['doc_lengths'].astype(np.float32)
+        self.num_docs = len(doc_lengths)
+        avg = self.meta['avg_doc_length'] or 1.0
+        k1, b = self.meta['k1'], self.meta['b']
+        # Partie de la normalisation BM25 propre à chaque document, calculée une fois
+        self.doc_norms = k1 * (1 - b + b * doc_lengths / avg)
+        self.k1 = k1
+        document_freqs = np.diff(self.term_offsets)
+        self.idf = np.log1p((self.num_docs - document_freqs + 0.5) / (document_freqs + 0.5)).astype(np.float32)
+
+    def search(self, query, k):
+        """[(ligne du document, score)] des k meilleurs documents pour query, score décroissant."""
+        term_ids = {self.vocab[token] for token in tokenize(query) if token in self.vocab}
+        if not term_ids:
+            return []
+        scores = np.zeros(self.num_docs, dtype=np.float32)
+        for term_id in term_ids:
+            start, end = self.term_offsets[term_id], self.term_offsets[term_id + 1]
+            docs = self.doc_ids[start:end]
+            tf = self.term_freqs[start:end]
+            scores[docs] += self.idf[term_id] * tf * (self.k1 + 1) / (tf + self.doc_norms[docs])
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+        return [(int(doc), float(scores[doc])) for doc in candidates]
+
+    def records(self, docs):
+        """Chunks des lignes docs, relus par position dans le fichier indexé."""
+        records = []
+        with open(self.meta['input_file'], 'rb') as f:
+            for doc in docs:
+                f.seek(int(self.doc_offsets[doc]))
+                records.append(json.loads(f.read(int(self.doc_offsets[doc + 1] - self.doc_offsets[doc]))))
+        return records
+
+    def is_stale(self):
+        """Vrai si le fichier de chunks a changé depuis la construction (les offsets seraient faux)."""
+        return not os.path.exists(self.meta['input_file']) or file_sha256(self.meta['input_file']) != self.meta['input_sha256']
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """Fusionne des listes d'ids classés : score(id) = somme des 1 / (k + rang). Retourne les ids triés."""
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, 1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=lambda item: -scores[item])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or query the BM25 index over the chunks.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="index a JSON Lines chunk file")
+    build_parser.add_argument("--input", default=INPUT_CHUNKS_FILE)
+    build_parser.add_argument("--output", default=BM25_DIR)
+    search_parser = subparsers.add_parser("search", help="run a lexical query")
+    search_parser.add_argument("query")
+    search_parser.add_argument("-k", type=int, default=8)
+    search_parser.add_argument("--index", default=BM25_DIR)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        start = time.time()
+        meta = build_index(args.input, args.output)
+        print(f"{meta['documents']} chunks, {meta['terms']} terms, {meta['postings']} postings "
+              f"-> {args.output} in {time.time() - start:.1f}s")
+        return
+
+    index = BM25Index(args.index)
+    start = time.perf_counter()
+    results = index.search(args.query, args.k)
+    elapsed = time.perf_counter() - start
+    print(f"{len(results)} result(s) in {elapsed * 1000:.2f} ms")
+    for (doc, score), record in zip(results, index.records([doc for doc, _ in results])):
+        print(f"  {score:6.2f}  {record['id']}  {' '.join(record['text'].split())[:100]}")
+
+
+if __name__ == "__main__":
+    main()
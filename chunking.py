@@ -1,65 +1,508 @@
 import os
 import json
+import time
+import argparse
+import hashlib
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 
 
 INPUT_DIR = "climate_facts_content"
+# Dossiers découpés par défaut (ceux qui n'existent pas sont ignorés)
+INPUT_DIRS = [INPUT_DIR, "climate_facts_content_from_pdfs"]
 
-OUTPUT_CHUNKS_FILE = "climate_chunks_data.json"
+# Un chunk JSON par ligne, écrit au fur et à mesure
+OUTPUT_CHUNKS_FILE = "climate_chunks_data.jsonl"
+
+# Chunking incrémental : seuls les fichiers nouveaux ou modifiés sont re-découpés.
+# En aval, le travail se limite aussi aux chunks changés, par contenu : le cache
+# d'embeddings est indexé par texte et vectorstore.py compare des empreintes par id
+CHUNK_MANIFEST_FILE = "climate_chunks_manifest.json"
+CHUNK_CACHE_DIR = ".chunk_cache"
+CHUNKER_VERSION = 3  # À incrémenter si le découpage change sans changer la config
+
+MAX_WORKERS = os.cpu_count() or 1
+
+# "chars" : chunks de CHUNK_SIZE caractères (RecursiveCharacterTextSplitter)
+# "tokens" : phrases entières regroupées jusqu'à TOKENS_PER_CHUNK tokens du tokenizer choisi
+CHUNK_MODE = "chars"
 
 CHUNK_SIZE = 1200
 CHUNK_OVERLAP = 200
 
+# Mode "tokens" : paraphrase-multilingual-MiniLM-L12-v2 tronque à 128 tokens,
+# dont 2 spéciaux (<s> et </s>) ; tout ce qui dépasse n'est jamais indexé
+TOKENIZER = "embedding"  # "embedding" (modèle d'embedding) ou "llm" (Llama 3, vocabulaire seul)
+EMBEDDING_MODEL_NAME = 'sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2'
+EMBEDDING_MAX_SEQ_LENGTH = 128
+LLM_MODEL_PATH = "/home/benoit_v/Documents/models/Meta-Llama-3-8B-Instruct.Q4_K_M.gguf"
+TOKENS_PER_CHUNK = EMBEDDING_MAX_SEQ_LENGTH - 2
+TOKEN_OVERLAP = 16  # Phrases de fin d'un chunk reprises en tête du suivant, dans cette limite
+
+# Les fichiers sont lus par fenêtres de lignes : la mémoire reste bornée même
+# pour un rapport de plusieurs milliers de pages. Le texte lu n'est découpé que
+# jusqu'à un point de coupe sûr (voir safe_cut) ; sans point de coupe dans
+# MAX_BUFFER_CHARS, les frontières des chunks peuvent différer du fichier entier.
+WINDOW_CHARS = 50 * CHUNK_SIZE
+MAX_BUFFER_CHARS = 4 * WINDOW_CHARS
+
+SEPARATORS = ["\n\n", "\n", ". ", ", ", " ", ""]
+PARAGRAPH_SEPARATOR = re.compile(re.escape(SEPARATORS[0]))
+
 text_splitter = RecursiveCharacterTextSplitter(
     chunk_size=CHUNK_SIZE,
     chunk_overlap=CHUNK_OVERLAP,
     length_function=len,
-    separators=["\n\n", "\n", ". ", ", ", " ", ""]
+    separators=SEPARATORS
 )
 
 
-all_chunks = []
+def chunker_config(mode=CHUNK_MODE, tokenizer=TOKENIZER, tokens_per_chunk=TOKENS_PER_CHUNK,
+                   token_overlap=TOKEN_OVERLAP):
+    """Paramètres du découpage : passés aux workers et comparés au manifeste (invalide le cache)."""
+    if mode == "tokens":
+        return {
+            "version": CHUNKER_VERSION,
+            "mode": mode,
+            "tokenizer": tokenizer,
+            "model": EMBEDDING_MODEL_NAME if tokenizer == "embedding" else os.path.basename(LLM_MODEL_PATH),
+            "tokens_per_chunk": tokens_per_chunk,
+            "token_overlap": token_overlap,
+            "window_chars": WINDOW_CHARS,
+        }
+    return {
+        "version": CHUNKER_VERSION,
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "separators": SEPARATORS,
+        "window_chars": WINDOW_CHARS,
+    }
 
 
-try:
-    txt_files = [f for f in os.listdir(INPUT_DIR) if f.endswith(".txt")]
+def config_fingerprint(config):
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()[:12]
 
-    if not txt_files:
-        print("no file found")
-        exit()
 
-    total_files = len(txt_files)
+def file_sha256(filepath):
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def stable_chunk_id(filename, text, seen):
+    """Id dérivé du contenu : ne dépend ni de l'ordre des fichiers ni de la position du chunk.
+
+    seen compte les textes identiques dans un même fichier pour garder des ids uniques.
+    """
+    digest = hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+    occurrence = seen.get(digest, 0)
+    seen[digest] = occurrence + 1
+    return f"{filename}_{digest}" if occurrence == 0 else f"{filename}_{digest}_{occurrence}"
+
+
+def iter_text_windows(filepath, window_chars=WINDOW_CHARS):
+    """Lit un fichier par blocs de lignes entières d'environ window_chars caractères."""
+    buffer = []
+    size = 0
+    with open(filepath, 'r', encoding='utf-8') as f:
+        for line in f:
+            buffer.append(line)
+            size += len(line)
+            if size >= window_chars:
+                yield ''.join(buffer)
+                buffer = []
+                size = 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+class HFTokenCounter:
+    """Compte les tokens avec le tokenizer Hugging Face du modèle d'embedding."""
+
+    def __init__(self, model_name=EMBEDDING_MODEL_NAME):
+        from transformers import AutoTokenizer
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+
+    def lengths(self, texts):
+        return [len(ids) for ids in self.tokenizer(texts, add_special_tokens=False)["input_ids"]]
+
+
+class LlamaTokenCounter:
+    """Compte les tokens avec le tokenizer du GGUF, chargé sans les poids (vocab_only)."""
+
+    def __init__(self, model_path=LLM_MODEL_PATH):
+        from llama_cpp import Llama
+
+        self.llm = Llama(model_path=model_path, vocab_only=True, verbose=False)
+
+    def lengths(self, texts):
+        return [len(self.llm.tokenize(text.encode('utf-8'), add_bos=False)) for text in texts]
+
+
+_token_counters = {}
+
+
+def get_token_counter(tokenizer):
+    """Un tokenizer par processus, chargé au premier fichier découpé en mode "tokens"."""
+    if tokenizer not in _token_counters:
+        if tokenizer == "embedding":
+            _token_counters[tokenizer] = HFTokenCounter()
+        elif tokenizer == "llm":
+            _token_counters[tokenizer] = LlamaTokenCounter()
+        else:
+            raise ValueError(f"unknown tokenizer: {tokenizer} (choices: embedding, llm)")
+    return _token_counters[tokenizer]
+
+
+# Fin de phrase suivie d'un début de phrase ; "e.g. the" ou "3.5 m" ne coupent pas
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+(?=[A-Z0-9"“(\[])')
+# Ligne finie par une fin de phrase (éventuellement suivie d'un guillemet ou d'une parenthèse)
+SENTENCE_END = re.compile(r'[.!?]["”)\]]*$')
+SIZE_BATCH = 256  # Phrases tokenisées par appel au tokenizer
+
+
+def iter_paragraphs(filepath):
+    """Paragraphes d'un fichier, lignes recollées par des espaces.
+
+    Le texte extrait des PDF est coupé à largeur fixe : un paragraphe s'arrête à
+    une ligne vide ou à une ligne finie par une fin de phrase (au plus
+    WINDOW_CHARS caractères, pour borner la mémoire).
+    """
+    lines = []
+    size = 0
+    for window in iter_text_windows(filepath):
+        for line in window.splitlines():
+            line = line.strip()
+            if line:
+                lines.append(line)
+                size += len(line) + 1
+            if lines and (not line or SENTENCE_END.search(line) or size >= WINDOW_CHARS):
+                yield ' '.join(lines)
+                lines = []
+                size = 0
+    if lines:
+        yield ' '.join(lines)
+
+
+def iter_sentences(filepath):
+    """(phrase, début de paragraphe ?) d'un fichier ; une phrase peut traverser des retours à la ligne."""
+    for paragraph in iter_paragraphs(filepath):
+        first = True
+        for sentence in SENTENCE_BOUNDARY.split(paragraph):
+            if sentence:
+                yield sentence, first
+                first = False
+
+
+def iter_sized(sentences, counter):
+    """Ajoute le nombre de tokens à chaque (phrase, début de paragraphe), par lots de SIZE_BATCH."""
+    batch = []
+    for item in sentences:
+        batch.append(item)
+        if len(batch) == SIZE_BATCH:
+            yield from zip(batch, counter.lengths([sentence for sentence, _ in batch]))
+            batch = []
+    if batch:
+        yield from zip(batch, counter.lengths([sentence for sentence, _ in batch]))
+
+
+def join_sentences(parts):
+    """Recolle les phrases : espace dans un paragraphe, saut de ligne entre deux paragraphes."""
+    text = parts[0][0][0]
+    for (sentence, starts_paragraph), _ in parts[1:]:
+        text += ('\n' if starts_paragraph else ' ') + sentence
+    return text
+
 
-    for i, filename in enumerate(txt_files):
-        filepath = os.path.join(INPUT_DIR, filename)
+def split_long_sentence(sentence, counter, budget):
+    """Coupe une phrase trop longue entre deux mots, en morceaux d'au plus budget tokens."""
+    words = sentence.split()
+    piece = []
+    size = 0
+    for word, length in zip(words, counter.lengths(words)):
+        if piece and size + length > budget:
+            yield ' '.join(piece)
+            piece = []
+            size = 0
+        piece.append(word)
+        size += length
+    if piece:
+        yield ' '.join(piece)
 
-        with open(filepath, 'r', encoding='utf-8') as f:
-            file_content = f.read()
 
-        if not file_content.strip():
+def iter_token_chunks(filepath, config):
+    """Chunks de phrases entières d'au plus tokens_per_chunk tokens.
+
+    La taille d'un chunk est la somme des tokens de ses phrases ; seules les
+    phrases plus longues que le budget sont coupées entre deux mots. Les
+    dernières phrases d'un chunk (au plus token_overlap tokens) sont reprises
+    en tête du suivant.
+    """
+    counter = get_token_counter(config["tokenizer"])
+    budget, overlap = config["tokens_per_chunk"], config["token_overlap"]
+    current = []
+    size = 0
+    for item, length in iter_sized(iter_sentences(filepath), counter):
+        if length > budget:
+            if current:
+                yield join_sentences(current)
+            current = []
+            size = 0
+            yield from split_long_sentence(item[0], counter, budget)
             continue
+        if current and size + length > budget:
+            yield join_sentences(current)
+            kept = []
+            size = 0
+            for part in reversed(current):
+                if size + part[1] > overlap:
+                    break
+                kept.insert(0, part)
+                size += part[1]
+            if size + length > budget:
+                kept = []
+                size = 0
+            current = kept
+        current.append((item, length))
+        size += length
+    if current:
+        yield join_sentences(current)
+
+
+def safe_cut(text):
+    """Début du dernier paragraphe d'au moins CHUNK_SIZE caractères de text, 0 s'il n'y en a pas.
+
+    Le splitter découpe un tel paragraphe seul (sans fusion ni chevauchement
+    avec ce qui précède) : couper juste avant lui donne les mêmes chunks que
+    le texte entier. text doit commencer au début du fichier ou à une coupe.
+    """
+    starts = [match.start() for match in PARAGRAPH_SEPARATOR.finditer(text)]
+    # Le dernier paragraphe continue peut-être dans la fenêtre suivante, et
+    # son séparateur peut chevaucher la fin de text : sa longueur est un minimum
+    ends = starts[1:] + [len(text) - len(SEPARATORS[0]) + 1]
+    for start, end in zip(reversed(starts), reversed(ends)):
+        if start > 0 and end - start >= CHUNK_SIZE:
+            return start
+    return 0
+
+
+def iter_file_chunks(filepath, config=None):
+    """Découpe un fichier en chunks, fenêtre par fenêtre.
+
+    Le texte lu est découpé jusqu'à son dernier point de coupe sûr, et le
+    reste attend la fenêtre suivante : les chunks sont ceux du fichier entier.
+    Si MAX_BUFFER_CHARS passent sans point de coupe, le dernier chunk est
+    reporté en tête de la suite ; les frontières suivantes peuvent alors
+    différer de celles du fichier entier (aucun texte n'est perdu).
+    """
+    if config and config.get("mode") == "tokens":
+        yield from iter_token_chunks(filepath, config)
+        return
+    buffer = ""
+    for window in iter_text_windows(filepath):
+        buffer += window
+        cut = safe_cut(buffer)
+        if cut:
+            yield from text_splitter.split_text(buffer[:cut])
+            buffer = buffer[cut:]
+        elif len(buffer) >= MAX_BUFFER_CHARS:
+            chunks = text_splitter.split_text(buffer)
+            buffer = chunks.pop() + "\n" if chunks else ""
+            yield from chunks
+    if buffer:
+        yield from text_splitter.split_text(buffer)
+
+
+def chunk_file(filepath, filename, config=None):
+    """Chunks d'un fichier, avec ids stables."""
+    # total_chunks_in_file impose de garder les chunks d'un fichier (jamais du corpus)
+    chunks = list(iter_file_chunks(filepath, config))
+    num_chunks = len(chunks)
+    seen = {}
+    return [{
+        "id": stable_chunk_id(filename, chunk, seen),
+        "source": filename,
+        "text": chunk,
+        "chunk_index": j,
+        "total_chunks_in_file": num_chunks
+    } for j, chunk in enumerate(chunks)]
+
+
+def cache_path(filename, sha256, fingerprint):
+    # Les records contiennent le nom du fichier (id, source) : il fait partie de la clé
+    name_digest = hashlib.sha256(filename.encode('utf-8')).hexdigest()[:8]
+    return os.path.join(CHUNK_CACHE_DIR, f"{sha256}-{name_digest}-{fingerprint}.jsonl")
+
+
+def load_manifest():
+    if os.path.exists(CHUNK_MANIFEST_FILE):
+        with open(CHUNK_MANIFEST_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {"config": None, "files": {}}
+
+
+def save_json(path, data):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def iter_chunk_records(files, old_manifest, new_manifest, stats, pool=None, workers=MAX_WORKERS):
+    """Produit les chunks de tous les fichiers, dans l'ordre de files.
+
+    files est une liste de (chemin, nom). Les fichiers inchangés sont relus
+    depuis le cache ; les autres sont découpés dans pool (au plus 2 * workers
+    fichiers en vol), et leurs résultats consommés dans l'ordre : la sortie est
+    identique à un passage séquentiel.
+    """
+    config = new_manifest["config"]
+    fingerprint = config_fingerprint(config)
+    same_config = old_manifest.get("config") == config
+    os.makedirs(CHUNK_CACHE_DIR, exist_ok=True)
+
+    plan = []
+    for filepath, filename in files:
+        sha256 = file_sha256(filepath)
+        previous = old_manifest["files"].get(filename)
+        cached = cache_path(filename, sha256, fingerprint)
+        up_to_date = same_config and previous and previous["sha256"] == sha256 and os.path.exists(cached)
+        plan.append((filepath, filename, sha256, cached, up_to_date))
+
+    pending = deque()
+    to_chunk = iter([item for item in plan if not item[4]])
+
+    def submit_next():
+        item = next(to_chunk, None)
+        if item is not None:
+            filepath, filename = item[0], item[1]
+            pending.append(pool.submit(chunk_file, filepath, filename, config) if pool else (filepath, filename, config))
+
+    for _ in range(2 * workers):
+        submit_next()
+
+    for filepath, filename, sha256, cached, up_to_date in plan:
+        if up_to_date:
+            stats["unchanged"] += 1
+            records = iter_chunks(cached)
+        else:
+            stats["rechunked"] += 1
+            job = pending.popleft()
+            records = job.result() if pool else chunk_file(*job)
+            submit_next()
+            write_chunks(records, cached)
+            print(f" {filename}: split in {len(records)} chunks")
+
+        file_entry = {"sha256": sha256, "chunks": {}}
+        for record in records:
+            file_entry["chunks"][record["id"]] = [record["chunk_index"], record["total_chunks_in_file"]]
+            yield record
+        if file_entry["chunks"]:
+            new_manifest["files"][filename] = file_entry
+
+
+def write_chunks(records, output_file):
+    """Écrit les chunks en JSON Lines au fil de l'eau ; retourne (nombre, caractères)."""
+    count = 0
+    total_chars = 0
+    tmp_file = output_file + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False))
+            f.write('\n')
+            count += 1
+            total_chars += len(record['text'])
+    os.replace(tmp_file, output_file)
+    return count, total_chars
+
+
+def iter_chunks(chunks_file):
+    """Relit un fichier de chunks JSON Lines, un chunk à la fois."""
+    with open(chunks_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def list_input_files(input_dirs):
+    """(chemin, nom) des .txt des dossiers d'entrée, triés par nom ; un nom en double est ignoré."""
+    files = {}
+    for input_dir in input_dirs:
+        if not os.path.isdir(input_dir):
+            continue
+        for filename in os.listdir(input_dir):
+            if not filename.endswith(".txt"):
+                continue
+            if filename in files:
+                print(f" skipping {os.path.join(input_dir, filename)}: {filename} already in {files[filename]}")
+                continue
+            files[filename] = os.path.join(input_dir, filename)
+    return [(files[filename], filename) for filename in sorted(files)]
+
+
+def run(input_dirs=INPUT_DIRS, output_file=OUTPUT_CHUNKS_FILE, workers=MAX_WORKERS, config=None):
+    """Découpe tous les fichiers d'input_dirs ; retourne les compteurs, ou None si rien à découper.
+
+    config vient de chunker_config() (par défaut : CHUNK_MODE et les constantes du module).
+    """
+    if not any(os.path.isdir(input_dir) for input_dir in input_dirs):
+        print(f"no input folder found")
+        return None
+
+    files = list_input_files(input_dirs)
+    if not files:
+        print("no file found")
+        return None
+
+    old_manifest = load_manifest()
+    new_manifest = {"config": config or chunker_config(), "files": {}}
+    stats = {"unchanged": 0, "rechunked": 0}
 
-        chunks = text_splitter.split_text(file_content)
-        num_chunks = len(chunks)
-        print(f" split in {num_chunks} chunks")
+    start_time = time.time()
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            records = iter_chunk_records(files, old_manifest, new_manifest, stats, pool, workers)
+            count, total_chars = write_chunks(records, output_file)
+    else:
+        count, total_chars = write_chunks(iter_chunk_records(files, old_manifest, new_manifest, stats), output_file)
+    elapsed = time.time() - start_time
 
-        for j, chunk in enumerate(chunks):
-            chunk_id = f"{filename}_{i+1}_{j+1}"
-            all_chunks.append({
-                "id": chunk_id,
-                "source": filename,
-                "text": chunk,
-                "chunk_index": j,
-                "total_chunks_in_file": num_chunks
-            })
+    save_json(CHUNK_MANIFEST_FILE, new_manifest)
+    stats["deleted"] = len(set(old_manifest["files"]) - set(new_manifest["files"]))
+    stats["chunks"] = count
 
-    with open(OUTPUT_CHUNKS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(all_chunks, f, indent=2, ensure_ascii=False)
+    avg_chunk_size = total_chars / count if count else 0
+    mode = new_manifest["config"].get("mode", "chars")
+    if mode == "tokens":
+        mode = f"tokens: <= {new_manifest['config']['tokens_per_chunk']} {new_manifest['config']['tokenizer']} tokens"
+    print(f"{count} chunks written to {output_file} (avg {avg_chunk_size:.0f} chars, {mode})")
+    print(f"{stats['rechunked']} file(s) chunked, {stats['unchanged']} unchanged, {stats['deleted']} removed, "
+          f"{workers} worker(s), {elapsed:.1f}s ({count / elapsed if elapsed else 0:.0f} chunks/sec)")
+    return stats
 
-    total_chars = sum(len(chunk['text']) for chunk in all_chunks)
-    avg_chunk_size = total_chars / len(all_chunks) if all_chunks else 0
 
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Split the scraped / extracted .txt files into chunks.")
+    parser.add_argument("input_dirs", nargs="*", default=INPUT_DIRS, help="folders of .txt files")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS, help="chunking processes (1 = serial)")
+    parser.add_argument("--output", default=OUTPUT_CHUNKS_FILE, help="JSON Lines output file")
+    parser.add_argument("--mode", choices=["chars", "tokens"], default=CHUNK_MODE,
+                        help="chunk length in characters or in tokens (whole sentences)")
+    parser.add_argument("--tokenizer", choices=["embedding", "llm"], default=TOKENIZER,
+                        help="tokenizer measuring the chunks in tokens mode")
+    parser.add_argument("--tokens-per-chunk", type=int, default=TOKENS_PER_CHUNK,
+                        help=f"token budget per chunk (default: {TOKENS_PER_CHUNK}, the embedding model's limit)")
+    parser.add_argument("--token-overlap", type=int, default=TOKEN_OVERLAP,
+                        help="max tokens of trailing sentences repeated in the next chunk")
+    args = parser.parse_args(argv)
+    config = chunker_config(args.mode, args.tokenizer, args.tokens_per_chunk, args.token_overlap)
+    run(args.input_dirs, args.output, max(1, args.workers), config)
 
 
-except FileNotFoundError:
-    print(f"no input folder found")
+if __name__ == "__main__":
+    main()
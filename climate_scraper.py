@@ -1,12 +1,18 @@
 #!/usr/bin/env python3
+import asyncio
 import fitz
+import aiohttp
 import requests
 from bs4 import BeautifulSoup
 import time
 import os
 import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
 from urllib.parse import urlparse
 import logging
+from raw_store import RawStore
+from text_cleaning import clean_rag_text, keep_long_lines
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -15,6 +21,13 @@ USER_AGENT = "ClimateFactChecker/1.0 (Educational research; contact: bennostal@g
 DELAY_BETWEEN_REQUESTS = 3
 OUTPUT_DIR = "climate_facts_content"
 
+# Async fetch engine: hosts are fetched in parallel, each one stays polite
+REQUESTS_PER_SECOND_PER_HOST = 1 / DELAY_BETWEEN_REQUESTS
+BURST_PER_HOST = 1
+MAX_CONNECTIONS_PER_HOST = 2
+REQUEST_TIMEOUT = 30
+PARSE_WORKERS = os.cpu_count() or 1
+
 CLIMATE_SOURCES = {
     "IPCC_AR6_WG1": {
         "name": "IPCC AR6 Working Group I",
@@ -42,32 +55,6 @@ CLIMATE_SOURCES = {
 
 
 
-def clean_rag_text(text):
-    patterns_to_remove = [
-        (r'^(Figure|Table|Box|FAQ|Cross-Chapter Box|Cross-Working Group Box)[\s\d.A-Za-z,|:]+.*$', ''),
-        (r'\{[^{}]+\}', ''),
-        (
-        r'^(Open section|Downloads|Authors|Figures|How to cite|Expand all sections|View|Open figure|Copy|doi|Share on .*|Share via .*|Read more|Explore more)$',
-        ''),
-        (
-        r'^(Coordinatin g Lead Authors:|Lead Authors:|Contri buting Authors:|Review Editors:|Chapter Scientists:|Contributing Authors:).*$',
-        ''),
-        (r'^This chapter should be cited as:.*$', ''),
-        (r'^\d+\s+.{,100}$', ''),
-        (r'^(Executive Summary|Technical Summary|Summary for Policymakers|Frequently Asked Questions)$', ''),
-        (r'Copyright National Academy of Sciences\. All rights reserved\.', ''),
-        (r'EVIDENCE & CAUSES 2020', ''),
-        (r'CLIMATE CHANGE', ''),
-    ]
-
-    for pattern, replacement in patterns_to_remove:
-        text = re.sub(pattern, replacement, text, flags=re.MULTILINE | re.IGNORECASE)
-
-    text = re.sub(r'\n{2,}', '\n', text)
-
-    return text.strip()
-
-
 def create_output_directory():
     if not os.path.exists(OUTPUT_DIR):
         os.makedirs(OUTPUT_DIR)
@@ -94,83 +81,139 @@ def extract_text_from_web(soup):
         body = soup.find('body')
         text = body.get_text(separator='\n', strip=True) if body else soup.get_text(separator='\n', strip=True)
 
-    cleaned_text = clean_rag_text(text)
+    return keep_long_lines(clean_rag_text(text))
 
-    final_lines = []
-    for line in cleaned_text.split('\n'):
-        stripped_line = line.strip()
-        if stripped_line and len(stripped_line) > 25:
-            final_lines.append(stripped_line)
 
-    return '\n'.join(final_lines)
+def scrape_pdf_file(filepath, source_name):
+    """Nettoie et écrit le PDF page par page : la mémoire ne dépend pas de sa taille."""
+    filename = clean_filename(f"{source_name}") + '.txt'
+    output_filepath = os.path.join(OUTPUT_DIR, filename)
+    tmp_filepath = output_filepath + '.tmp'
 
+    content_length = 0
+    with fitz.open(filepath) as doc, open(tmp_filepath, 'w', encoding='utf-8') as f:
+        f.write(f"Source: {source_name}\n")
+        f.write(f"PDF: {filepath}\n")
+        for page in doc:
+            content = keep_long_lines(clean_rag_text(page.get_text("text")))
+            if not content:
+                continue
+            if content_length:
+                f.write('\n')
+                content_length += 1
+            f.write(content)
+            content_length += len(content)
 
-def scrape_pdf_file(filepath, source_name):
+    if content_length < 100:
+        os.remove(tmp_filepath)
+        return False
+
+    os.replace(tmp_filepath, output_filepath)
+    return True
 
-    doc = fitz.open(filepath)
-    full_text = ""
-    for page_num in range(len(doc)):
-        page = doc.load_page(page_num)
-        full_text += page.get_text("text")
 
-    content = clean_rag_text(full_text)
 
-    final_lines = []
-    for line in content.split('\n'):
-        stripped_line = line.strip()
-        if stripped_line and len(stripped_line) > 25:
-            final_lines.append(stripped_line)
-    content = '\n'.join(final_lines)
+def parse_web_page(html, url):
+    """Parse une page HTML et retourne (title, content). Exécuté dans le process pool."""
+    soup = BeautifulSoup(html, 'html.parser')
 
+    title = soup.find('title')
+    if title:
+        title = title.get_text().strip()
+    else:
+        title = urlparse(url).path.split('/')[-1]
+
+    return title, extract_text_from_web(soup)
+
+
+def save_web_content(url, source_name, title, content):
     if len(content) < 100:
+        logger.warning(f"Contenu trop court pour {url}")
         return False
 
-    filename = clean_filename(f"{source_name}") + '.txt'
-    output_filepath = os.path.join(OUTPUT_DIR, filename)
+    filename = clean_filename(f"{source_name}_{title}") + '.txt'
+    filepath = os.path.join(OUTPUT_DIR, filename)
 
-    with open(output_filepath, 'w', encoding='utf-8') as f:
+    with open(filepath, 'w', encoding='utf-8') as f:
         f.write(f"Source: {source_name}\n")
-        f.write(f"PDF: {filepath}\n")
+        f.write(f"URL: {url}\n")
+        f.write(f" title: {title}\n")
         f.write(content)
-    return True
 
+    logger.info(f"saved {filepath} ")
+    return True
 
 
-def scrape_url(url, source_name):
+def scrape_url(url, source_name, store=None):
     logger.info(f"Scraping: {url}")
     
     try:
-        headers = {'User-Agent': USER_AGENT}
-        response = requests.get(url, headers=headers, timeout=30)
-        response.raise_for_status()
+        store = store or RawStore()
+        headers = {'User-Agent': USER_AGENT, **store.conditional_headers(url)}
+        response = requests.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+        if response.status_code == 304:
+            store.touch(url)
+            html = store.read(url)
+        else:
+            response.raise_for_status()
+            html = response.content
+            store.put(url, html, response.headers)
 
-        soup = BeautifulSoup(response.content, 'html.parser')
+        title, content = parse_web_page(html, url)
+        return save_web_content(url, source_name, title, content)
 
-        title = soup.find('title')
-        if title:
-            title = title.get_text().strip()
-        else:
-            title = urlparse(url).path.split('/')[-1]
+    except requests.RequestException as e:
+        logger.error(f"network error{url}: {e}")
+        return False
+    except Exception as e:
+        logger.error(f"error of scrap {url}: {e}")
+        return False
 
-        content = extract_text_from_web(soup)
 
-        if len(content) < 100:
-            logger.warning(f"Contenu trop court pour {url}")
-            return False
+class TokenBucket:
+    """Per-host politeness limit: `rate` requests/second with bursts of `capacity`."""
 
-        filename = clean_filename(f"{source_name}_{title}") + '.txt'
-        filepath = os.path.join(OUTPUT_DIR, filename)
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
 
-        with open(filepath, 'w', encoding='utf-8') as f:
-            f.write(f"Source: {source_name}\n")
-            f.write(f"URL: {url}\n")
-            f.write(f" title: {title}\n")
-            f.write(content)
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
 
-        logger.info(f"saved {filepath} ")
-        return True
 
-    except requests.RequestException as e:
+async def fetch_and_parse(session, buckets, pool, store, url, source_name):
+    logger.info(f"Scraping: {url}")
+    host = urlparse(url).netloc
+    bucket = buckets.setdefault(host, TokenBucket(REQUESTS_PER_SECOND_PER_HOST, BURST_PER_HOST))
+
+    try:
+        await bucket.acquire()
+        async with session.get(url, headers=store.conditional_headers(url)) as response:
+            if response.status == 304:
+                logger.info(f"not modified: {url}")
+                store.touch(url)
+                html = store.read(url)
+            else:
+                response.raise_for_status()
+                html = await response.read()
+                store.put(url, html, response.headers)
+
+        loop = asyncio.get_running_loop()
+        title, content = await loop.run_in_executor(pool, parse_web_page, html, url)
+        return save_web_content(url, source_name, title, content)
+
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
         logger.error(f"network error{url}: {e}")
         return False
     except Exception as e:
@@ -178,27 +221,74 @@ def scrape_url(url, source_name):
         return False
 
 
+async def scrape_all(sources, store):
+    """Fetch every source concurrently: one pooled connector, one token bucket per host,
+    conditional requests against the raw store, HTML parsing and cleaning offloaded
+    to a process pool."""
+    connector = aiohttp.TCPConnector(limit_per_host=MAX_CONNECTIONS_PER_HOST)
+    timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+    headers = {'User-Agent': USER_AGENT}
+    buckets = {}
+    loop = asyncio.get_running_loop()
+
+    with ProcessPoolExecutor(max_workers=PARSE_WORKERS) as pool:
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout, headers=headers) as session:
+            tasks = []
+            for source_key, source_data in sources.items():
+                if 'urls' in source_data:
+                    for url in source_data['urls']:
+                        tasks.append(fetch_and_parse(session, buckets, pool, store, url, source_key))
+                elif 'filepath' in source_data:
+                    logger.info(f"File: {source_data['filepath']}")
+                    tasks.append(loop.run_in_executor(pool, scrape_pdf_file, source_data['filepath'], source_key))
+
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+
+    for result in results:
+        if isinstance(result, Exception):
+            logger.error(f"error of scrap: {result}")
+    return sum(1 for result in results if result is True), len(results)
+
+
+def rebuild_from_store(sources, store):
+    """Re-run parsing and cleaning on the stored raw pages, without network."""
+    jobs = []
+    with ProcessPoolExecutor(max_workers=PARSE_WORKERS) as pool:
+        for source_key, source_data in sources.items():
+            if 'urls' in source_data:
+                for url in source_data['urls']:
+                    html = store.read(url)
+                    if html is None:
+                        logger.warning(f"not in raw store: {url}")
+                        continue
+                    jobs.append((url, source_key, pool.submit(parse_web_page, html, url)))
+            elif 'filepath' in source_data:
+                jobs.append((source_data['filepath'], source_key,
+                             pool.submit(scrape_pdf_file, source_data['filepath'], source_key)))
+
+        successful = 0
+        for origin, source_key, future in jobs:
+            try:
+                result = future.result()
+                if isinstance(result, tuple):
+                    result = save_web_content(origin, source_key, *result)
+                successful += result is True
+            except Exception as e:
+                logger.error(f"error of scrap {origin}: {e}")
+    return successful, len(jobs)
+
+
 def main():
     
     create_output_directory()
 
-    successful_scrapes = 0
-    total_sources = 0
-
-    for source_key, source_data in CLIMATE_SOURCES.items():
-        if 'urls' in source_data:
-            for url in source_data['urls']:
-                total_sources += 1
-                logger.info(f"[{total_sources}] URL: {url}")
-                if scrape_url(url, source_key):
-                    successful_scrapes += 1
-                time.sleep(DELAY_BETWEEN_REQUESTS)
-
-        elif 'filepath' in source_data:
-            total_sources += 1
-            logger.info(f"[{total_sources}] File: {source_data['filepath']}")
-            if scrape_pdf_file(source_data['filepath'], source_key):
-                successful_scrapes += 1
+    store = RawStore()
+    start_time = time.time()
+    if '--offline' in sys.argv:
+        successful_scrapes, total_sources = rebuild_from_store(CLIMATE_SOURCES, store)
+    else:
+        successful_scrapes, total_sources = asyncio.run(scrape_all(CLIMATE_SOURCES, store))
+    logger.info(f"{successful_scrapes}/{total_sources} sources scraped in {time.time() - start_time:.1f}s")
 
 
 
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Élimination des chunks quasi dupliqués entre chunking.py et embeddings_simple.py.
+
+Les chapitres web de l'IPCC et les PDF SPM répètent les mêmes phrases clés :
+chaque chunk est réduit à ses shingles de mots, signé par MinHash, et les
+signatures sont indexées par LSH (bandes). Un chunk dont un candidat déjà
+conservé a une similarité de Jaccard >= JACCARD_THRESHOLD est fusionné avec
+lui : seul le premier (ordre du fichier de chunks) est gardé, avec la liste
+de toutes les sources qu'il représente.
+
+    python dedupe.py [--input climate_chunks_data.jsonl] [--output climate_chunks_dedup.jsonl]
+"""
+
+import argparse
+import hashlib
+import re
+import time
+
+import numpy as np
+
+from chunking import OUTPUT_CHUNKS_FILE, iter_chunks, save_json, write_chunks
+
+try:
+    import mmh3
+except ImportError:  # hashlib prend le relais, plus lent
+    mmh3 = None
+
+OUTPUT_DEDUP_FILE = "climate_chunks_dedup.jsonl"
+DUPLICATES_FILE = "climate_chunks_duplicates.json"  # id supprimé -> id conservé
+
+SHINGLE_SIZE = 5          # Mots par shingle
+NUM_PERM = 128            # Fonctions de hachage MinHash
+BANDS = 16                # 16 bandes x 8 lignes : candidats à partir de ~0.7 de Jaccard
+ROWS = NUM_PERM // BANDS
+JACCARD_THRESHOLD = 0.8   # Vérifié sur les shingles avant de fusionner
+SEED = 42
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_rng = np.random.RandomState(SEED)
+# Permutations (a * x + b) % p : a et b sur 61 bits, le produit déborde modulo 2^64
+# (voulu, comme datasketch) ; avec un petit a, l'ordre des x serait le même pour tous
+_PERM_A = _rng.randint(1, (1 << 61) - 1, size=NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.randint(0, (1 << 61) - 1, size=NUM_PERM, dtype=np.uint64)
+
+_WORD = re.compile(r'\w+')
+
+
+def hash32(text):
+    if mmh3 is not None:
+        return mmh3.hash(text, signed=False)
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=4).digest(), 'little')
+
+
+def shingles(text, size=SHINGLE_SIZE):
+    """Hachés 32 bits des n-grammes de mots (minuscules) ; un texte trop court donne un seul shingle."""
+    words = _WORD.findall(text.lower())
+    if len(words) <= size:
+        return {hash32(' '.join(words))}
+    return {hash32(' '.join(words[i:i + size])) for i in range(len(words) - size + 1)}
+
+
+def minhash(shingle_set):
+    hashes = np.fromiter(shingle_set, dtype=np.uint64, count=len(shingle_set))
+    with np.errstate(over='ignore'):
+        return (((np.outer(hashes, _PERM_A) + _PERM_B) % _MERSENNE_PRIME) & _MAX_HASH).min(axis=0)
+
+
+def band_keys(signature):
+    return [(band, signature[band * ROWS:(band + 1) * ROWS].tobytes()) for band in range(BANDS)]
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def find_duplicates(chunks, threshold=JACCARD_THRESHOLD):
+    """Premier passage : {id du doublon: id du chunk conservé}.
+
+    Seuls les chunks conservés sont indexés : chaque chunk est comparé aux
+    représentants qu'il partage dans au moins une bande.
+    """
+    buckets = {}
+    kept_shingles = {}
+    duplicates = {}
+    for chunk in chunks:
+        shingle_set = shingles(chunk['text'])
+        keys = band_keys(minhash(shingle_set))
+        candidates = []
+        for key in keys:
+            for candidate in buckets.get(key, ()):
+                if candidate not in candidates:
+                    candidates.append(candidate)
+        match = next((candidate for candidate in candidates
+                      if jaccard(shingle_set, kept_shingles[candidate]) >= threshold), None)
+        if match is not None:
+            duplicates[chunk['id']] = match
+            continue
+        kept_shingles[chunk['id']] = shingle_set
+        for key in keys:
+            buckets.setdefault(key, []).append(chunk['id'])
+    return duplicates
+
+
+def iter_deduplicated(chunks, duplicates, duplicate_sources):
+    """Second passage : chunks conservés, avec la liste de toutes leurs sources."""
+    for chunk in chunks:
+        if chunk['id'] in duplicates:
+            continue
+        sources = [chunk['source']]
+        for source in duplicate_sources.get(chunk['id'], ()):
+            if source not in sources:
+                sources.append(source)
+        chunk['sources'] = sources
+        yield chunk
+
+
+def run(input_file=OUTPUT_CHUNKS_FILE, output_file=OUTPUT_DEDUP_FILE, threshold=JACCARD_THRESHOLD):
+    start_time = time.time()
+    duplicates = find_duplicates(iter_chunks(input_file), threshold)
+
+    duplicate_sources = {}
+    for chunk in iter_chunks(input_file):
+        if chunk['id'] in duplicates:
+            duplicate_sources.setdefault(duplicates[chunk['id']], []).append(chunk['source'])
+
+    count, _ = write_chunks(iter_deduplicated(iter_chunks(input_file), duplicates, duplicate_sources), output_file)
+    save_json(DUPLICATES_FILE, duplicates)
+    elapsed = time.time() - start_time
+
+    total = count + len(duplicates)
+    print(f"{total} chunks -> {count} kept, {len(duplicates)} near-duplicate(s) merged "
+          f"({len(duplicates) / total if total else 0:.1%}), Jaccard >= {threshold}, {elapsed:.1f}s")
+    print(f"written to {output_file}, mapping in {DUPLICATES_FILE}")
+    return duplicates
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Merge near-duplicate chunks (MinHash LSH) before embedding.")
+    parser.add_argument("--input", default=OUTPUT_CHUNKS_FILE, help="JSON Lines chunks from chunking.py")
+    parser.add_argument("--output", default=OUTPUT_DEDUP_FILE, help="deduplicated JSON Lines output")
+    parser.add_argument("--threshold", type=float, default=JACCARD_THRESHOLD,
+                        help="minimum shingle Jaccard similarity to merge two chunks")
+    args = parser.parse_args(argv)
+    run(args.input, args.output, args.threshold)
+
+
+if __name__ == "__main__":
+    main()
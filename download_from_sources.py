@@ -10,22 +10,45 @@ from pathlib import Path
 import time
 from urllib.parse import urlparse
 import hashlib
+import json
+import re
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+from raw_store import RawStore, sha256_file
 
 # Configuration
 SOURCES_FILE = "sources.txt"
 OUTPUT_DIR = "climate_pdfs_quality"
-DELAY_BETWEEN_DOWNLOADS = 2  # Respectueux
+MANIFEST_FILE = os.path.join(OUTPUT_DIR, "manifest.json")
+DELAY_BETWEEN_DOWNLOADS = 2  # Respectueux : écart minimal entre deux départs
 MAX_RETRIES = 3
+MAX_WORKERS = 4  # Téléchargements en parallèle
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+_manifest_lock = threading.Lock()
+_pace_lock = threading.Lock()
+_last_start = 0.0
 
 def read_sources_file():
-    """Lit le fichier sources.txt et retourne la liste des URLs."""
+    """Lit le fichier sources.txt et retourne {URL: SHA-256 attendu ou None}.
+
+    Une ligne peut épingler le contenu attendu : `URL sha256=<hex>`.
+    """
     try:
         with open(SOURCES_FILE, 'r', encoding='utf-8') as f:
-            urls = [line.strip() for line in f if line.strip() and not line.startswith('#')]
-        return [url for url in urls if url.startswith('http')]
+            lines = [line.split() for line in f if line.strip() and not line.startswith('#')]
     except FileNotFoundError:
         print(f"❌ Fichier {SOURCES_FILE} non trouvé")
-        return []
+        return {}
+    sources = {}
+    for fields in lines:
+        if not fields[0].startswith('http'):
+            continue
+        pins = [field[len('sha256='):].lower() for field in fields[1:] if field.startswith('sha256=')]
+        sources[fields[0]] = pins[0] if pins else None
+    return sources
 
 def get_filename_from_url(url):
     """Génère un nom de fichier approprié depuis l'URL."""
@@ -44,47 +67,182 @@ def get_filename_from_url(url):
     
     return filename
 
-def download_pdf(url, max_retries=MAX_RETRIES):
-    """Télécharge un PDF avec gestion des erreurs et des tentatives."""
+def load_manifest():
+    if os.path.exists(MANIFEST_FILE):
+        with open(MANIFEST_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {}
+
+def update_manifest(filename, entry):
+    """Enregistre taille + SHA-256 d'un fichier vérifié (écriture atomique, thread-safe)."""
+    with _manifest_lock:
+        manifest = load_manifest()
+        manifest[filename] = entry
+        tmp_path = MANIFEST_FILE + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, MANIFEST_FILE)
+
+def verify_file(filepath, entry, expected_sha256=None):
+    """Vérifie un fichier local contre son entrée de manifeste (taille puis SHA-256)."""
+    if not entry or not os.path.exists(filepath):
+        return False
+    if expected_sha256 and entry['sha256'] != expected_sha256:
+        return False
+    if os.path.getsize(filepath) != entry['size']:
+        return False
+    return sha256_file(filepath) == entry['sha256']
+
+def wait_turn():
+    """Espace les départs de téléchargements d'au moins DELAY_BETWEEN_DOWNLOADS secondes."""
+    global _last_start
+    with _pace_lock:
+        delay = _last_start + DELAY_BETWEEN_DOWNLOADS - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        _last_start = time.monotonic()
+
+def read_part_state(part_path):
+    try:
+        with open(part_path + '.json', 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def write_part_state(part_path, state):
+    with open(part_path + '.json', 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+
+def discard_part(part_path):
+    for path in (part_path, part_path + '.json'):
+        if os.path.exists(path):
+            os.remove(path)
+
+def fetch_to_part(url, headers, part_path):
+    """Télécharge url dans part_path en reprenant là où un essai précédent s'est arrêté.
+
+    Retourne (response_headers, taille_totale), ou (None, None) sur un 304.
+    Un 200 en réponse à un Range (If-Range non satisfait, serveur sans Range)
+    réécrit le .part depuis zéro : rien n'est ajouté à l'ancien contenu.
+    """
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    part_state = read_part_state(part_path)
+    request_headers = dict(headers)
+    if offset and part_state:
+        # If-Range : le serveur renvoie tout (200) si le fichier a changé entre temps
+        validator = part_state.get('etag') or part_state.get('last_modified')
+        request_headers['Range'] = f"bytes={offset}-"
+        if validator:
+            request_headers['If-Range'] = validator
+        for key in ('If-None-Match', 'If-Modified-Since'):
+            request_headers.pop(key, None)
+    else:
+        offset = 0
+
+    with requests.get(url, headers=request_headers, timeout=60, stream=True) as response:
+        if response.status_code == 304:
+            return None, None
+        if response.status_code == 416:
+            discard_part(part_path)
+            raise requests.exceptions.RequestException("plage invalide, reprise depuis le début")
+        response.raise_for_status()
+
+        if response.status_code == 206:
+            match = re.match(r'bytes (\d+)-\d+/(\d+|\*)', response.headers.get('Content-Range', ''))
+            if not match or int(match.group(1)) != offset:
+                discard_part(part_path)
+                raise requests.exceptions.RequestException("Content-Range inattendu, reprise depuis le début")
+            total = int(match.group(2)) if match.group(2) != '*' else None
+            mode = 'ab'
+            print(f"        ↪️  Reprise à {offset / (1024 * 1024):.1f} MB")
+        else:
+            offset = 0
+            length = response.headers.get('Content-Length')
+            total = int(length) if length is not None else None
+            mode = 'wb'
+            write_part_state(part_path, {
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+            })
+
+        # Vérifier le type de contenu
+        content_type = response.headers.get('content-type', '').lower()
+        if 'pdf' not in content_type and 'application/octet-stream' not in content_type:
+            print(f"        ⚠️  Type de contenu inattendu: {content_type}")
+
+        with open(part_path, mode) as f:
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                f.write(chunk)
+
+        return response.headers, total
+
+def download_pdf(url, max_retries=MAX_RETRIES, store=None, expected_sha256=None):
+    """Télécharge un PDF avec gestion des erreurs et des tentatives.
+
+    Le fichier est écrit dans un .part, repris par HTTP Range après un échec,
+    vérifié (taille annoncée, et SHA-256 attendu s'il est connu) puis renommé
+    atomiquement. Un .part dont l'empreinte ne correspond pas est supprimé.
+    Le fetch est conditionnel : un PDF inchangé et vérifié coûte un 304.
+    """
+    store = store or RawStore()
     filename = get_filename_from_url(url)
     filepath = os.path.join(OUTPUT_DIR, filename)
+    part_path = filepath + '.part'
     
-    # Vérifier si déjà téléchargé
-    if os.path.exists(filepath):
-        size_mb = os.path.getsize(filepath) / (1024 * 1024)
-        print(f"    ⏭️  Déjà téléchargé: {filename} ({size_mb:.1f} MB)")
-        return True, filename, size_mb
+    headers = {
+        'User-Agent': 'Mozilla/5.0 (Linux; Climate Research) AppleWebKit/537.36'
+    }
+    entry = load_manifest().get(filename)
+    if entry is None and os.path.exists(filepath):
+        # Fichier antérieur au manifeste : fiable seulement s'il correspond au raw store
+        stored = store.entry(url)
+        if stored and os.path.getsize(filepath) == stored['size'] and sha256_file(filepath) == stored['sha256']:
+            entry = {'url': url, 'size': stored['size'], 'sha256': stored['sha256']}
+            update_manifest(filename, entry)
     
-    print(f"    📥 Téléchargement: {filename}")
+    if verify_file(filepath, entry, expected_sha256):
+        conditional = store.conditional_headers(url)
+        if not conditional:
+            conditional = {'If-Modified-Since': formatdate(os.path.getmtime(filepath), usegmt=True)}
+        headers.update(conditional)
+        print(f"    🔄 Vérification: {filename}")
+    else:
+        if os.path.exists(filepath):
+            print(f"    ⚠️  Fichier incomplet ou modifié, nouveau téléchargement: {filename}")
+        print(f"    📥 Téléchargement: {filename}")
     print(f"        URL: {url}")
     
+    wait_turn()
     for attempt in range(max_retries):
         try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Linux; Climate Research) AppleWebKit/537.36'
-            }
-            
-            response = requests.get(url, headers=headers, timeout=60, stream=True)
-            response.raise_for_status()
-            
-            # Vérifier le type de contenu
-            content_type = response.headers.get('content-type', '').lower()
-            if 'pdf' not in content_type and 'application/octet-stream' not in content_type:
-                print(f"        ⚠️  Type de contenu inattendu: {content_type}")
-            
-            # Télécharger
-            with open(filepath, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
+            response_headers, total = fetch_to_part(url, headers, part_path)
+            if response_headers is None:
+                size_mb = os.path.getsize(filepath) / (1024 * 1024)
+                if store.entry(url):
+                    store.touch(url)
+                print(f"    ⏭️  Inchangé: {filename} ({size_mb:.1f} MB)")
+                return True, filename, size_mb
             
             # Vérifier la taille
-            size_mb = os.path.getsize(filepath) / (1024 * 1024)
+            size = os.path.getsize(part_path)
+            if total is not None and size != total:
+                raise requests.exceptions.RequestException(f"téléchargement incomplet ({size}/{total} octets)")
+            size_mb = size / (1024 * 1024)
             if size_mb < 0.1:  # Moins de 100KB = probablement une erreur
                 print(f"        ⚠️  Fichier très petit ({size_mb:.1f} MB), possible erreur")
-                os.remove(filepath)
+                discard_part(part_path)
                 return False, filename, 0
             
-            print(f"        ✅ Succès: {filename} ({size_mb:.1f} MB)")
+            sha256 = sha256_file(part_path)
+            if expected_sha256 and sha256 != expected_sha256:
+                discard_part(part_path)
+                raise requests.exceptions.RequestException(
+                    f"SHA-256 inattendu ({sha256[:12]} au lieu de {expected_sha256[:12]})")
+            os.replace(part_path, filepath)
+            discard_part(part_path)
+            store.put_file(url, filepath, response_headers, sha256=sha256)
+            update_manifest(filename, {'url': url, 'size': size, 'sha256': sha256})
+            print(f"        ✅ Succès: {filename} ({size_mb:.1f} MB, sha256 {sha256[:12]})")
             return True, filename, size_mb
             
         except requests.exceptions.RequestException as e:
@@ -96,6 +254,17 @@ def download_pdf(url, max_retries=MAX_RETRIES):
     print(f"        ❌ Échec définitif après {max_retries} tentatives")
     return False, filename, 0
 
+def restore_from_store(urls, store):
+    """Mode hors ligne : recrée OUTPUT_DIR depuis le raw store, sans réseau."""
+    restored = 0
+    for url in urls:
+        filename = get_filename_from_url(url)
+        if store.materialize(url, os.path.join(OUTPUT_DIR, filename)):
+            restored += 1
+        else:
+            print(f"    ⚠️  Absent du raw store: {url}")
+    print(f"✅ {restored}/{len(urls)} PDFs restaurés depuis {store.root}")
+
 def categorize_source(url, filename):
     """Catégorise le type de source basé sur l'URL."""
     url_lower = url.lower()
@@ -132,6 +301,11 @@ def main():
         print("❌ Aucune URL trouvée dans sources.txt")
         return
     
+    store = RawStore()
+    if '--offline' in sys.argv:
+        restore_from_store(urls, store)
+        return
+    
     print(f"📚 {len(urls)} sources à télécharger")
     print("-" * 60)
     
@@ -140,11 +314,10 @@ def main():
     total_size_mb = 0
     categories = {}
     
-    for i, url in enumerate(urls, 1):
-        print(f"\n[{i}/{len(urls)}] Traitement de la source")
-        
-        success, filename, size_mb = download_pdf(url)
-        
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        results = list(executor.map(lambda url: download_pdf(url, store=store, expected_sha256=urls[url]), urls))
+    
+    for url, (success, filename, size_mb) in zip(urls, results):
         if success:
             successful_downloads += 1
             total_size_mb += size_mb
@@ -152,10 +325,6 @@ def main():
             # Catégoriser
             category = categorize_source(url, filename)
             categories[category] = categories.get(category, 0) + 1
-        
-        # Pause entre téléchargements
-        if i < len(urls):
-            time.sleep(DELAY_BETWEEN_DOWNLOADS)
     
     # Résumé
     print("\n" + "="*60)
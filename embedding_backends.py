@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Backends d'embedding interchangeables : PyTorch (SentenceTransformer) ou ONNX Runtime.
+
+Le modèle est exporté une fois en ONNX (transformer seul, sans le pooling),
+avec une variante quantifiée int8 dynamique ; le backend ONNX tokenise avec
+tokenizers et fait le mean pooling en numpy, sans importer torch. Chaque
+backend donne un encodeur avec encode(textes), token_lengths(textes), dim et
+cache_name (nom du modèle + variante, pour la clé du cache d'embeddings).
+
+    python embedding_backends.py export           exporte model.onnx et model_int8.onnx
+    python embedding_backends.py parity           cosinus des backends ONNX contre torch
+    python embedding_backends.py bench            chargement, latence requête, chunks/s
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import time
+
+import numpy as np
+
+MODEL_NAME = 'paraphrase-multilingual-MiniLM-L12-v2'
+ONNX_DIR = "onnx_models"
+ONNX_OPSET = 14
+PARITY_TEXTS = 200          # Chunks comparés par le test de parité
+BENCH_QUERIES = 50          # Requêtes isolées mesurées une par une
+SAMPLE_CHUNKS_FILE = "climate_chunks_dedup.jsonl"
+FALLBACK_TEXTS = [
+    "Global surface temperature was 1.1°C higher in 2011-2020 than in 1850-1900.",
+    "Human activities, principally through emissions of greenhouse gases, have unequivocally caused global warming.",
+    "Sea level rise is accelerating and will continue for centuries.",
+    "Le réchauffement climatique est causé par les activités humaines.",
+]
+
+
+def onnx_model_dir(model_name=MODEL_NAME):
+    return os.path.join(ONNX_DIR, model_name.replace('/', '__'))
+
+
+class EmbeddingBackend:
+    name = None
+    modules = ()
+
+    def is_available(self, model_name=MODEL_NAME):
+        return all(importlib.util.find_spec(module) is not None for module in self.modules)
+
+    def load(self, model_name=MODEL_NAME, device=None, num_threads=None):
+        raise NotImplementedError
+
+
+class TorchEncoder:
+    def __init__(self, model_name, device, num_threads):
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        device = device or ('cuda' if torch.cuda.is_available() else 'cpu')
+        self.model = SentenceTransformer(model_name, device=device)
+        self.dim = self.model.get_sentence_embedding_dimension()
+        self.on_cpu = device == 'cpu'
+        self.cache_name = model_name  # Clé historique du cache : les vecteurs torch restent valides
+
+    def token_lengths(self, texts):
+        encoded = self.model.tokenizer(texts, truncation=True, max_length=self.model.max_seq_length)
+        return np.array([len(ids) for ids in encoded['input_ids']], dtype=np.int64)
+
+    def encode(self, texts, batch_size=32, normalize=False):
+        return np.asarray(self.model.encode(texts, batch_size=batch_size, convert_to_tensor=False,
+                                            normalize_embeddings=normalize, show_progress_bar=False),
+                          dtype=np.float32)
+
+
+class TorchBackend(EmbeddingBackend):
+    name = "torch"
+    modules = ("torch", "sentence_transformers")
+
+    def load(self, model_name=MODEL_NAME, device=None, num_threads=None):
+        return TorchEncoder(model_name, device, num_threads)
+
+
+class OnnxEncoder:
+    def __init__(self, model_name, model_file, variant, num_threads):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        model_dir = onnx_model_dir(model_name)
+        with open(os.path.join(model_dir, "config.json"), 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        self.max_seq_length = config["max_seq_length"]
+        self.dim = config["dim"]
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(self.max_seq_length)
+        self.tokenizer.no_padding()
+        self.pad_id = next((self.tokenizer.token_to_id(token) for token in ("<pad>", "[PAD]")
+                            if self.tokenizer.token_to_id(token) is not None), 0)
+
+        options = onnxruntime.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = onnxruntime.InferenceSession(os.path.join(model_dir, model_file), options,
+                                                    providers=["CPUExecutionProvider"])
+        self.input_names = {node.name for node in self.session.get_inputs()}
+        self.on_cpu = True
+        self.cache_name = f"{model_name}@{variant}"
+
+    def token_lengths(self, texts):
+        return np.array([len(encoding.ids) for encoding in self.tokenizer.encode_batch(texts)], dtype=np.int64)
+
+    def _encode_batch(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        longest = max(len(encoding.ids) for encoding in encodings)
+        input_ids = np.full((len(texts), longest), self.pad_id, dtype=np.int64)
+        attention_mask = np.zeros((len(texts), longest), dtype=np.int64)
+        for row, encoding in enumerate(encodings):
+            input_ids[row, :len(encoding.ids)] = encoding.ids
+            attention_mask[row, :len(encoding.ids)] = 1
+        feed = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feed["token_type_ids"] = np.zeros_like(input_ids)
+        hidden = self.session.run(["last_hidden_state"], feed)[0]
+        # Mean pooling de SentenceTransformer : moyenne des tokens non paddés
+        mask = attention_mask[:, :, None].astype(np.float32)
+        return (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+    def encode(self, texts, batch_size=32, normalize=False):
+        embeddings = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i in range(0, len(texts), batch_size):
+            embeddings[i:i + batch_size] = self._encode_batch(texts[i:i + batch_size])
+        if normalize:
+            embeddings /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return embeddings
+
+
+class OnnxBackend(EmbeddingBackend):
+    name = "onnx"
+    modules = ("onnxruntime", "tokenizers")
+    model_file = "model.onnx"
+
+    def is_available(self, model_name=MODEL_NAME):
+        return super().is_available() and os.path.exists(os.path.join(onnx_model_dir(model_name), self.model_file))
+
+    def load(self, model_name=MODEL_NAME, device=None, num_threads=None):
+        return OnnxEncoder(model_name, self.model_file, self.name, num_threads)
+
+
+class OnnxInt8Backend(OnnxBackend):
+    name = "onnx-int8"
+    model_file = "model_int8.onnx"
+
+
+BACKENDS = {backend.name: backend for backend in (TorchBackend(), OnnxBackend(), OnnxInt8Backend())}
+AUTO_ORDER = ["onnx", "torch"]  # "auto" : ONNX fp32 s'il est exporté (parité ~1.0), sinon torch
+
+
+def get_backend(name, model_name=MODEL_NAME):
+    if name == "auto":
+        for candidate in AUTO_ORDER:
+            if BACKENDS[candidate].is_available(model_name):
+                return BACKENDS[candidate]
+        raise ImportError("aucun backend d'embedding disponible (torch ou onnx exporté)")
+    try:
+        backend = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"backend d'embedding inconnu: {name} (choix: auto, {', '.join(BACKENDS)})")
+    if not backend.is_available(model_name):
+        raise ImportError(f"backend {name} indisponible : modules {', '.join(backend.modules)} "
+                          f"ou modèle exporté manquant (python embedding_backends.py export)")
+    return backend
+
+
+def load_encoder(name, model_name=MODEL_NAME, device=None, num_threads=None):
+    return get_backend(name, model_name).load(model_name, device, num_threads)
+
+
+def export_onnx(model_name=MODEL_NAME, quantize=True):
+    """Exporte le transformer du SentenceTransformer en ONNX (+ variante int8 dynamique)."""
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    model_dir = onnx_model_dir(model_name)
+    os.makedirs(model_dir, exist_ok=True)
+    sentence_model = SentenceTransformer(model_name, device='cpu')
+    transformer = sentence_model[0].auto_model.eval()
+    tokenizer = sentence_model.tokenizer
+    tokenizer.save_pretrained(model_dir)  # Écrit tokenizer.json (tokenizer rapide)
+
+    sample = tokenizer(FALLBACK_TEXTS[:2], padding=True, return_tensors='pt')
+    input_names = ["input_ids", "attention_mask"]
+    inputs = (sample["input_ids"], sample["attention_mask"])
+    if "token_type_ids" in sample and transformer.config.type_vocab_size > 1:
+        input_names.append("token_type_ids")
+        inputs += (sample["token_type_ids"],)
+    model_path = os.path.join(model_dir, OnnxBackend.model_file)
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer, inputs, model_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes={name: {0: "batch", 1: "sequence"} for name in input_names + ["last_hidden_state"]},
+            opset_version=ONNX_OPSET,
+        )
+    with open(os.path.join(model_dir, "config.json"), 'w', encoding='utf-8') as f:
+        json.dump({"model": model_name, "max_seq_length": sentence_model.max_seq_length,
+                   "dim": sentence_model.get_sentence_embedding_dimension()}, f, indent=2)
+    print(f"✅ {model_path}")
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantized_path = os.path.join(model_dir, OnnxInt8Backend.model_file)
+        quantize_dynamic(model_path, quantized_path, weight_type=QuantType.QInt8)
+        print(f"✅ {quantized_path}")
+
+
+def sample_texts(limit):
+    if not os.path.exists(SAMPLE_CHUNKS_FILE):
+        return FALLBACK_TEXTS
+    texts = []
+    with open(SAMPLE_CHUNKS_FILE, 'r', encoding='utf-8') as f:
+        for line in f:
+            texts.append(json.loads(line)['text'])
+            if len(texts) == limit:
+                break
+    return texts or FALLBACK_TEXTS
+
+
+def cosine_rows(a, b):
+    return (a * b).sum(axis=1) / np.clip(np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1), 1e-12, None)
+
+
+def parity(model_name=MODEL_NAME, limit=PARITY_TEXTS):
+    texts = sample_texts(limit)
+    reference = load_encoder("torch", model_name, device='cpu').encode(texts)
+    print(f"📏 Parité contre torch sur {len(texts)} textes")
+    for name in ("onnx", "onnx-int8"):
+        if not BACKENDS[name].is_available(model_name):
+            print(f"   {name:<10} indisponible")
+            continue
+        similarities = cosine_rows(reference, load_encoder(name, model_name).encode(texts))
+        print(f"   {name:<10} cosinus moyen {similarities.mean():.5f}, min {similarities.min():.5f}")
+
+
+def bench(model_name=MODEL_NAME, limit=PARITY_TEXTS):
+    texts = sample_texts(limit)
+    queries = (texts * BENCH_QUERIES)[:BENCH_QUERIES]
+    print(f"⏱️  {len(texts)} textes, {len(queries)} requêtes isolées")
+    for name, backend in BACKENDS.items():
+        if not backend.is_available(model_name):
+            print(f"   {name:<10} indisponible")
+            continue
+        start = time.perf_counter()
+        encoder = backend.load(model_name, device='cpu')
+        load_time = time.perf_counter() - start
+        encoder.encode(texts[:8])  # Échauffement
+        start = time.perf_counter()
+        encoder.encode(texts)
+        throughput = len(texts) / (time.perf_counter() - start)
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            encoder.encode([query])
+            latencies.append(time.perf_counter() - start)
+        print(f"   {name:<10} chargement {load_time:5.2f}s  {throughput:7.1f} chunks/s  "
+              f"requête p50 {np.percentile(latencies, 50) * 1000:6.1f} ms  p99 {np.percentile(latencies, 99) * 1000:6.1f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export, check and benchmark the embedding backends.")
+    parser.add_argument("command", choices=["export", "parity", "bench"])
+    parser.add_argument("--model", default=MODEL_NAME)
+    parser.add_argument("--no-quantize", action="store_true", help="export: skip the int8 variant")
+    parser.add_argument("--texts", type=int, default=PARITY_TEXTS, help="parity / bench: number of sample chunks")
+    args = parser.parse_args(argv)
+    if args.command == "export":
+        export_onnx(args.model, quantize=not args.no_quantize)
+    elif args.command == "parity":
+        parity(args.model, args.texts)
+    else:
+        bench(args.model, args.texts)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Cache persistant des embeddings (SQLite).
+
+Clé : (SHA-256 du texte, nom du modèle, normalisation) ; valeur : vecteur
+float32 brut en BLOB. Seuls les textes absents du cache sont encodés. Le cache
+sert à embeddings_simple.py (chunks) comme à llm.py (requêtes des articles).
+
+    python embedding_cache.py     statistiques du cache
+"""
+
+import hashlib
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+CACHE_FILE = "embedding_cache.sqlite"
+SQL_BATCH = 500  # Paramètres par requête IN (...), sous la limite de SQLite
+
+
+def text_sha256(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    """Embeddings d'un modèle donné ; hits / misses comptés par session et cumulés dans la base."""
+
+    def __init__(self, model_name, normalize=False, path=CACHE_FILE):
+        self.model_name = model_name
+        self.normalize = int(bool(normalize))
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")  # Lecteurs et écrivain concurrents
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS embeddings (
+            text_sha256 TEXT NOT NULL, model TEXT NOT NULL, normalize INTEGER NOT NULL,
+            dim INTEGER NOT NULL, vector BLOB NOT NULL, created_at REAL NOT NULL,
+            PRIMARY KEY (text_sha256, model, normalize))""")
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS stats (
+            model TEXT NOT NULL, normalize INTEGER NOT NULL,
+            hits INTEGER NOT NULL, misses INTEGER NOT NULL,
+            PRIMARY KEY (model, normalize))""")
+        self.connection.commit()
+
+    def get_many(self, keys):
+        """{clé: vecteur float32} des clés présentes dans le cache."""
+        found = {}
+        for i in range(0, len(keys), SQL_BATCH):
+            batch = keys[i:i + SQL_BATCH]
+            rows = self.connection.execute(
+                f"SELECT text_sha256, vector FROM embeddings WHERE model = ? AND normalize = ? "
+                f"AND text_sha256 IN ({','.join('?' * len(batch))})",
+                [self.model_name, self.normalize, *batch])
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def put_many(self, keys, vectors):
+        now = time.time()
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?, ?, ?)",
+            [(key, self.model_name, self.normalize, len(vector), np.asarray(vector, dtype=np.float32).tobytes(), now)
+             for key, vector in zip(keys, vectors)])
+        self.connection.commit()
+
+    def encode(self, texts, encode_function):
+        """Matrice (len(texts), dim) float32 ; encode_function(textes) n'est appelée que pour les absents.
+
+        Les textes identiques ne sont encodés qu'une fois.
+        """
+        keys = [text_sha256(text) for text in texts]
+        found = self.get_many(list(dict.fromkeys(keys)))
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+
+        if missing:
+            vectors = np.asarray(encode_function(list(missing.values())), dtype=np.float32)
+            self.put_many(list(missing), vectors)
+            found.update(zip(missing, vectors))
+
+        self.misses += len(missing)
+        self.hits += len(texts) - len(missing)
+        self._record_stats(len(texts) - len(missing), len(missing))
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack([found[key] for key in keys])
+
+    def _record_stats(self, hits, misses):
+        self.connection.execute(
+            "INSERT INTO stats VALUES (?, ?, ?, ?) ON CONFLICT (model, normalize) "
+            "DO UPDATE SET hits = hits + excluded.hits, misses = misses + excluded.misses",
+            (self.model_name, self.normalize, hits, misses))
+        self.connection.commit()
+
+    def summary(self):
+        total = self.hits + self.misses
+        return (f"embedding cache: {self.hits} hit(s), {self.misses} miss(es)"
+                f" ({self.hits / total if total else 0:.0%} hits)")
+
+    def close(self):
+        self.connection.close()
+
+
+def main():
+    if not os.path.exists(CACHE_FILE):
+        print(f"❌ Pas de cache: {CACHE_FILE}")
+        return
+    connection = sqlite3.connect(CACHE_FILE)
+    print(f"📦 {CACHE_FILE}: {os.path.getsize(CACHE_FILE) / (1024 * 1024):.1f} MB")
+    for model, normalize, count, dim in connection.execute(
+            "SELECT model, normalize, COUNT(*), MAX(dim) FROM embeddings GROUP BY model, normalize"):
+        row = connection.execute("SELECT hits, misses FROM stats WHERE model = ? AND normalize = ?",
+                                 (model, normalize)).fetchone() or (0, 0)
+        total = sum(row)
+        print(f"   {model} (normalize={bool(normalize)}): {count} vecteurs x {dim}, "
+              f"{row[0]} hits / {row[1]} misses ({row[0] / total if total else 0:.0%} hits)")
+    connection.close()
+
+
+if __name__ == "__main__":
+    main()
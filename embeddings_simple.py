@@ -1,72 +1,262 @@
 import os
 import json
-from sentence_transformers import SentenceTransformer
-import torch
+import argparse
+import shutil
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
 import time
+from artifacts import EMBEDDINGS_DIR, assemble_artifact
+from chunking import iter_chunks
+from embedding_backends import BACKENDS, get_backend, load_encoder
+from embedding_cache import EmbeddingCache
 
 
-INPUT_CHUNKS_FILE = "climate_chunks_data.json"
+INPUT_CHUNKS_FILE = "climate_chunks_dedup.jsonl"  # Sortie de dedupe.py
 MODEL_NAME = 'paraphrase-multilingual-MiniLM-L12-v2'
-OUTPUT_EMBEDDINGS_FILE = "climate_embeddings_data.json"
+OUTPUT_EMBEDDINGS_DIR = EMBEDDINGS_DIR  # Artefact mappable en mémoire (voir artifacts.py)
+EMBEDDING_DTYPE = "float32"  # "float16" avec --float16
+NORMALIZE_EMBEDDINGS = False  # Fait partie de la clé du cache d'embeddings
 
-def load_chunks_from_json(chunks_file):
-    with open(chunks_file, 'r', encoding='utf-8') as f:
-        chunks_data = json.load(f)
+# "torch" (SentenceTransformer), "onnx", "onnx-int8" ou "auto" (voir embedding_backends.py)
+EMBEDDING_BACKEND = "torch"
 
-    print(f"✅ {len(chunks_data)} chunks chargés avec succès")
-    return chunks_data
+# Lots triés par longueur : chaque lot est paddé à son plus long texte, on borne donc
+# le nombre de tokens paddés (taille du lot x plus long texte) plutôt que le nombre de textes
+TOKENS_PER_BATCH = 8192
+MAX_BATCH_SIZE = 256
 
-def create_embeddings(chunks_data, model):
+# Encodage en flux : les chunks sont lus par fenêtres de WINDOW_CHUNKS, triés par longueur
+# dans la fenêtre, et chaque fenêtre encodée est écrite dans un shard .npy avant la suivante.
+# progress.json note les shards terminés : un relancement reprend au premier shard manquant.
+WINDOW_CHUNKS = 2048
+SHARDS_DIR = OUTPUT_EMBEDDINGS_DIR + ".partial"
+PROGRESS_FILE = os.path.join(SHARDS_DIR, "progress.json")
+
+# Processus d'encodage (CPU) : chacun charge le modèle et prend cpu_count // workers threads
+ENCODE_WORKERS = 1
+
+def create_embeddings(chunks_data, model, cache=None):
     texts = [chunk['text'] for chunk in chunks_data]
-    batch_size = 32
-    all_embeddings = []
+    if cache is not None:
+        # Seuls les textes absents du cache passent par le modèle
+        return cache.encode(texts, lambda missing: encode_texts(missing, model))
+    return encode_texts(texts, model)
+
+
+def plan_batches(lengths, tokens_per_batch=TOKENS_PER_BATCH, max_batch_size=MAX_BATCH_SIZE):
+    """Indices des textes regroupés par longueur, du plus long au plus court.
+
+    Un lot grossit tant que taille x plus long texte tient dans tokens_per_batch :
+    les lots de textes courts sont plus gros.
+    """
+    order = np.argsort(-lengths, kind='stable')
+    batches = []
+    start = 0
+    while start < len(order):
+        longest = max(1, int(lengths[order[start]]))
+        size = max(1, min(max_batch_size, tokens_per_batch // longest))
+        batches.append(order[start:start + size])
+        start += size
+    return batches
+
+
+def encode_batch(model, batch_texts):
+    return model.encode(batch_texts, batch_size=len(batch_texts), normalize=NORMALIZE_EMBEDDINGS)
+
+
+_worker_model = None
+
+
+def init_encode_worker(backend_name, model_name, num_threads):
+    global _worker_model
+    _worker_model = load_encoder(backend_name, model_name, device='cpu', num_threads=num_threads)
+
+
+def encode_in_worker(batch_texts):
+    return encode_batch(_worker_model, batch_texts)
+
+
+def describe_worker_model():
+    return _worker_model.dim, _worker_model.cache_name
+
+
+def token_lengths_in_worker(texts):
+    return _worker_model.token_lengths(texts)
+
 
-    for i in range(0, len(texts), batch_size):
-        batch_texts = texts[i:i+batch_size]
-        batch_num = (i // batch_size) + 1
-        total_batches = (len(texts) + batch_size - 1) // batch_size
+class EncoderPool:
+    """Encodeur réparti sur des processus CPU créés une seule fois pour tout le run.
 
-        batch_embeddings = model.encode(
-            batch_texts,
-            convert_to_tensor=False,
-            show_progress_bar=False
-        )
+    Chaque processus charge le modèle une fois, à son démarrage ; le processus
+    principal ne le charge pas. dim, cache_name et token_lengths sont ceux d'un
+    encodeur chargé, demandés aux processus.
+    """
 
-        batch_embeddings_list = [emb.tolist() for emb in batch_embeddings]
-        all_embeddings.extend(batch_embeddings_list)
+    def __init__(self, backend_name, model_name, workers):
+        self.workers = workers
+        # spawn : un fork après chargement de torch peut bloquer sur ses threads OpenMP
+        num_threads = max(1, (os.cpu_count() or 1) // workers)
+        self.pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                        initializer=init_encode_worker,
+                                        initargs=(backend_name, model_name, num_threads))
+        self.dim, self.cache_name = self.pool.submit(describe_worker_model).result()
 
+    def token_lengths(self, texts):
+        step = max(1, -(-len(texts) // self.workers))
+        parts = self.pool.map(token_lengths_in_worker, [texts[i:i + step] for i in range(0, len(texts), step)])
+        return np.concatenate([np.zeros(0, dtype=np.int64), *parts])
+
+    def encode_batches(self, texts, batches):
+        """(indices, vecteurs) de chaque lot, dans l'ordre où les processus les terminent."""
+        futures = {self.pool.submit(encode_in_worker, [texts[i] for i in indices]): indices for indices in batches}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+    def close(self):
+        self.pool.shutdown()
+
+
+def uses_gpu(backend_name):
+    """Le backend torch encode sur GPU s'il y en a un : des processus CPU n'y gagneraient rien."""
+    if backend_name != "torch":
+        return False
+    import torch
+
+    return torch.cuda.is_available()
+
+
+def encode_texts(texts, model):
+    """Encode texts par lots triés par longueur ; la matrice résultat suit l'ordre de texts.
+
+    model est un encodeur chargé (load_encoder) ou un EncoderPool.
+    """
+    all_embeddings = np.zeros((len(texts), model.dim), dtype=np.float32)
+    if not texts:
+        return all_embeddings
+    batches = plan_batches(model.token_lengths(texts))
+
+    if isinstance(model, EncoderPool):
+        for indices, embeddings in model.encode_batches(texts, batches):
+            all_embeddings[indices] = embeddings
+        return all_embeddings
+
+    for indices in batches:
+        all_embeddings[indices] = encode_batch(model, [texts[i] for i in indices])
     return all_embeddings
 
 
-def save_embeddings_data(chunks_data, embeddings, output_file):
-    chunks_with_embeddings = []
+def iter_text_windows(chunks_file, window_chunks=WINDOW_CHUNKS):
+    """Textes des chunks, par listes d'au plus window_chunks."""
+    window = []
+    for chunk in iter_chunks(chunks_file):
+        window.append(chunk['text'])
+        if len(window) == window_chunks:
+            yield window
+            window = []
+    if window:
+        yield window
 
-    for i, chunk in enumerate(chunks_data):
-        chunk_with_embedding = chunk.copy()
-        chunk_with_embedding['embedding'] = embeddings[i]
-        chunks_with_embeddings.append(chunk_with_embedding)
 
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(chunks_with_embeddings, f, indent=2, ensure_ascii=False)
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
 
-    file_size_mb = os.path.getsize(output_file) / (1024 * 1024)
 
-    return True
+def shard_path(index):
+    return os.path.join(SHARDS_DIR, f"shard_{index:05d}.npy")
 
-def main():
 
+def write_durable(path, write):
+    """Écrit path via un .tmp synchronisé sur disque puis renommé : jamais de fichier à moitié écrit."""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
 
-    chunks_data = load_chunks_from_json(INPUT_CHUNKS_FILE)
 
+def load_progress(run_key):
+    """Shards déjà terminés pour ce run ; un autre input ou une autre config repart de zéro."""
+    if os.path.exists(PROGRESS_FILE):
+        with open(PROGRESS_FILE, 'r', encoding='utf-8') as f:
+            progress = json.load(f)
+        if progress["run"] == run_key:
+            return progress
+    shutil.rmtree(SHARDS_DIR, ignore_errors=True)
+    os.makedirs(SHARDS_DIR)
+    return {"run": run_key, "shards": []}
 
-    device = 'cuda' if torch.cuda.is_available() else 'cpu'
-    model = SentenceTransformer(MODEL_NAME, device=device)
-    start_time = time.time()
-    embeddings = create_embeddings(chunks_data, model)
 
-    
+def embed_to_shards(chunks_file, model, cache=None):
+    """Encode chunks_file fenêtre par fenêtre dans SHARDS_DIR ; retourne (chemins des shards, chunks encodés).
+
+    Seule une fenêtre est en mémoire à la fois.
+    """
+    run_key = {
+        "input_sha256": file_sha256(chunks_file),
+        "model": model.cache_name,
+        "normalize": NORMALIZE_EMBEDDINGS,
+        "window_chunks": WINDOW_CHUNKS,
+    }
+    progress = load_progress(run_key)
+    done = len(progress["shards"])
+    if done:
+        print(f"↩️  Reprise : {done} shard(s) déjà écrits ({sum(progress['shards'])} chunks)")
+
+    encoded = 0
+    for index, texts in enumerate(iter_text_windows(chunks_file, WINDOW_CHUNKS)):
+        if index < done:
+            continue
+        embeddings = create_embeddings([{'text': text} for text in texts], model, cache)
+        write_durable(shard_path(index), lambda f: np.save(f, embeddings))
+        progress["shards"].append(len(texts))
+        write_durable(PROGRESS_FILE, lambda f: f.write(json.dumps(progress, indent=2).encode('utf-8')))
+        encoded += len(texts)
+        print(f"   shard {index}: {len(texts)} chunks ({sum(progress['shards'])} au total)")
+
+    return [shard_path(index) for index in range(len(progress["shards"]))], encoded
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Embed the deduplicated chunks into a memory-mapped artifact.")
+    parser.add_argument("--float16", action="store_true", help="store the vectors in float16")
+    parser.add_argument("--backend", choices=["auto", *BACKENDS], default=EMBEDDING_BACKEND,
+                        help="embedding backend (see embedding_backends.py)")
+    parser.add_argument("--workers", type=int, default=ENCODE_WORKERS,
+                        help="CPU encoding processes, each with cpu_count // workers threads")
+    args = parser.parse_args(argv)
+    dtype = "float16" if args.float16 else EMBEDDING_DTYPE
+    backend_name = get_backend(args.backend, MODEL_NAME).name
+    workers = max(1, args.workers)
+
+    # Le pool (et le modèle de chaque processus) sert à toutes les fenêtres du run
+    if workers > 1 and not uses_gpu(backend_name):
+        model = EncoderPool(backend_name, MODEL_NAME, workers)
+    else:
+        workers = 1
+        model = load_encoder(backend_name, MODEL_NAME)
+    # La variante du backend fait partie de la clé : des vecteurs int8 ne remplacent pas des vecteurs torch
+    cache = EmbeddingCache(model.cache_name, NORMALIZE_EMBEDDINGS)
+    start_time = time.time()
+    shards, encoded = embed_to_shards(INPUT_CHUNKS_FILE, model, cache)
+    elapsed = time.time() - start_time
+    print(f"⚡ {encoded} chunks en {elapsed:.1f}s ({cache.misses / elapsed if elapsed else 0:.1f} chunks encodés/s, "
+          f"{workers} processus, {backend_name}), {cache.summary()}")
+    cache.close()
+    if isinstance(model, EncoderPool):
+        model.close()
 
-    save_embeddings_data(chunks_data, embeddings, OUTPUT_EMBEDDINGS_FILE)
+    # Les chunks sont relus en flux et les shards recopiés dans vectors.npy par memmap
+    meta = assemble_artifact(OUTPUT_EMBEDDINGS_DIR, iter_chunks(INPUT_CHUNKS_FILE), shards,
+                             model.cache_name, dtype)
+    shutil.rmtree(SHARDS_DIR, ignore_errors=True)
+    print(f"💾 {meta['count']} embeddings ({meta['dim']} dims, {meta['dtype']}) -> {OUTPUT_EMBEDDINGS_DIR}")
 
 
 if __name__ == "__main__":
@@ -6,229 +6,244 @@ Alternative de haute qualité au scraping HTML
 
 import os
 import glob
+import itertools
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from pdf_backends import get_backend, select_backend
+from raw_store import sha256_file
+from text_cleaning import CLEANER_VERSION, filter_figure_sections, iter_clean_lines
 
-# Choix de la bibliothèque PDF (décommentez celle que vous préférez)
-PDF_LIBRARY = "pdfplumber"  # Plus précis pour la mise en page
-# PDF_LIBRARY = "PyPDF2"    # Plus rapide, moins précis
-
-if PDF_LIBRARY == "pdfplumber":
-    try:
-        import pdfplumber
-    except ImportError:
-        print("❌ pdfplumber non installé. Exécutez: pip install pdfplumber")
-        exit(1)
-elif PDF_LIBRARY == "PyPDF2":
-    try:
-        import PyPDF2
-    except ImportError:
-        print("❌ PyPDF2 non installé. Exécutez: pip install PyPDF2")
-        exit(1)
+# Choix de la bibliothèque PDF (voir pdf_backends.py)
+PDF_LIBRARY = "auto"          # Par PDF : le plus rapide qui reste fidèle à pdfplumber
+# PDF_LIBRARY = "pymupdf"     # Le plus rapide
+# PDF_LIBRARY = "pdfplumber"  # Plus précis pour la mise en page
+# PDF_LIBRARY = "PyPDF2"      # Plus rapide, moins précis
 
 INPUT_DIR = "climate_pdfs_quality"  # Dossier avec les PDFs de sources.txt
 OUTPUT_DIR = "climate_facts_content_from_pdfs"
 
-def extract_text_pdfplumber(pdf_path):
-    """Extrait le texte avec pdfplumber (plus précis) - Version améliorée."""
-    text_content = []
+# Extraction parallèle : chaque unité de travail = (pdf, plage de pages)
+MAX_WORKERS = os.cpu_count() or 1
+MIN_PAGES_PER_UNIT = 8   # Chaque unité ré-ouvre le PDF : ne pas descendre trop bas
+UNITS_PER_WORKER = 4     # Assez d'unités pour équilibrer la charge entre processus
+
+# Cache d'extraction : texte filtré par (SHA-256 du PDF, page, bibliothèque, version du nettoyeur)
+CACHE_DIR = ".extraction_cache"
+PDF_HASHES_FILE = os.path.join(CACHE_DIR, "pdf_hashes.json")
+OUTPUTS_FILE = os.path.join(CACHE_DIR, "outputs.json")
+SELECTIONS_FILE = os.path.join(CACHE_DIR, "backend_selection.json")
+
+def load_json(path):
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {}
+
+def save_json(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def pdf_sha256(pdf_path, known_hashes):
+    """SHA-256 du PDF, recalculé seulement si sa taille ou sa date ont changé."""
+    stat = os.stat(pdf_path)
+    known = known_hashes.get(pdf_path)
+    if known and known['size'] == stat.st_size and known['mtime_ns'] == stat.st_mtime_ns:
+        return known['sha256']
+    sha256 = sha256_file(pdf_path)
+    known_hashes[pdf_path] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': sha256}
+    return sha256
+
+def resolve_backend(pdf_path, sha256, selections):
+    if PDF_LIBRARY == "auto":
+        return select_backend(pdf_path, sha256, selections)
+    return get_backend(PDF_LIBRARY).name
+
+def page_cache_dir(sha256, backend_name):
+    return os.path.join(CACHE_DIR, "pages", sha256, f"{backend_name}-v{CLEANER_VERSION}")
+
+def page_cache_path(cache_dir, page_num):
+    return os.path.join(cache_dir, f"{page_num}.txt")
+
+def extract_pages(pdf_path, page_indices, backend_name, cache_dir=None):
+    """Extrait et filtre les pages page_indices (0-based) d'un PDF avec le backend backend_name.
+
+    Unité de travail du process pool : retourne [(numéro de page, texte filtré), ...]
+    dans l'ordre des pages, sans les pages vides. Avec cache_dir, chaque page
+    extraite (même vide) y est aussi écrite ; les pages en erreur ne le sont pas.
+    """
+    pages = []
+    
+    def add_page(page_num, text):
+        filtered_text = ""
+        if text:
+            # Nettoyer le texte de base
+            text = text.strip()
+            if text:  # Ignorer les pages vides
+                # Filtrer les sections de figures avant d'ajouter
+                filtered_text = filter_figure_sections(text)
+                if filtered_text.strip():
+                    pages.append((page_num, filtered_text))
+                else:
+                    filtered_text = ""
+        if cache_dir:
+            path = page_cache_path(cache_dir, page_num)
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                f.write(filtered_text)
+            os.replace(path + '.tmp', path)
     
-    with pdfplumber.open(pdf_path) as pdf:
-        for page_num, page in enumerate(pdf.pages, 1):
+    with get_backend(backend_name).open(pdf_path) as document:
+        for index in page_indices:
             try:
-                text = page.extract_text()
-                if text:
-                    # Nettoyer le texte de base
-                    text = text.strip()
-                    if text:  # Ignorer les pages vides
-                        # Filtrer les sections de figures avant d'ajouter
-                        filtered_text = filter_figure_sections(text)
-                        if filtered_text.strip():
-                            text_content.append(f"=== Page {page_num} ===\n{filtered_text}\n")
+                add_page(index + 1, document.page_text(index))
             except Exception as e:
-                print(f"      ⚠️  Erreur page {page_num}: {e}")
+                print(f"      ⚠️  Erreur page {index + 1}: {e}")
     
-    return "\n".join(text_content)
+    return pages
 
-def filter_figure_sections(text):
-    """Filtre les sections entières dédiées aux figures et tableaux."""
-    import re
-    
-    # Diviser en paragraphes
-    paragraphs = text.split('\n\n')
-    filtered_paragraphs = []
-    
-    for paragraph in paragraphs:
-        paragraph = paragraph.strip()
-        
-        # Ignorer les paragraphes courts (souvent des labels)
-        if len(paragraph) < 20:
-            continue
-        
-        # Ignorer les paragraphes qui sont principalement des références de figures
-        figure_keywords = [
-            'Figure', 'Fig.', 'Table', 'Box', 'Panel', 
-            'Chart', 'Graph', 'Diagram', 'Map', 'Image'
-        ]
-        
-        # Compter les mots liés aux figures
-        words = paragraph.split()
-        figure_word_count = sum(1 for word in words if any(keyword in word for keyword in figure_keywords))
-        
-        # Si plus de 20% des mots sont liés aux figures, ignorer
-        if len(words) > 0 and figure_word_count / len(words) > 0.2:
-            continue
-        
-        # Ignorer les paragraphes qui sont des listes de références
-        if paragraph.count('(') > len(paragraph) / 20:  # Trop de parenthèses
-            continue
-        
-        # Ignorer les paragraphes qui sont principalement des chiffres et symboles
-        alpha_chars = re.sub(r'[^a-zA-Z]', '', paragraph)
-        if len(alpha_chars) < len(paragraph) * 0.5:
-            continue
-        
-        filtered_paragraphs.append(paragraph)
-    
-    return '\n\n'.join(filtered_paragraphs)
+def count_pages(pdf_path, backend_name):
+    with get_backend(backend_name).open(pdf_path) as document:
+        return document.page_count
+
+def work_units(page_indices):
+    """Découpe les pages à extraire en unités de travail pour le process pool."""
+    pages_per_unit = max(MIN_PAGES_PER_UNIT, -(-len(page_indices) // (MAX_WORKERS * UNITS_PER_WORKER)))
+    return [page_indices[i:i + pages_per_unit] for i in range(0, len(page_indices), pages_per_unit)]
+
+def format_pages(pages):
+    """Blocs "=== Page n ===" d'un PDF, dans l'ordre (générateur)."""
+    return (f"=== Page {page_num} ===\n{text}\n" for page_num, text in pages)
+
+def extract_text(pdf_path, backend_name):
+    """Extrait tout le texte filtré d'un PDF avec un backend donné, sans cache."""
+    page_indices = range(count_pages(pdf_path, backend_name))
+    return "\n".join(format_pages(extract_pages(pdf_path, page_indices, backend_name)))
+
+def extract_text_pdfplumber(pdf_path):
+    """Extrait le texte avec pdfplumber (plus précis) - Version améliorée."""
+    return extract_text(pdf_path, "pdfplumber")
 
 def extract_text_pypdf2(pdf_path):
     """Extrait le texte avec PyPDF2 (plus rapide) - Version améliorée."""
-    text_content = []
-    
-    with open(pdf_path, 'rb') as file:
-        pdf_reader = PyPDF2.PdfReader(file)
-        
-        for page_num, page in enumerate(pdf_reader.pages, 1):
-            try:
-                text = page.extract_text()
-                if text:
-                    text = text.strip()
-                    if text:
-                        # Filtrer les sections de figures
-                        filtered_text = filter_figure_sections(text)
-                        if filtered_text.strip():
-                            text_content.append(f"=== Page {page_num} ===\n{filtered_text}\n")
-            except Exception as e:
-                print(f"      ⚠️  Erreur page {page_num}: {e}")
+    return extract_text(pdf_path, "PyPDF2")
+
+def plan_pdf(pdf_path, known_hashes, outputs, selections):
+    """Prépare l'extraction d'un PDF depuis le cache.
+
+    Retourne None si la sortie est à jour, sinon un job : dict avec le backend
+    choisi, le dossier de cache, le nombre de pages et les pages à extraire.
+    """
+    sha256 = pdf_sha256(pdf_path, known_hashes)
+    backend_name = resolve_backend(pdf_path, sha256, selections)
+    output_path = output_path_for(pdf_path)
+    expected = {'sha256': sha256, 'library': backend_name, 'cleaner_version': CLEANER_VERSION}
+    if outputs.get(output_path) == expected and os.path.exists(output_path):
+        return None
     
-    return "\n".join(text_content)
+    cache_dir = page_cache_dir(sha256, backend_name)
+    os.makedirs(cache_dir, exist_ok=True)
+    meta_path = os.path.join(cache_dir, "meta.json")
+    meta = load_json(meta_path)
+    if 'page_count' not in meta:
+        meta = {'page_count': count_pages(pdf_path, backend_name)}
+        save_json(meta_path, meta)
+    page_count = meta['page_count']
+    missing = [index for index in range(page_count)
+               if not os.path.exists(page_cache_path(cache_dir, index + 1))]
+    return {
+        'pdf_path': pdf_path, 'sha256': sha256, 'backend': backend_name,
+        'cache_dir': cache_dir, 'page_count': page_count, 'missing': missing,
+    }
+
+def iter_cached_pages(cache_dir, page_count):
+    """Relit les pages du cache une à une, dans l'ordre, sans les pages vides."""
+    for page_num in range(1, page_count + 1):
+        path = page_cache_path(cache_dir, page_num)
+        if not os.path.exists(path):
+            continue  # Page en erreur, réessayée au prochain lancement
+        with open(path, 'r', encoding='utf-8') as f:
+            text = f.read()
+        if text:
+            yield page_num, text
+
+def output_path_for(pdf_path):
+    base_name = os.path.splitext(os.path.basename(pdf_path))[0]
+    return os.path.join(OUTPUT_DIR, f"{base_name}_clean.txt")
 
-def clean_extracted_text(text):
-    """Nettoie le texte extrait des PDFs - Version améliorée pour éliminer les figures."""
-    lines = text.split('\n')
-    cleaned_lines = []
+def save_clean_text(pdf_path, pages, backend_name):
+    """Nettoie les pages (itérable) et écrit le fichier de sortie en flux, ligne par ligne."""
+    filename = os.path.basename(pdf_path)
+    pages = iter(pages)
+    first_page = next(pages, None)
+    if first_page is None:
+        print(f"      ❌ Aucun texte extrait de {filename}")
+        return False
     
-    # Patterns à ignorer (figures, tableaux, navigation)
-    ignore_patterns = [
-        # Figures et tableaux
-        r'^\s*Figure\s+\d+',
-        r'^\s*Fig\.\s+\d+',
-        r'^\s*Table\s+\d+',
-        r'^\s*Box\s+\d+',
-        r'^\s*Panel\s+[A-Z]',
-        r'^\s*\([a-z]\)\s*$',  # (a), (b), etc.
-        r'^\s*[A-Z]\)\s*$',    # A), B), etc.
-        
-        # Navigation et références
-        r'^\s*SPM-\d+',
-        r'^\s*WG[I]+\s*-\s*\d+',
-        r'^\s*AR6\s+',
-        r'^\s*IPCC\s+',
-        r'^\s*See\s+',
-        r'^\s*\{[^}]*\}',      # {références}
-        
-        # Numéros de page et headers
-        r'^\s*\d+\s*$',
-        r'^\s*Page\s+\d+',
-        r'^\s*Chapter\s+\d+',
-        r'^\s*Summary\s+for\s+Policymakers',
-        
-        # Éléments de structure PDF
-        r'^\s*===\s*Page\s+\d+\s*===',
-        r'^\s*\.\.\.',
-        r'^\s*…',
-        
-        # Légendes courtes et labels
-        r'^\s*[a-z]\.\s*$',
-        r'^\s*\d+\.\s*$',
-        r'^\s*\([^)]{1,3}\)\s*$',
-    ]
+    output_path = output_path_for(pdf_path)
     
-    import re
+    # Les lignes de "\n".join(blocs) sont exactement la concaténation des lignes de chaque bloc
+    blocks = format_pages(itertools.chain([first_page], pages))
+    raw_lines = itertools.chain.from_iterable(block.split('\n') for block in blocks)
     
-    for line in lines:
-        line = line.strip()
-        
-        # Ignorer les lignes très courtes
-        if len(line) < 5:
-            continue
-        
-        # Ignorer les lignes qui matchent les patterns
-        should_ignore = False
-        for pattern in ignore_patterns:
-            if re.match(pattern, line, re.IGNORECASE):
-                should_ignore = True
-                break
-        
-        if should_ignore:
-            continue
-        
-        # Ignorer les lignes qui sont principalement des caractères spéciaux
-        if len(re.sub(r'[^a-zA-Z]', '', line)) < len(line) * 0.3:
-            continue
-        
-        # Ignorer les lignes répétitives (souvent des artefacts)
-        if line.count('.') > len(line) * 0.5:  # Ligne avec trop de points
-            continue
-        
-        if line.count('_') > len(line) * 0.3:  # Ligne avec trop de underscores
-            continue
-        
-        # Nettoyer la ligne
-        line = re.sub(r'\s+', ' ', line)  # Espaces multiples -> un seul
-        line = re.sub(r'[\x00-\x1f\x7f-\x9f]', '', line)  # Caractères de contrôle
-        
-        cleaned_lines.append(line)
+    char_count = 0
+    word_count = 0
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write(f"Source PDF: {filename}\n")
+        f.write(f"Bibliothèque: {backend_name}\n")
+        f.write("="*80 + "\n\n")
+        for i, line in enumerate(iter_clean_lines(raw_lines)):
+            if i:
+                f.write("\n")
+                char_count += 1
+            f.write(line)
+            char_count += len(line)
+            word_count += len(line.split())
     
-    return '\n'.join(cleaned_lines)
+    print(f"    📄 {filename} ({backend_name})")
+    print(f"      ✅ Extrait: {char_count:,} caractères, {word_count:,} mots")
+    print(f"      💾 Sauvé: {output_path}")
+    return True
+
+def finish_pdf(job, outputs):
+    cache_dir, page_count = job['cache_dir'], job['page_count']
+    if not save_clean_text(job['pdf_path'], iter_cached_pages(cache_dir, page_count), job['backend']):
+        return False
+    if all(os.path.exists(page_cache_path(cache_dir, n)) for n in range(1, page_count + 1)):
+        outputs[output_path_for(job['pdf_path'])] = {
+            'sha256': job['sha256'], 'library': job['backend'], 'cleaner_version': CLEANER_VERSION,
+        }
+    return True
 
-def process_pdf(pdf_path):
-    """Traite un PDF et extrait le texte propre."""
+def submit_job(pool, job):
+    return [pool.submit(extract_pages, job['pdf_path'], unit, job['backend'], job['cache_dir'])
+            for unit in work_units(job['missing'])]
+
+def process_pdf(pdf_path, pool=None):
+    """Traite un PDF et extrait le texte propre (pages manquantes du cache réparties sur pool si fourni)."""
     filename = os.path.basename(pdf_path)
     print(f"    📄 Traitement: {filename}")
     
     try:
-        # Extraire le texte selon la bibliothèque choisie
-        if PDF_LIBRARY == "pdfplumber":
-            raw_text = extract_text_pdfplumber(pdf_path)
+        known_hashes, outputs, selections = load_json(PDF_HASHES_FILE), load_json(OUTPUTS_FILE), load_json(SELECTIONS_FILE)
+        job = plan_pdf(pdf_path, known_hashes, outputs, selections)
+        save_json(PDF_HASHES_FILE, known_hashes)
+        save_json(SELECTIONS_FILE, selections)
+        if job is None:
+            print(f"      ⏭️  À jour: {filename}")
+            return True
+        if pool is None:
+            for unit in work_units(job['missing']):
+                extract_pages(pdf_path, unit, job['backend'], job['cache_dir'])
         else:
-            raw_text = extract_text_pypdf2(pdf_path)
-        
-        if not raw_text.strip():
-            print(f"      ❌ Aucun texte extrait de {filename}")
-            return False
-        
-        # Nettoyer le texte
-        clean_text = clean_extracted_text(raw_text)
-        
-        # Créer le nom de fichier de sortie
-        base_name = os.path.splitext(filename)[0]
-        output_filename = f"{base_name}_clean.txt"
-        output_path = os.path.join(OUTPUT_DIR, output_filename)
-        
-        # Sauvegarder
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(f"Source PDF: {filename}\n")
-            f.write(f"Bibliothèque: {PDF_LIBRARY}\n")
-            f.write("="*80 + "\n\n")
-            f.write(clean_text)
-        
-        char_count = len(clean_text)
-        word_count = len(clean_text.split())
-        print(f"      ✅ Extrait: {char_count:,} caractères, {word_count:,} mots")
-        print(f"      💾 Sauvé: {output_path}")
-        
-        return True
+            for future in submit_job(pool, job):
+                future.result()
+        success = finish_pdf(job, outputs)
+        save_json(OUTPUTS_FILE, outputs)
+        return success
         
     except Exception as e:
         print(f"      ❌ Erreur lors du traitement de {filename}: {e}")
@@ -254,16 +269,50 @@ def main():
     
     print("📖 EXTRACTION DE TEXTE DEPUIS LES PDFs CLIMATIQUES")
     print(f"🔧 Bibliothèque utilisée: {PDF_LIBRARY}")
+    print(f"⚙️  {MAX_WORKERS} processus, pages réparties par plages")
     print("="*60)
     
     successful = 0
+    up_to_date = 0
+    extracted_pages = 0
+    start_time = time.time()
+    known_hashes, outputs, selections = load_json(PDF_HASHES_FILE), load_json(OUTPUTS_FILE), load_json(SELECTIONS_FILE)
+    backends_used = {}
     
-    for pdf_path in pdf_files:
-        if process_pdf(pdf_path):
-            successful += 1
+    # Toutes les unités (pdf, pages) de tous les PDFs partagent le même pool ;
+    # les gros PDFs en tête pour que les petits comblent la fin.
+    with ProcessPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        jobs = []
+        for pdf_path in sorted(pdf_files, key=os.path.getsize, reverse=True):
+            try:
+                job = plan_pdf(pdf_path, known_hashes, outputs, selections)
+            except Exception as e:
+                print(f"      ❌ Erreur lors de l'ouverture de {os.path.basename(pdf_path)}: {e}")
+                continue
+            if job is None:
+                up_to_date += 1
+                continue
+            extracted_pages += len(job['missing'])
+            backends_used[job['backend']] = backends_used.get(job['backend'], 0) + 1
+            jobs.append((job, submit_job(pool, job)))
+        save_json(PDF_HASHES_FILE, known_hashes)
+        save_json(SELECTIONS_FILE, selections)
+        
+        for job, futures in jobs:
+            try:
+                for future in futures:
+                    future.result()
+                if finish_pdf(job, outputs):
+                    successful += 1
+            except Exception as e:
+                print(f"      ❌ Erreur lors du traitement de {os.path.basename(job['pdf_path'])}: {e}")
+        save_json(OUTPUTS_FILE, outputs)
     
     print(f"\n{'='*60}")
-    print(f"📊 RÉSULTATS: {successful}/{len(pdf_files)} PDFs traités avec succès")
+    print(f"📊 RÉSULTATS: {successful}/{len(pdf_files) - up_to_date} PDFs traités avec succès en {time.time() - start_time:.1f}s")
+    print(f"⏭️  {up_to_date} PDF(s) déjà à jour, {extracted_pages:,} page(s) extraite(s) hors cache")
+    if backends_used:
+        print(f"🔧 Backends: {', '.join(f'{name} x{count}' for name, count in sorted(backends_used.items()))}")
     print(f"📁 Texte propre sauvé dans: {OUTPUT_DIR}")
     
     if successful > 0:
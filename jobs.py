@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Fact-checking par lots : file de jobs persistante (SQLite) et workers parallèles.
+
+Chaque article demandé est une ligne de la table jobs (pending -> running ->
+done / failed). Un article déjà analysé (done) n'est jamais refait : après un
+crash, relancer la même commande reprend là où le lot s'était arrêté. Chaque
+worker est un processus avec son propre Llama et sa part des coeurs
+(n_threads = coeurs / workers) ; il prend le prochain article en attente
+dans la base.
+
+    python jobs.py [--articles 1-50] [--workers 4] [--retry-failed]
+    python jobs.py --list | --status
+
+(python llm.py accepte les mêmes options.)
+
+Un job 'running' appartient à un processus (pid, machine) qui renouvelle son
+bail (heartbeat) toutes les HEARTBEAT_SECONDS. Au démarrage, seuls les jobs
+dont le processus est mort ou dont le bail a expiré repassent en attente :
+un deuxième lanceur ne reprend pas les articles d'un lot en cours.
+"""
+
+import argparse
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+import llm
+
+JOBS_FILE = "fact_check_jobs.sqlite"
+WORKERS = 1
+HEARTBEAT_SECONDS = 30
+LEASE_SECONDS = 5 * HEARTBEAT_SECONDS  # Sans heartbeat depuis ce délai, un job 'running' est abandonné
+
+
+def connect(path=JOBS_FILE):
+    connection = sqlite3.connect(path, timeout=60)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("""CREATE TABLE IF NOT EXISTS jobs (
+        number INTEGER PRIMARY KEY, title TEXT NOT NULL, state TEXT NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0, worker INTEGER, started_at REAL, finished_at REAL,
+        error TEXT, output_file TEXT, pid INTEGER, host TEXT, heartbeat REAL)""")
+    # Base créée avant les baux : ses jobs 'running' n'ont pas de heartbeat et sont repris
+    columns = {row[1] for row in connection.execute("PRAGMA table_info(jobs)")}
+    for column, kind in (("pid", "INTEGER"), ("host", "TEXT"), ("heartbeat", "REAL")):
+        if column not in columns:
+            connection.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+    connection.commit()
+    return connection
+
+
+def use_numbers(connection, numbers):
+    """Restreint claim_next et status de cette connexion aux articles numbers (table temporaire).
+
+    Une table plutôt que number IN (?, ?, ...) : pas de limite sur le nombre d'articles.
+    """
+    connection.execute("CREATE TEMP TABLE IF NOT EXISTS wanted (number INTEGER PRIMARY KEY)")
+    connection.execute("DELETE FROM wanted")
+    connection.executemany("INSERT OR IGNORE INTO wanted (number) VALUES (?)", [(number,) for number in numbers])
+    connection.commit()
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def reclaim_stale(connection):
+    """Remet en attente les jobs 'running' dont le processus est mort ou dont le bail a expiré ; retourne leur nombre."""
+    host = socket.gethostname()
+    expired_before = time.time() - LEASE_SECONDS
+    stale = [(number,) for number, pid, job_host, heartbeat in connection.execute(
+                 "SELECT number, pid, host, heartbeat FROM jobs WHERE state = 'running'")
+             if heartbeat is None or heartbeat < expired_before
+             or (job_host == host and pid is not None and not pid_alive(pid))]
+    connection.executemany("UPDATE jobs SET state = 'pending', worker = NULL, pid = NULL, host = NULL, "
+                           "heartbeat = NULL WHERE number = ? AND state = 'running'", stale)
+    return len(stale)
+
+
+def parse_ranges(spec):
+    """"1-50,60,70-72" -> [1, ..., 50, 60, 70, 71, 72]"""
+    numbers = []
+    for part in spec.split(','):
+        start, _, end = part.strip().partition('-')
+        numbers.extend(range(int(start), int(end or start) + 1))
+    return sorted(set(numbers))
+
+
+def enqueue(connection, articles, retry_failed=False):
+    """Ajoute les articles absents de la file ; les jobs done restent done."""
+    connection.execute("BEGIN IMMEDIATE")
+    reclaimed = reclaim_stale(connection)
+    if reclaimed:
+        print(f"{reclaimed} abandoned job(s) back to pending")
+    if retry_failed:
+        connection.execute("UPDATE jobs SET state = 'pending', error = NULL WHERE state = 'failed'")
+    connection.executemany("INSERT OR IGNORE INTO jobs (number, title, state) VALUES (?, ?, 'pending')",
+                           [(article['number'], article['title']) for article in articles])
+    connection.commit()
+
+
+def claim_next(connection, worker):
+    """Passe le prochain job en attente (parmi use_numbers) à 'running' pour ce worker ; None s'il n'y en a plus."""
+    connection.execute("BEGIN IMMEDIATE")  # Verrou d'écriture : deux workers ne prennent pas le même job
+    row = connection.execute(
+        "SELECT number FROM jobs WHERE state = 'pending' AND number IN (SELECT number FROM wanted) "
+        "ORDER BY number LIMIT 1").fetchone()
+    if row is not None:
+        now = time.time()
+        connection.execute("UPDATE jobs SET state = 'running', worker = ?, attempts = attempts + 1, started_at = ?, "
+                           "pid = ?, host = ?, heartbeat = ? WHERE number = ?",
+                           (worker, now, os.getpid(), socket.gethostname(), now, row[0]))
+    connection.commit()
+    return row[0] if row else None
+
+
+class Heartbeat:
+    """Renouvelle le bail d'un job toutes les HEARTBEAT_SECONDS, depuis un thread et sa propre connexion."""
+
+    def __init__(self, jobs_file, number):
+        self.jobs_file = jobs_file
+        self.number = number
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        connection = connect(self.jobs_file)
+        while not self.stopped.wait(HEARTBEAT_SECONDS):
+            connection.execute("UPDATE jobs SET heartbeat = ? WHERE number = ? AND state = 'running' AND pid = ?",
+                               (time.time(), self.number, os.getpid()))
+            connection.commit()
+        connection.close()
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+
+
+def finish(connection, number, state, error=None, output_file=None):
+    connection.execute("UPDATE jobs SET state = ?, finished_at = ?, error = ?, output_file = ? WHERE number = ?",
+                       (state, time.time(), error, output_file, number))
+    connection.commit()
+
+
+def analyze_and_save(article):
+    """Analyse un article et écrit result/analyse_article_<n>.txt ; retourne le chemin écrit."""
+    analysis_result = llm.analyze_article(article)
+    header = f"🔎 Result of article number {article['number']}: {article['title']}"
+    print("\n")
+    print(header)
+    print(analysis_result)
+    filename = f"analyse_article_{article['number']}.txt"
+    llm.save_analysis_to_file(filename, f"{header}\n\n{analysis_result}")
+    return os.path.join(llm.ANALYSIS_OUTPUT_DIR, filename)
+
+
+def worker_main(worker, articles, n_threads, jobs_file):
+    llm.N_THREADS = n_threads
+    by_number = {article['number']: article for article in articles}
+    connection = connect(jobs_file)
+    use_numbers(connection, list(by_number))
+    while (number := claim_next(connection, worker)) is not None:
+        article = by_number[number]
+        print(f"[worker {worker}] article {number}: {article['title']}")
+        start = time.time()
+        try:
+            with Heartbeat(jobs_file, number):
+                output_file = analyze_and_save(article)
+        except Exception as e:
+            finish(connection, number, 'failed', error=repr(e))
+            print(f"[worker {worker}] ❌ article {number} failed: {e!r}")
+            continue
+        finish(connection, number, 'done', output_file=output_file)
+        print(f"[worker {worker}] ✅ article {number} done in {time.time() - start:.0f}s")
+    connection.close()
+
+
+def status(connection, numbers=None):
+    """{état: nombre de jobs} (restreint à numbers si donné)."""
+    query = "SELECT state, COUNT(*) FROM jobs"
+    if numbers is not None:
+        use_numbers(connection, numbers)
+        query += " WHERE number IN (SELECT number FROM wanted)"
+    return dict(connection.execute(query + " GROUP BY state").fetchall())
+
+
+def run_jobs(articles, workers=WORKERS, retry_failed=False, jobs_file=JOBS_FILE):
+    """Analyse les articles pas encore faits avec workers processus ; retourne les compteurs par état."""
+    connection = connect(jobs_file)
+    enqueue(connection, articles, retry_failed)
+    numbers = [article['number'] for article in articles]
+    pending = status(connection, numbers).get('pending', 0)
+    print(f"{len(articles)} article(s): {len(articles) - pending} already done or failed, {pending} to analyse")
+
+    if pending:
+        workers = max(1, min(workers, pending))
+        n_threads = max(1, (os.cpu_count() or 1) // workers)
+        if workers == 1:
+            worker_main(0, articles, n_threads, jobs_file)
+        else:
+            # spawn : chaque worker charge ses modèles dans un processus neuf (llama.cpp n'aime pas fork)
+            context = multiprocessing.get_context("spawn")
+            processes = [context.Process(target=worker_main, args=(worker, articles, n_threads, jobs_file))
+                         for worker in range(workers)]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+
+    counts = status(connection, numbers)
+    connection.close()
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fact-check articles in parallel with a resumable job queue.")
+    parser.add_argument("--articles", help="article numbers, e.g. 1-50 or 1-10,12 (default: all)")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="worker processes, each with its own Llama")
+    parser.add_argument("--retry-failed", action="store_true", help="analyse failed articles again")
+    parser.add_argument("--list", action="store_true", help="list the articles of the PDF and exit")
+    parser.add_argument("--status", action="store_true", help="show the queue and exit")
+    parser.add_argument("--pdf", default=llm.PDF_PATH)
+    args = parser.parse_args(argv)
+
+    if args.status:
+        connection = connect()
+        for number, title, state, attempts, error in connection.execute(
+                "SELECT number, title, state, attempts, error FROM jobs ORDER BY number"):
+            print(f"  {number:4d} {state:8s} x{attempts} {title}" + (f"  ({error})" if error else ""))
+        print(status(connection))
+        connection.close()
+        return
+
+    articles = llm.load_and_split_articles(args.pdf)
+    if args.list:
+        for article in articles:
+            print(f"  {article['number']}: {article['title']}")
+        return
+    if args.articles:
+        wanted = set(parse_ranges(args.articles))
+        articles = [article for article in articles if article['number'] in wanted]
+    if not articles:
+        parser.error("no article matches --articles")
+
+    start = time.time()
+    counts = run_jobs(articles, args.workers, args.retry_failed)
+    print(f"{counts} in {time.time() - start:.0f}s")
+
+
+if __name__ == "__main__":
+    main()
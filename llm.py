@@ -1,13 +1,16 @@
+import hashlib
+import json
 import os
+import pickle
 import re
-import chromadb
-from sentence_transformers import SentenceTransformer
-import torch
-from llama_cpp import Llama
 import fitz
+import numpy as np
+from embedding_backends import load_encoder
+from embedding_cache import EmbeddingCache
+from vector_index import open_store
+from bm25_index import BM25_DIR, BM25Index, reciprocal_rank_fusion
+from query_cache import QueryCache
 
-PERSIST_DIRECTORY = "chroma_db_climate_facts"
-COLLECTION_NAME = "climate_facts_chunks"
 MODEL_NAME = 'paraphrase-multilingual-MiniLM-L12-v2'
 NUM_RESULTS_TO_RETRIEVE = 8
 PDF_PATH = "climate_articles.pdf"
@@ -19,71 +22,239 @@ MODEL_PATH = "/home/benoit_v/Documents/models/Meta-Llama-3-8B-Instruct.Q4_K_M.gg
 N_GPU_LAYERS = 0 # 0 for only cpu
 N_CTX = 8192
 N_BATCH = 512
+KV_CACHE_DIR = ".kv_cache"  # État KV du préfixe système, un fichier par (modèle, n_ctx, n_batch, prompt)
+# 2 : état llama.cpp + tokens + dernière ligne de scores (1 : LlamaState entier, n_tokens lignes de scores)
+PREFIX_STATE_FORMAT = 2
 
-#embeddings
-device_embed = 'cuda' if torch.cuda.is_available() and N_GPU_LAYERS > 0 else 'cpu'
-embedding_model = SentenceTransformer(MODEL_NAME, device=device_embed)
+N_THREADS = None  # None : choix de llama.cpp ; fixé par worker dans jobs.py (coeurs / workers)
 
+#embeddings
+# "auto" : ONNX Runtime si le modèle a été exporté (python embedding_backends.py export),
+# sans importer torch ; sinon SentenceTransformer. "onnx-int8" : plus rapide, à vérifier avec parity
+EMBEDDING_BACKEND = "auto"
+
+#vector index : "numpy" (recherche exacte sur l'artefact mappé en mémoire), "hnsw" (faiss), "chroma",
+# ou quantifié pour laisser la RAM au Llama : "int8" / "binary" (codes en RAM, rescoring float32 mappé)
+VECTOR_STORE = "numpy"
+
+#hybrid retrieval : une requête dense (titre + début) fusionnée (RRF) avec une requête BM25 par affirmation,
+# qui retrouve les termes exacts ("SSP5-8.5", "AMOC") que l'embedding dilue
+DENSE_K = 5
+LEXICAL_K = 5  # par affirmation
+MAX_CLAIMS = 30
+
+
+# Modèles et index chargés au premier usage (importer llm ne charge rien) :
+# chaque worker de jobs.py charge les siens, avec sa part des coeurs
+_models = {}
+
+
+def get_embedding_model():
+    """(encodeur, cache d'embeddings) ; un article déjà analysé ne repasse pas par le modèle."""
+    if 'embedding' not in _models:
+        model = load_encoder(EMBEDDING_BACKEND, MODEL_NAME, device='cpu' if N_GPU_LAYERS == 0 else None,
+                             num_threads=N_THREADS)
+        _models['embedding'] = (model, EmbeddingCache(model.cache_name))
+    return _models['embedding']
+
+
+def get_vector_store():
+    if 'vector_store' not in _models:
+        _models['vector_store'] = open_store(VECTOR_STORE)
+    return _models['vector_store']
+
+
+def get_lexical_index():
+    """Index BM25, None s'il manque ou est périmé (recherche dense seule)."""
+    if 'lexical' not in _models:
+        lexical_index = BM25Index(BM25_DIR) if os.path.exists(BM25_DIR) else None
+        if lexical_index is not None and lexical_index.is_stale():
+            print(f"⚠️ {BM25_DIR} est périmé (python bm25_index.py build) : recherche dense seule")
+            lexical_index = None
+        _models['lexical'] = lexical_index
+    return _models['lexical']
+
+
+def get_query_cache():
+    """Résultats de recherche mis en cache par article : relancer 'all' après un changement de prompt
+    ne refait ni l'embedding ni la recherche. Invalidé quand l'artefact, la collection ou l'index BM25 change."""
+    if 'query_cache' not in _models:
+        embedding_model, _ = get_embedding_model()
+        vector_store = get_vector_store()
+        lexical_index = get_lexical_index()
+        if lexical_index is None:
+            mode, index_version = VECTOR_STORE, vector_store.version()
+        else:
+            mode = f"{VECTOR_STORE}+bm25 dense={DENSE_K} lexical={LEXICAL_K}x{MAX_CLAIMS}"
+            index_version = f"{vector_store.version()}+{lexical_index.meta['input_sha256'][:16]}"
+        _models['query_cache'] = QueryCache(embedding_model.cache_name, mode, index_version)
+    return _models['query_cache']
+
+
+def get_llm():
+    if 'llm' not in _models:
+        from llama_cpp import Llama
+
+        _models['llm'] = Llama(
+            model_path=MODEL_PATH,
+            n_gpu_layers=N_GPU_LAYERS,
+            n_ctx=N_CTX,
+            n_batch=N_BATCH,
+            n_threads=N_THREADS,
+            verbose=False
+        )
+    return _models['llm']
+
+
+SYSTEM_PROMPT = """You are a meticulous and impartial climate science fact-checker. Your mission is to analyze the 'ARTICLE TO ANALYZE' and determine its credibility by comparing its claims against the provided 'SCIENTIFIC CONTEXT'. Base your entire analysis ONLY on the provided context. Do not use any external knowledge.
 
+Your output must be structured in the following format:
+1.  **VERDICT:** [Choose ONE: Factual and Credible / Disinformation or Hoax]
+2.  **CONFIDENCE:** [High / Medium / Low]
+3.  **ARTICLE SUMMARY:** [Briefly summarize the main argument of the article in 2-3 sentences.]
+4.  **FACT-CHECK ANALYSIS:** [Provide a point-by-point analysis. Compare the article's claims to the provided scientific context. If the article is misleading or false, explain why. **If the verdict is 'INSUFFICIENT DATA TO VERIFY', explain which claims could not be verified against the provided context.**]"""
+# Début commun à tous les prompts ; se termine sur un token spécial, donc tokenisé pareil seul ou dans le prompt
+PROMPT_PREFIX = f"""<|begin_of_text|><|start_header_id|>system<|end_header_id|>
+
+{SYSTEM_PROMPT}<|eot_id|>"""
+
+
+def compact_state(state, tokens):
+    """Ce qui sert à recharger le préfixe : l'état llama.cpp, les tokens et la dernière ligne de scores.
+
+    LlamaState garde une ligne de n_vocab scores par token évalué (plus de 100 Mo pour
+    le préfixe avec le vocabulaire de 128k de Llama 3) ; sans logits_all, seule la
+    dernière est remplie.
+    """
+    return {
+        "tokens": tokens,
+        "llama_state": state.llama_state,
+        "llama_state_size": state.llama_state_size,
+        "last_scores": np.array(state.scores[len(tokens) - 1:len(tokens)], dtype=np.single),
+    }
+
+
+def expand_state(llm_model, compact):
+    """LlamaState rechargeable par load_state (qui recopie last_scores sur les lignes du préfixe)."""
+    import llama_cpp
+
+    tokens = compact["tokens"]
+    input_ids = np.zeros(llm_model.n_ctx(), dtype=np.intc)
+    input_ids[:len(tokens)] = tokens
+    return llama_cpp.LlamaState(input_ids=input_ids, scores=compact["last_scores"], n_tokens=len(tokens),
+                                llama_state=compact["llama_state"], llama_state_size=compact["llama_state_size"])
+
+
+def get_prefix_state(llm_model):
+    """(tokens du préfixe, état compact après le préfixe) ; le préfixe n'est évalué qu'une fois, puis relu du disque."""
+    if 'prefix' not in _models:
+        import llama_cpp
+
+        tokens = llm_model.tokenize(PROMPT_PREFIX.encode('utf-8'), special=True)  # Comme dans llm_model(prompt)
+        # Taille et date du GGUF : un modèle remplacé au même chemin ne relit pas un état incompatible
+        model_stat = os.stat(MODEL_PATH)
+        key = hashlib.sha256(json.dumps([PREFIX_STATE_FORMAT, os.path.abspath(MODEL_PATH), model_stat.st_size,
+                                         model_stat.st_mtime_ns, N_CTX, N_BATCH, llama_cpp.__version__, tokens])
+                             .encode('utf-8')).hexdigest()[:16]
+        state_path = os.path.join(KV_CACHE_DIR, f"prefix-{key}.pkl")
+        if os.path.exists(state_path):
+            with open(state_path, 'rb') as f:
+                state = pickle.load(f)
+        else:
+            llm_model.reset()
+            llm_model.eval(tokens)
+            state = compact_state(llm_model.save_state(), tokens)
+            os.makedirs(KV_CACHE_DIR, exist_ok=True)
+            tmp_path = f"{state_path}.{os.getpid()}.tmp"  # Plusieurs workers peuvent l'écrire en même temps
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, state_path)
+        _models['prefix'] = (tokens, state)
+    return _models['prefix']
+
+
+def restore_prefix(llm_model):
+    """Recharge l'état KV du préfixe si le contexte ne commence pas déjà par lui.
+
+    llama_cpp ne réévalue ensuite que la partie du prompt après le plus long préfixe commun
+    (après un premier article, le contexte contient déjà le préfixe : rien à recharger).
+    """
+    tokens, state = get_prefix_state(llm_model)
+    # input_ids est le tampon de n_ctx tokens : seuls les n_tokens premiers sont évalués
+    evaluated = llm_model.input_ids[:llm_model.n_tokens]
+    if llm_model.n_tokens < len(tokens) or list(evaluated[:len(tokens)]) != tokens:
+        llm_model.load_state(expand_state(llm_model, state))
+
+
+ARTICLE_SEPARATOR = re.compile(r'\n(\d+):\s')
+CLAIM_BOUNDARY = re.compile(r'(?<=[.!?])\s+(?=[A-Z0-9"«])')
+
+
+def make_article(number: str, content: str) -> dict:
+    title = content.split('\n')[0].strip()
+    return {
+        "number": int(number),
+        "title": title,
+        "text": content.strip()
+    }
+
+
+def iter_articles(pdf_path: str):
+    """Yield articles page by page; only the article being read stays in memory."""
+    buffer = ""
+    with fitz.open(pdf_path) as doc:
+        for page in doc:
+            buffer += page.get_text()
+            matches = list(ARTICLE_SEPARATOR.finditer(buffer))
+            # an article is complete once the next separator has been read
+            for current, following in zip(matches, matches[1:]):
+                yield make_article(current.group(1), buffer[current.end():following.start()])
+            if matches:
+                buffer = buffer[matches[-1].start():]
+
+    matches = list(ARTICLE_SEPARATOR.finditer(buffer))
+    for current, following in zip(matches, matches[1:] + [None]):
+        end = following.start() if following else len(buffer)
+        yield make_article(current.group(1), buffer[current.end():end])
 
-#chromadb
-client = chromadb.PersistentClient(path=PERSIST_DIRECTORY)
-collection = client.get_collection(name=COLLECTION_NAME)
 
+def load_and_split_articles(pdf_path: str) -> list[dict]:
+    return list(iter_articles(pdf_path))
 
 
-llm_model = Llama(
-    model_path=MODEL_PATH,
-    n_gpu_layers=N_GPU_LAYERS,
-    n_ctx=N_CTX,
-    n_batch=N_BATCH,
-    verbose=False
-)
+def split_claims(text: str) -> list[str]:
+    """Phrases de l'article assez longues pour porter une affirmation."""
+    sentences = CLAIM_BOUNDARY.split(" ".join(text.split()))
+    return [sentence for sentence in sentences if len(sentence.split()) >= 5][:MAX_CLAIMS]
 
 
-def load_and_split_articles(pdf_path: str) -> list[dict]:
-    articles = []
-    doc = fitz.open(pdf_path)
-    full_text = ""
-    for page in doc:
-        full_text += page.get_text()
-    doc.close()
-
-    raw_articles = re.split(r'\n(\d+):\s', full_text)
-    if raw_articles[0].strip().lower() == "climate articles":
-        raw_articles.pop(0)
-    i = 0
-    while i < len(raw_articles) - 1:
-        num = raw_articles[i]
-        content = raw_articles[i + 1]
-        title = content.split('\n')[0].strip()
-        articles.append({
-            "number": int(num),
-            "title": title,
-            "text": content.strip()
-        })
-        i += 2
-    return articles
+def retrieve_context(article: dict) -> list[str]:
+    embedding_model, embedding_cache = get_embedding_model()
+    vector_store = get_vector_store()
+    lexical_index = get_lexical_index()
+    search_query = article['title'] + "\n" + " ".join(article['text'].split()[:100])
+    query_embedding = embedding_cache.encode([search_query], embedding_model.encode)[0]
+    if lexical_index is None:
+        return [hit['text'] for hit in vector_store.query(query_embedding, NUM_RESULTS_TO_RETRIEVE)]
+
+    dense_hits = vector_store.query(query_embedding, DENSE_K)
+    claim_rankings = [[doc for doc, _ in lexical_index.search(claim, LEXICAL_K)]
+                      for claim in [article['title'], *split_claims(article['text'])]]
+    # Les affirmations sont d'abord fusionnées entre elles : le classement dense pèse autant que le lexical
+    lexical_docs = reciprocal_rank_fusion(claim_rankings)
+    lexical_records = lexical_index.records(lexical_docs)
+    texts = {record['id']: record['text'] for record in lexical_records}
+    texts.update((hit['id'], hit['text']) for hit in dense_hits)
+    fused = reciprocal_rank_fusion([[hit['id'] for hit in dense_hits],
+                                    [record['id'] for record in lexical_records]])
+    return [texts[chunk_id] for chunk_id in fused[:NUM_RESULTS_TO_RETRIEVE]]
 
 
 def analyze_article(article: dict):
-    search_query = article['title'] + "\n" + " ".join(article['text'].split()[:100])
-    query_embedding = embedding_model.encode(search_query, device=device_embed).tolist()
-    results = collection.query(
-        query_embeddings=[query_embedding],
-        n_results=NUM_RESULTS_TO_RETRIEVE,
-        include=['documents']
-    )
-    context_chunks = results.get('documents', [[]])[0]
+    context_chunks = get_query_cache().get_or_compute(article['title'] + "\n" + article['text'],
+                                                      NUM_RESULTS_TO_RETRIEVE, lambda: retrieve_context(article))
     context_string = "\n\n---\n\n".join(context_chunks)
 
-    system_prompt = """You are a meticulous and impartial climate science fact-checker. Your mission is to analyze the 'ARTICLE TO ANALYZE' and determine its credibility by comparing its claims against the provided 'SCIENTIFIC CONTEXT'. Base your entire analysis ONLY on the provided context. Do not use any external knowledge.
-
-Your output must be structured in the following format:
-1.  **VERDICT:** [Choose ONE: Factual and Credible / Disinformation or Hoax]
-2.  **CONFIDENCE:** [High / Medium / Low]
-3.  **ARTICLE SUMMARY:** [Briefly summarize the main argument of the article in 2-3 sentences.]
-4.  **FACT-CHECK ANALYSIS:** [Provide a point-by-point analysis. Compare the article's claims to the provided scientific context. If the article is misleading or false, explain why. **If the verdict is 'INSUFFICIENT DATA TO VERIFY', explain which claims could not be verified against the provided context.**]"""
     user_prompt = f"""**SCIENTIFIC CONTEXT:**
 ---
 {context_string}
@@ -94,13 +265,13 @@ Your output must be structured in the following format:
 ---
 
 Provide your fact-check analysis based on the instructions."""
-    prompt = f"""<|begin_of_text|><|start_header_id|>system<|end_header_id|>
-
-{system_prompt}<|eot_id|><|start_header_id|>user<|end_header_id|>
+    prompt = f"""{PROMPT_PREFIX}<|start_header_id|>user<|end_header_id|>
 
 {user_prompt}<|eot_id|><|start_header_id|>assistant<|end_header_id|>
 """
     print("  analyzing")
+    llm_model = get_llm()
+    restore_prefix(llm_model)
     output = llm_model(
         prompt,
         max_tokens=800,
@@ -124,55 +295,7 @@ def save_analysis_to_file(filename: str, content: str):
 
 
 if __name__ == "__main__":
-    articles = load_and_split_articles(PDF_PATH)
-
-    while True:
-        for article in articles:
-            print(f"  {article['number']}: {article['title']}")
-        print("  'all': analyse every article")
-        print("Enter the number of the article you want to test, 'all', or 'quit'.")
-
-        user_input = input("\ninput : ")
-
-        if user_input.lower() in ['quit', 'exit']:
-            break
-
-        if user_input.lower() == 'all':
-            for article in articles:
-                analysis_result = analyze_article(article)
-                header = f"🔎 Result of article number {article['number']}: {article['title']}"
-
-
-                print("\n")
-                print(header)
-                print(analysis_result)
-
-
-                filename = f"analyse_article_{article['number']}.txt"
-                file_content = f"{header}\n\n{analysis_result}"
-                save_analysis_to_file(filename, file_content)
-
-            continue
-
-        try:
-            choice = int(user_input)
-            selected_article = next((a for a in articles if a['number'] == choice), None)
-
-            if selected_article:
-                analysis_result = analyze_article(selected_article)
-                header = f"result of the article {selected_article['number']}: {selected_article['title']}"
-
-                print("\n")
-                print(header)
-                print(analysis_result)
-
-                filename = f"analyse_article_{selected_article['number']}.txt"
-                file_content = f"{header}\n\n{analysis_result}"
-                save_analysis_to_file(filename, file_content)
-            else:
-                print(f"no valid number")
-
-        except ValueError:
-            print("no valid input")
+    # Ligne de commande de jobs.py : python llm.py [--articles 1-50] [--workers 4] [--list] [--status]
+    import jobs
 
-    print("end")
+    jobs.main()
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Backends d'extraction PDF interchangeables : PyMuPDF (fitz), pdfplumber, PyPDF2.
+
+Chaque backend ouvre un document qui expose page_count et page_text(index).
+Le benchmark mesure pages/s et similarité du texte avec le backend de
+référence (pdfplumber), et la sélection auto garde, pour chaque PDF, le
+backend le plus rapide dont la sortie reste au-dessus de QUALITY_TOLERANCE.
+Sans la référence, rien n'est comparé : la sélection auto prévient et prend
+le premier backend installé de FALLBACK_ORDER.
+
+    python pdf_backends.py [fichiers.pdf ...]
+"""
+
+import difflib
+import glob
+import importlib.util
+import os
+import sys
+import time
+
+REFERENCE_BACKEND = "pdfplumber"   # Le plus fidèle à la mise en page
+FALLBACK_ORDER = ["PyPDF2", "pymupdf"]  # Sans référence : l'ancienne alternative à pdfplumber d'abord
+QUALITY_TOLERANCE = 0.90           # Similarité minimale avec la référence
+SAMPLE_PAGES = 12                  # Pages échantillonnées par PDF pour la sélection
+DEFAULT_PDF_DIR = "climate_pdfs_quality"
+
+
+class PdfBackend:
+    name = None
+    module = None
+
+    def is_available(self):
+        return importlib.util.find_spec(self.module) is not None
+
+    def open(self, pdf_path):
+        raise NotImplementedError
+
+
+class _Document:
+    """Document ouvert : page_count et page_text(index) -> str, fermé par close()."""
+
+    def __init__(self, handle, page_count, page_text):
+        self.handle = handle
+        self.page_count = page_count
+        self.page_text = page_text
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.handle.close()
+
+
+class PyMuPDFBackend(PdfBackend):
+    name = "pymupdf"
+    module = "fitz"
+
+    def open(self, pdf_path):
+        import fitz
+
+        doc = fitz.open(pdf_path)
+        return _Document(doc, len(doc), lambda index: doc.load_page(index).get_text("text"))
+
+
+class PdfplumberBackend(PdfBackend):
+    name = "pdfplumber"
+    module = "pdfplumber"
+
+    def open(self, pdf_path):
+        import pdfplumber
+
+        pdf = pdfplumber.open(pdf_path)
+
+        def page_text(index):
+            page = pdf.pages[index]
+            try:
+                return page.extract_text()
+            finally:
+                page.close()  # Libère le cache de la page
+
+        return _Document(pdf, len(pdf.pages), page_text)
+
+
+class PyPDF2Backend(PdfBackend):
+    name = "PyPDF2"
+    module = "PyPDF2"
+
+    def open(self, pdf_path):
+        import PyPDF2
+
+        file = open(pdf_path, 'rb')
+        reader = PyPDF2.PdfReader(file)
+        return _Document(file, len(reader.pages), lambda index: reader.pages[index].extract_text())
+
+
+BACKENDS = {backend.name: backend for backend in (PyMuPDFBackend(), PdfplumberBackend(), PyPDF2Backend())}
+
+
+def get_backend(name):
+    try:
+        backend = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"backend PDF inconnu: {name} (choix: {', '.join(BACKENDS)})")
+    if not backend.is_available():
+        raise ImportError(f"{backend.module} non installé pour le backend {name}")
+    return backend
+
+
+def available_backends():
+    return [backend for backend in BACKENDS.values() if backend.is_available()]
+
+
+def reference_backend():
+    backend = BACKENDS[REFERENCE_BACKEND]
+    return backend if backend.is_available() else None
+
+
+def fallback_backend():
+    for name in FALLBACK_ORDER:
+        if BACKENDS[name].is_available():
+            return name
+    raise ImportError(f"aucun backend PDF installé ({', '.join(BACKENDS)})")
+
+
+def sample_indices(page_count, sample_pages=SAMPLE_PAGES):
+    if page_count <= sample_pages:
+        return list(range(page_count))
+    step = page_count / sample_pages
+    return [int(i * step) for i in range(sample_pages)]
+
+
+def text_similarity(reference, candidate):
+    """Ratio difflib sur les séquences de mots (1.0 = même texte, même ordre)."""
+    reference_words = (reference or "").split()
+    candidate_words = (candidate or "").split()
+    if not reference_words and not candidate_words:
+        return 1.0
+    return difflib.SequenceMatcher(None, reference_words, candidate_words, autojunk=False).ratio()
+
+
+def measure_backend(backend, pdf_path, indices):
+    """Retourne (pages/s, textes des pages) sur les pages indices, ouverture comprise."""
+    start = time.perf_counter()
+    texts = []
+    with backend.open(pdf_path) as document:
+        for index in indices:
+            try:
+                texts.append(document.page_text(index))
+            except Exception:
+                texts.append("")
+    elapsed = time.perf_counter() - start
+    return len(indices) / elapsed if elapsed > 0 else float('inf'), texts
+
+
+def benchmark_pdf(pdf_path, backends=None, sample_pages=SAMPLE_PAGES):
+    """Mesure chaque backend sur un échantillon de pages du PDF.
+
+    Retourne {nom: {'pages_per_sec': ..., 'similarity': ...}} ; similarity est
+    None pour tous si la référence n'est pas installée (rien à comparer).
+    """
+    backends = backends or available_backends()
+    reference = reference_backend()
+    with (reference or backends[0]).open(pdf_path) as document:
+        indices = sample_indices(document.page_count, sample_pages)
+
+    results = {}
+    reference_texts = None
+    if reference is not None:
+        reference_speed, reference_texts = measure_backend(reference, pdf_path, indices)
+        results[reference.name] = {'pages_per_sec': reference_speed, 'similarity': 1.0}
+    for backend in backends:
+        if backend.name in results:
+            continue
+        speed, texts = measure_backend(backend, pdf_path, indices)
+        similarity = None
+        if reference_texts is not None:
+            similarities = [text_similarity(ref, text) for ref, text in zip(reference_texts, texts)]
+            similarity = sum(similarities) / len(similarities) if similarities else 1.0
+        results[backend.name] = {'pages_per_sec': speed, 'similarity': similarity}
+    return results
+
+
+def choose_backend(results, tolerance=QUALITY_TOLERANCE):
+    """Backend le plus rapide dont la similarité avec la référence est >= tolerance ; None sans référence."""
+    eligible = [name for name, result in results.items()
+                if result['similarity'] is not None and result['similarity'] >= tolerance]
+    if not eligible:
+        return None
+    return max(eligible, key=lambda name: results[name]['pages_per_sec'])
+
+
+def select_backend(pdf_path, sha256, selections, tolerance=QUALITY_TOLERANCE):
+    """Sélection auto pour un PDF, mémorisée dans selections (clé : SHA-256 du PDF).
+
+    Sans la référence, rien ne valide un choix : FALLBACK_ORDER, non mémorisé.
+    """
+    if reference_backend() is None:
+        fallback = fallback_backend()
+        print(f"⚠️  {REFERENCE_BACKEND} non installé : pas de sélection auto, {fallback} utilisé pour "
+              f"{os.path.basename(pdf_path)}")
+        return fallback
+    key = f"{sha256}:{tolerance}"
+    if key not in selections:
+        results = benchmark_pdf(pdf_path)
+        selections[key] = {'backend': choose_backend(results, tolerance), 'results': results}
+    return selections[key]['backend']
+
+
+def main():
+    pdf_files = sys.argv[1:] or sorted(glob.glob(os.path.join(DEFAULT_PDF_DIR, "*.pdf")))
+    if not pdf_files:
+        print(f"❌ Aucun PDF trouvé dans {DEFAULT_PDF_DIR}")
+        return
+
+    backends = available_backends()
+    missing = [name for name, backend in BACKENDS.items() if backend not in backends]
+    print("⏱️  BENCHMARK DES BACKENDS PDF")
+    print(f"🔧 Disponibles: {', '.join(b.name for b in backends)}"
+          + (f" | absents: {', '.join(missing)}" if missing else ""))
+    print(f"📏 Référence: {REFERENCE_BACKEND}, tolérance de similarité: {QUALITY_TOLERANCE}")
+    print("=" * 60)
+
+    for pdf_path in pdf_files:
+        results = benchmark_pdf(pdf_path, backends)
+        print(f"\n📄 {os.path.basename(pdf_path)}")
+        for name, result in sorted(results.items(), key=lambda item: -item[1]['pages_per_sec']):
+            similarity = "-" if result['similarity'] is None else f"{result['similarity']:.3f}"
+            print(f"   {name:<12} {result['pages_per_sec']:8.1f} pages/s   similarité {similarity}")
+        chosen = choose_backend(results)
+        print(f"   ➜ choix auto: {chosen}" if chosen else
+              f"   ➜ pas de référence ({REFERENCE_BACKEND}) : {fallback_backend()} par défaut")
+
+
+if __name__ == "__main__":
+    main()
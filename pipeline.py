@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+Orchestrateur du pipeline : scrape / download -> extract -> chunk -> dedupe -> embed -> index
+(+ dedupe -> lexical : index BM25, en parallèle de l'embedding).
+
+Chaque étape est un script lancé en sous-processus. Son empreinte combine le
+code des modules qu'elle utilise, sa ligne de commande et le contenu de ses
+entrées (sorties des étapes amont) ; une étape n'est relancée que si son
+empreinte a changé ou si ses sorties ont bougé. Une étape relancée qui
+produit exactement les mêmes sorties ne relance pas l'aval (early cutoff).
+Les branches indépendantes (scraping web, PDFs) tournent en parallèle.
+
+    python pipeline.py run [étapes ...] [--force] [--refresh] [--dry-run]
+
+Les étapes réseau (scrape, download) ne vont sur Internet qu'au premier
+lancement ou avec --refresh ; sinon elles se reconstruisent depuis le raw
+store (--offline), ce qui suffit quand seul le code a changé.
+"""
+
+import argparse
+import fnmatch
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+STATE_FILE = ".pipeline_state.json"
+
+# outputs : (chemin, motif) ; un dossier est haché sur ses fichiers qui matchent le motif
+STAGES = {
+    "scrape": {
+        "cmd": ["climate_scraper.py"],
+        "offline": ["--offline"],
+        "code": ["climate_scraper.py", "text_cleaning.py", "raw_store.py"],
+        "deps": [],
+        "inputs": [("data_climate.pdf", None)],  # Les URL sont dans le code de climate_scraper.py
+        "outputs": [("climate_facts_content", "*.txt")],
+    },
+    "download": {
+        "cmd": ["download_from_sources.py"],
+        "offline": ["--offline"],
+        "code": ["download_from_sources.py", "raw_store.py"],
+        "deps": [],
+        "inputs": [("sources.txt", None)],
+        "outputs": [("climate_pdfs_quality", "*.pdf")],
+    },
+    "extract": {
+        "cmd": ["extract_pdf_text.py"],
+        "code": ["extract_pdf_text.py", "pdf_backends.py", "text_cleaning.py", "raw_store.py"],
+        "deps": ["download"],
+        "inputs": [],
+        "outputs": [("climate_facts_content_from_pdfs", "*.txt")],
+    },
+    "chunk": {
+        "cmd": ["chunking.py"],
+        "code": ["chunking.py"],
+        "deps": ["scrape", "extract"],
+        "inputs": [],
+        "outputs": [("climate_chunks_data.jsonl", None)],
+    },
+    "dedupe": {
+        "cmd": ["dedupe.py"],
+        "code": ["dedupe.py", "chunking.py"],
+        "deps": ["chunk"],
+        "inputs": [],
+        "outputs": [("climate_chunks_dedup.jsonl", None)],
+    },
+    "embed": {
+        "cmd": ["embeddings_simple.py"],
+        "code": ["embeddings_simple.py", "chunking.py", "artifacts.py", "embedding_cache.py",
+                 "embedding_backends.py"],
+        "deps": ["dedupe"],
+        "inputs": [],
+        # Vecteurs, offsets et chunks seulement : meta.json change (created_at) à chaque run
+        "outputs": [("climate_embeddings", "*.npy"), ("climate_embeddings", "chunks.jsonl")],
+    },
+    "lexical": {
+        "cmd": ["bm25_index.py", "build"],
+        "code": ["bm25_index.py"],
+        "deps": ["dedupe"],
+        "inputs": [],
+        "outputs": [("climate_bm25", None)],
+    },
+    "index": {
+        "cmd": ["vectorstore.py"],
+        "code": ["vectorstore.py", "artifacts.py"],
+        "deps": ["embed"],
+        "inputs": [],
+        "outputs": [("chroma_db_climate_facts", None)],
+        "hash_outputs": False,  # Chroma réécrit sa base même en lecture (llm.py) : présence seulement
+    },
+}
+
+
+def load_state():
+    if os.path.exists(STATE_FILE):
+        with open(STATE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {"stages": {}, "hashes": {}}
+
+
+def save_state(state):
+    tmp_path = STATE_FILE + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, STATE_FILE)
+
+
+def file_hash(path, known_hashes):
+    """SHA-256 d'un fichier, recalculé seulement si sa taille ou sa date ont changé."""
+    stat = os.stat(path)
+    known = known_hashes.get(path)
+    if known and known['size'] == stat.st_size and known['mtime_ns'] == stat.st_mtime_ns:
+        return known['sha256']
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    known_hashes[path] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest.hexdigest()}
+    return digest.hexdigest()
+
+
+def artifact_hash(path, pattern, known_hashes):
+    """Empreinte d'un fichier ou d'un dossier (chemins relatifs + contenus), None s'il n'existe pas."""
+    if not os.path.exists(path):
+        return None
+    if os.path.isfile(path):
+        return file_hash(path, known_hashes)
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            if pattern and not fnmatch.fnmatch(name, pattern):
+                continue
+            filepath = os.path.join(root, name)
+            digest.update(os.path.relpath(filepath, path).encode('utf-8') + b'\0')
+            digest.update(file_hash(filepath, known_hashes).encode('ascii'))
+    return digest.hexdigest()
+
+
+def outputs_hash(name, state):
+    """Empreinte des sorties d'une étape, None si l'une d'elles manque."""
+    if not STAGES[name].get("hash_outputs", True):
+        return "present" if all(os.path.exists(path) for path, _ in STAGES[name]["outputs"]) else None
+    hashes = [artifact_hash(path, pattern, state["hashes"]) for path, pattern in STAGES[name]["outputs"]]
+    if any(h is None for h in hashes):
+        return None
+    return hashlib.sha256(json.dumps(hashes).encode('utf-8')).hexdigest()
+
+
+def fingerprint(name, state, outputs):
+    """Empreinte des entrées d'une étape : code, commande, sorties amont, fichiers d'entrée."""
+    stage = STAGES[name]
+    inputs = {
+        "code": {path: artifact_hash(path, None, state["hashes"]) for path in stage["code"]},
+        "cmd": stage["cmd"],
+        "deps": {dep: outputs.get(dep) for dep in stage["deps"]},
+        "inputs": {path: artifact_hash(path, pattern, state["hashes"]) for path, pattern in stage["inputs"]},
+    }
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def with_ancestors(targets):
+    selected = set()
+    pending = list(targets)
+    while pending:
+        name = pending.pop()
+        if name not in selected:
+            selected.add(name)
+            pending.extend(STAGES[name]["deps"])
+    return [name for name in STAGES if name in selected]  # STAGES est dans l'ordre topologique
+
+
+def command_for(name, state, refresh):
+    stage = STAGES[name]
+    cmd = [sys.executable] + stage["cmd"]
+    if "offline" in stage and not refresh and name in state["stages"]:
+        cmd += stage["offline"]
+    return cmd
+
+
+def run_stage(name, cmd):
+    """Lance une étape ; sa sortie est préfixée par son nom (les branches s'entrelacent)."""
+    start_time = time.time()
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                               text=True, encoding='utf-8', errors='replace', bufsize=1,
+                               env=dict(os.environ, PYTHONUNBUFFERED="1"))
+    for line in process.stdout:
+        print(f"[{name}] {line}", end='', flush=True)
+    return process.wait(), time.time() - start_time
+
+
+def stale_reason(name, state, outputs, force, refresh):
+    """Pourquoi une étape doit tourner, ou None si elle est à jour."""
+    previous = state["stages"].get(name)
+    if force:
+        return "forced"
+    if refresh and "offline" in STAGES[name]:
+        return "refresh"
+    if previous is None:
+        return "never run"
+    if previous["fingerprint"] != fingerprint(name, state, outputs):
+        return "inputs changed"
+    if previous["outputs"] != outputs_hash(name, state):
+        return "outputs missing or modified"
+    return None
+
+
+def dry_run(names, state, force, refresh):
+    outputs = {name: entry["outputs"] for name, entry in state["stages"].items()}
+    stale = set()
+    for name in names:
+        reason = stale_reason(name, state, outputs, force, refresh)
+        upstream = [dep for dep in STAGES[name]["deps"] if dep in stale]
+        if reason:
+            stale.add(name)
+            print(f"  {name:<9} would run ({reason}): {' '.join(command_for(name, state, refresh)[1:])}")
+        elif upstream:
+            stale.add(name)
+            print(f"  {name:<9} would run if the outputs of {', '.join(upstream)} change")
+        else:
+            print(f"  {name:<9} up to date")
+
+
+def run_pipeline(targets=None, force=False, refresh=False, dry=False):
+    names = with_ancestors(targets or list(STAGES))
+    state = load_state()
+    if dry:
+        dry_run(names, state, force, refresh)
+        return True
+
+    outputs = {}  # Empreinte des sorties de chaque étape terminée ou à jour
+    status = {}
+    running = {}
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=len(names)) as pool:
+        while len(status) < len(names):
+            for name in names:
+                if name in status or name in running:
+                    continue
+                deps = STAGES[name]["deps"]
+                if any(dep not in status for dep in deps):
+                    continue
+                if any(status[dep] in ("failed", "blocked") for dep in deps):
+                    status[name] = "blocked"
+                    print(f"  {name}: blocked by a failed upstream stage")
+                    continue
+                reason = stale_reason(name, state, outputs, force, refresh)
+                if reason is None:
+                    status[name] = "up to date"
+                    outputs[name] = state["stages"][name]["outputs"]
+                    print(f"  {name}: up to date")
+                    continue
+                cmd = command_for(name, state, refresh)
+                print(f"  {name}: running ({reason}): {' '.join(cmd[1:])}")
+                running[name] = (pool.submit(run_stage, name, cmd), fingerprint(name, state, outputs))
+
+            if not running:
+                continue
+            finished, _ = wait([future for future, _ in running.values()], return_when=FIRST_COMPLETED)
+            for name in [name for name, (future, _) in running.items() if future in finished]:
+                future, stage_fingerprint = running.pop(name)
+                returncode, elapsed = future.result()
+                new_outputs = outputs_hash(name, state)
+                if returncode != 0 or new_outputs is None:
+                    status[name] = "failed"
+                    print(f"  {name}: failed (exit code {returncode}) after {elapsed:.1f}s")
+                    continue
+                previous = state["stages"].get(name)
+                unchanged = previous is not None and previous["outputs"] == new_outputs
+                status[name] = "unchanged" if unchanged else "rebuilt"
+                outputs[name] = new_outputs
+                state["stages"][name] = {"fingerprint": stage_fingerprint, "outputs": new_outputs,
+                                         "elapsed": round(elapsed, 1), "finished_at": time.time()}
+                save_state(state)
+                print(f"  {name}: done in {elapsed:.1f}s" + (" (same outputs, downstream kept)" if unchanged else ""))
+
+    save_state(state)
+    print(f"\npipeline finished in {time.time() - start_time:.1f}s")
+    for name in names:
+        print(f"  {name:<9} {status[name]}")
+    return all(status[name] not in ("failed", "blocked") for name in names)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the fact-checking data pipeline, skipping up-to-date stages.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run_parser = subparsers.add_parser("run", help="run the stale stages (and what depends on them)")
+    run_parser.add_argument("stages", nargs="*", metavar="stage",
+                            help=f"{', '.join(STAGES)}: stages to bring up to date, with their upstream stages (default: all)")
+    run_parser.add_argument("--force", action="store_true", help="run the selected stages even if up to date")
+    run_parser.add_argument("--refresh", action="store_true",
+                            help="fetch scrape/download sources from the network again")
+    run_parser.add_argument("--dry-run", action="store_true", help="only show what would run")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.stages if name not in STAGES]
+    if unknown:
+        parser.error(f"unknown stage(s): {', '.join(unknown)}")
+    if not run_pipeline(args.stages, args.force, args.refresh, args.dry_run):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Cache des résultats de recherche : LRU en mémoire devant une table SQLite.
+
+Clé : (SHA-256 de la requête, modèle d'embedding, version de l'index, k, mode
+de recherche) ; valeur : les chunks retrouvés, en JSON. La version de l'index
+change quand l'artefact est réécrit ou quand vectorstore.py modifie la
+collection Chroma : les anciennes entrées ne sont plus jamais lues, et sont
+supprimées à l'ouverture du cache. Réanalyser un article (changement de
+prompt, mode 'all' relancé) ne refait ni l'embedding ni la recherche.
+
+    python query_cache.py     statistiques du cache
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+
+CACHE_FILE = "query_cache.sqlite"
+MEMORY_ENTRIES = 256
+
+
+class QueryCache:
+    """Résultats d'un couple (modèle, mode) pour une version d'index ; hits mémoire / disque comptés."""
+
+    def __init__(self, model_name, mode, index_version, path=CACHE_FILE, memory_entries=MEMORY_ENTRIES):
+        self.model_name = model_name
+        self.mode = mode
+        self.index_version = index_version
+        self.path = path
+        self.memory_entries = memory_entries
+        self.memory = OrderedDict()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS results (
+            key TEXT PRIMARY KEY, model TEXT NOT NULL, mode TEXT NOT NULL, index_version TEXT NOT NULL,
+            k INTEGER NOT NULL, value TEXT NOT NULL, created_at REAL NOT NULL)""")
+        # Entrées d'une version précédente de l'index : plus jamais lues
+        self.connection.execute("DELETE FROM results WHERE model = ? AND mode = ? AND index_version != ?",
+                                (model_name, mode, index_version))
+        self.connection.commit()
+
+    def key(self, query, k):
+        query_hash = hashlib.sha256(query.encode('utf-8')).hexdigest()
+        payload = json.dumps([query_hash, self.model_name, self.index_version, k, self.mode])
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, query, k):
+        """Résultat en cache pour (query, k), None sinon."""
+        key = self.key(query, k)
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            self.memory_hits += 1
+            return self.memory[key]
+        row = self.connection.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.disk_hits += 1
+        value = json.loads(row[0])
+        self._remember(key, value)
+        return value
+
+    def put(self, query, k, value):
+        key = self.key(query, k)
+        self.connection.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                (key, self.model_name, self.mode, self.index_version, k,
+                                 json.dumps(value, ensure_ascii=False), time.time()))
+        self.connection.commit()
+        self._remember(key, value)
+
+    def get_or_compute(self, query, k, compute):
+        """Résultat en cache, sinon compute() (appelée seulement en cas d'absence) mis en cache."""
+        value = self.get(query, k)
+        if value is None:
+            value = compute()
+            self.put(query, k, value)
+        return value
+
+    def _remember(self, key, value):
+        self.memory[key] = value
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+    def summary(self):
+        total = self.memory_hits + self.disk_hits + self.misses
+        hits = self.memory_hits + self.disk_hits
+        return (f"query cache: {self.memory_hits} memory hit(s), {self.disk_hits} disk hit(s), "
+                f"{self.misses} miss(es) ({hits / total if total else 0:.0%} hits)")
+
+    def close(self):
+        self.connection.close()
+
+
+def main():
+    if not os.path.exists(CACHE_FILE):
+        print(f"❌ Pas de cache: {CACHE_FILE}")
+        return
+    connection = sqlite3.connect(CACHE_FILE)
+    print(f"📦 {CACHE_FILE}: {os.path.getsize(CACHE_FILE) / (1024 * 1024):.1f} MB")
+    for model, mode, index_version, count in connection.execute(
+            "SELECT model, mode, index_version, COUNT(*) FROM results GROUP BY model, mode, index_version"):
+        print(f"   {model} [{mode}] index {index_version}: {count} résultats")
+    connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Store local des réponses HTTP brutes (pages HTML, PDFs), adressé par contenu.
+
+Les corps sont rangés sous objects/<sha[:2]>/<sha256>, et index.json associe
+chaque URL à son objet et à ses validateurs (ETag / Last-Modified) pour que le
+prochain fetch soit conditionnel (If-None-Match / If-Modified-Since -> 304).
+Le nettoyage en aval peut ainsi être rejoué hors ligne depuis le store.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from email.utils import formatdate
+
+RAW_STORE_DIR = "raw_store"
+INDEX_FILE = "index.json"
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def link_or_copy(src, dst):
+    """Hard-link src to dst (no extra disk space), copy if the filesystem refuses."""
+    if os.path.exists(dst) and os.path.samefile(src, dst):
+        return
+    tmp_path = dst + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    try:
+        os.link(src, tmp_path)
+    except OSError:
+        shutil.copyfile(src, tmp_path)
+    os.replace(tmp_path, dst)
+
+
+class RawStore:
+    def __init__(self, root=RAW_STORE_DIR):
+        self.root = root
+        self.index_path = os.path.join(root, INDEX_FILE)
+        self.lock = threading.Lock()
+        os.makedirs(os.path.join(root, 'objects'), exist_ok=True)
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                self.index = json.load(f)
+        else:
+            self.index = {}
+
+    def object_path(self, sha256):
+        return os.path.join(self.root, 'objects', sha256[:2], sha256)
+
+    def entry(self, url):
+        entry = self.index.get(url)
+        if entry and os.path.exists(self.object_path(entry['sha256'])):
+            return entry
+        return None
+
+    def conditional_headers(self, url):
+        entry = self.entry(url)
+        headers = {}
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def read(self, url):
+        entry = self.entry(url)
+        if entry is None:
+            return None
+        with open(self.object_path(entry['sha256']), 'rb') as f:
+            return f.read()
+
+    def put(self, url, body, headers):
+        """Store a full (200) response body and its validators. Returns the sha256."""
+        sha256 = hashlib.sha256(body).hexdigest()
+        path = self.object_path(sha256)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(body)
+            os.replace(tmp_path, path)
+        self._record(url, sha256, len(body), headers)
+        return sha256
+
+    def put_file(self, url, filepath, headers, sha256=None):
+        """Store a downloaded file without reading it in memory; filepath becomes a link to the object."""
+        sha256 = sha256 or sha256_file(filepath)
+        path = self.object_path(sha256)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            link_or_copy(filepath, path)
+        link_or_copy(path, filepath)
+        self._record(url, sha256, os.path.getsize(path), headers)
+        return sha256
+
+    def touch(self, url):
+        """Record a 304: the stored object is still current."""
+        with self.lock:
+            self.index[url]['checked_at'] = formatdate(time.time(), usegmt=True)
+            self._save()
+
+    def materialize(self, url, filepath):
+        """Restore the stored body of url at filepath (offline mode)."""
+        entry = self.entry(url)
+        if entry is None:
+            return False
+        link_or_copy(self.object_path(entry['sha256']), filepath)
+        return True
+
+    def _record(self, url, sha256, size, headers):
+        now = formatdate(time.time(), usegmt=True)
+        with self.lock:
+            self.index[url] = {
+                'sha256': sha256,
+                'size': size,
+                'etag': headers.get('ETag'),
+                'last_modified': headers.get('Last-Modified'),
+                'content_type': headers.get('Content-Type'),
+                'fetched_at': now,
+                'checked_at': now,
+            }
+            self._save()
+
+    def _save(self):
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.index, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.index_path)
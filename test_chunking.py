@@ -0,0 +1,67 @@
+"""Découpage en mode "tokens" de chunking.py sur du texte coupé à largeur fixe."""
+
+import random
+import textwrap
+
+import pytest
+
+import chunking
+
+WORDS = ("warming ocean ice sheet emissions carbon budget scenario temperature sea level rise "
+         "glacier heat drought rainfall aerosol methane").split()
+
+
+class WordCounter:
+    """Un token par mot : assez pour vérifier où tombent les coupures."""
+
+    def lengths(self, texts):
+        return [len(text.split()) for text in texts]
+
+
+@pytest.fixture
+def word_tokens(monkeypatch):
+    monkeypatch.setitem(chunking._token_counters, "embedding", WordCounter())
+
+
+def make_sentences(count, seed=0):
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 18))).capitalize() + "."
+            for _ in range(count)]
+
+
+def write_wrapped(path, sentences, width=60):
+    """Paragraphes de quelques phrases, coupés à width colonnes comme une extraction PDF."""
+    paragraphs = [" ".join(sentences[i:i + 5]) for i in range(0, len(sentences), 5)]
+    path.write_text("\n\n".join(textwrap.fill(paragraph, width) for paragraph in paragraphs) + "\n",
+                    encoding="utf-8")
+
+
+def test_wrapped_text_is_chunked_on_sentence_boundaries(tmp_path, word_tokens):
+    sentences = make_sentences(300)
+    path = tmp_path / "wrapped.txt"
+    write_wrapped(path, sentences)
+    config = chunking.chunker_config("tokens", "embedding", tokens_per_chunk=40, token_overlap=10)
+
+    chunks = list(chunking.iter_file_chunks(str(path), config))
+
+    known = set(sentences)
+    assert len(chunks) > 1
+    for chunk in chunks:
+        # Chaque chunk est une suite de phrases entières : ni début ni fin au milieu d'une phrase
+        pieces = chunking.SENTENCE_BOUNDARY.split(chunk.replace("\n", " "))
+        assert all(piece in known for piece in pieces), chunk
+        assert sum(WordCounter().lengths(pieces)) <= 40
+    covered = {piece for chunk in chunks for piece in chunking.SENTENCE_BOUNDARY.split(chunk.replace("\n", " "))}
+    assert covered == known
+
+
+def test_paragraphs_join_wrapped_lines(tmp_path):
+    path = tmp_path / "text.txt"
+    path.write_text("First line of a\nwrapped sentence. Second\nsentence ends here.\nNew paragraph\n\nAfter blank\n",
+                    encoding="utf-8")
+
+    assert list(chunking.iter_paragraphs(str(path))) == [
+        "First line of a wrapped sentence. Second sentence ends here.",
+        "New paragraph",
+        "After blank",
+    ]
@@ -0,0 +1,162 @@
+"""Téléchargements reprenables de download_from_sources.py contre un http.server local."""
+
+import hashlib
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import download_from_sources as dl
+from raw_store import RawStore
+
+PAYLOAD = os.urandom(300 * 1024)  # Au-dessus du seuil "fichier très petit" de download_pdf
+ETAG = '"v1"'
+
+
+class PdfHandler(BaseHTTPRequestHandler):
+    """Sert PAYLOAD avec ETag ; Range et coupure de connexion selon server.options."""
+
+    def do_GET(self):
+        options = self.server.options
+        self.server.requests.append(dict(self.headers))
+        if self.headers.get('If-None-Match') == ETAG:
+            self.send_response(304)
+            self.end_headers()
+            return
+        range_header = self.headers.get('Range')
+        if_range = self.headers.get('If-Range')
+        if range_header and options['ranges'] and if_range in (None, ETAG):
+            start = int(range_header[len('bytes='):].rstrip('-'))
+            body = PAYLOAD[start:]
+            self.send_response(206)
+            self.send_header('Content-Range', f"bytes {start}-{len(PAYLOAD) - 1}/{len(PAYLOAD)}")
+        else:
+            body = PAYLOAD
+            self.send_response(200)
+        self.send_header('Content-Type', 'application/pdf')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', ETAG)
+        self.end_headers()
+        if options['cut_after']:
+            # Coupe la connexion au milieu du corps, une seule fois
+            cut, options['cut_after'] = options['cut_after'], None
+            self.wfile.write(body[:cut])
+            self.wfile.flush()
+            self.connection.close()
+            return
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), PdfHandler)
+    httpd.options = {'ranges': True, 'cut_after': None}
+    httpd.requests = []
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(dl.OUTPUT_DIR)
+    monkeypatch.setattr(dl, 'DELAY_BETWEEN_DOWNLOADS', 0)
+    monkeypatch.setattr(dl, 'DOWNLOAD_CHUNK_SIZE', 16 * 1024)
+    monkeypatch.setattr(dl.time, 'sleep', lambda seconds: None)
+    return tmp_path
+
+
+def pdf_url(server):
+    return f"http://127.0.0.1:{server.server_address[1]}/report.pdf"
+
+
+def write_part(url, data, etag=ETAG):
+    part_path = os.path.join(dl.OUTPUT_DIR, dl.get_filename_from_url(url)) + '.part'
+    with open(part_path, 'wb') as f:
+        f.write(data)
+    with open(part_path + '.json', 'w', encoding='utf-8') as f:
+        json.dump({'etag': etag, 'last_modified': None}, f)
+    return part_path
+
+
+def downloaded(url):
+    with open(os.path.join(dl.OUTPUT_DIR, dl.get_filename_from_url(url)), 'rb') as f:
+        return f.read()
+
+
+def test_resumes_part_with_range(server, workdir):
+    url = pdf_url(server)
+    part_path = write_part(url, PAYLOAD[:100 * 1024])
+
+    success, _, _ = dl.download_pdf(url, store=RawStore('raw'))
+
+    assert success
+    assert server.requests[-1]['Range'] == f"bytes={100 * 1024}-"
+    assert downloaded(url) == PAYLOAD
+    assert not os.path.exists(part_path)
+
+
+def test_resume_after_truncated_transfer(server, workdir):
+    url = pdf_url(server)
+    server.options['cut_after'] = 120 * 1024
+
+    success, _, _ = dl.download_pdf(url, store=RawStore('raw'))
+
+    assert success
+    assert len(server.requests) == 2
+    assert server.requests[1]['Range'].startswith('bytes=')
+    assert server.requests[1]['Range'] != 'bytes=0-'
+    assert downloaded(url) == PAYLOAD
+
+
+@pytest.mark.parametrize('ranges, etag', [(False, ETAG), (True, '"stale"')])
+def test_full_response_to_range_rewrites_part(server, workdir, ranges, etag):
+    """Serveur sans Range, ou If-Range périmé : le 200 remplace le .part au lieu de s'y ajouter."""
+    url = pdf_url(server)
+    server.options['ranges'] = ranges
+    write_part(url, b'x' * (100 * 1024), etag=etag)
+
+    success, _, _ = dl.download_pdf(url, store=RawStore('raw'))
+
+    assert success
+    assert 'Range' in server.requests[-1]
+    assert downloaded(url) == PAYLOAD
+
+
+def test_expected_sha256_mismatch_discards_part(server, workdir):
+    url = pdf_url(server)
+
+    success, _, _ = dl.download_pdf(url, max_retries=2, store=RawStore('raw'), expected_sha256='0' * 64)
+
+    assert not success
+    assert os.listdir(dl.OUTPUT_DIR) == []
+    assert dl.load_manifest() == {}
+
+
+def test_verified_file_costs_a_304(server, workdir):
+    url = pdf_url(server)
+    store = RawStore('raw')
+    expected = hashlib.sha256(PAYLOAD).hexdigest()
+    assert dl.download_pdf(url, store=store, expected_sha256=expected)[0]
+
+    success, _, _ = dl.download_pdf(url, store=store, expected_sha256=expected)
+
+    assert success
+    assert server.requests[-1].get('If-None-Match') == ETAG
+    assert dl.load_manifest()[dl.get_filename_from_url(url)]['sha256'] == expected
+
+
+def test_sources_file_pins(workdir, monkeypatch):
+    with open('sources.txt', 'w', encoding='utf-8') as f:
+        f.write("# commentaire\nhttps://a.example/a.pdf\nhttps://b.example/b.pdf sha256=ABCD\nftp://skip\n")
+    monkeypatch.setattr(dl, 'SOURCES_FILE', 'sources.txt')
+
+    assert dl.read_sources_file() == {'https://a.example/a.pdf': None, 'https://b.example/b.pdf': 'abcd'}
@@ -0,0 +1,71 @@
+"""Sélection auto des backends PDF de pdf_backends.py, avec des backends factices."""
+
+import pytest
+
+import pdf_backends
+from pdf_backends import PdfBackend, _Document
+
+PAGES = ["Global surface temperature was 1.1 degrees higher.", "Sea level rise is accelerating."]
+
+
+class FakeBackend(PdfBackend):
+    def __init__(self, name, pages, available=True):
+        self.name = name
+        self.pages = pages
+        self.available = available
+        self.opened = 0
+
+    def is_available(self):
+        return self.available
+
+    def open(self, pdf_path):
+        self.opened += 1
+        return _Document(self, len(self.pages), lambda index: self.pages[index])
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def backends(monkeypatch):
+    fakes = {
+        "pymupdf": FakeBackend("pymupdf", ["garbled"] * len(PAGES)),
+        "pdfplumber": FakeBackend("pdfplumber", PAGES),
+        "PyPDF2": FakeBackend("PyPDF2", PAGES),
+    }
+    monkeypatch.setattr(pdf_backends, "BACKENDS", fakes)
+    return fakes
+
+
+def test_auto_selection_compares_with_the_reference(backends):
+    selections = {}
+
+    chosen = pdf_backends.select_backend("doc.pdf", "sha", selections)
+
+    # pymupdf est mesuré mais sa sortie diffère de la référence : il n'est pas retenu
+    assert chosen in ("pdfplumber", "PyPDF2")
+    results = selections["sha:0.9"]["results"]
+    assert results["pymupdf"]["similarity"] < pdf_backends.QUALITY_TOLERANCE
+    assert results["PyPDF2"]["similarity"] == 1.0
+
+
+def test_missing_reference_falls_back_without_validating(backends, capsys):
+    backends["pdfplumber"].available = False
+    selections = {}
+
+    chosen = pdf_backends.select_backend("doc.pdf", "sha", selections)
+
+    assert chosen == pdf_backends.FALLBACK_ORDER[0]
+    assert selections == {}
+    assert "pdfplumber" in capsys.readouterr().out
+    assert backends["pymupdf"].opened == 0
+
+
+def test_benchmark_without_reference_reports_no_similarity(backends):
+    backends["pdfplumber"].available = False
+
+    results = pdf_backends.benchmark_pdf("doc.pdf")
+
+    assert set(results) == {"pymupdf", "PyPDF2"}
+    assert all(result["similarity"] is None for result in results.values())
+    assert pdf_backends.choose_backend(results) is None
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Moteur de nettoyage de texte partagé par climate_scraper.py et extract_pdf_text.py.
+
+Toutes les règles sont compilées une seule fois au chargement du module. Les
+règles qui testent une ligne entière sont fusionnées en une seule alternation,
+ce qui remplace les boucles Python de re.match par un seul appel en C par ligne.
+La sortie est identique octet par octet aux anciens nettoyeurs (voir
+bench_cleaning.py).
+"""
+
+import re
+
+# À incrémenter dès que la sortie d'un nettoyeur change (invalide les caches)
+CLEANER_VERSION = 1
+
+
+# --- clean_rag_text (pages web et PDF NAS) ---------------------------------
+
+_RAG_FLAGS = re.MULTILINE | re.IGNORECASE
+
+# Appliquées dans l'ordre : certaines règles traversent les fins de ligne
+# ([\s...]+, \s+), leur ordre relatif change donc le résultat. Seules les règles
+# consécutives qui matchent une ligne entière sans la dépasser sont fusionnées.
+RAG_RULES = [
+    re.compile(r'^(Figure|Table|Box|FAQ|Cross-Chapter Box|Cross-Working Group Box)[\s\d.A-Za-z,|:]+.*$', _RAG_FLAGS),
+    re.compile(r'\{[^{}]+\}', _RAG_FLAGS),
+    re.compile(
+        r'^(Open section|Downloads|Authors|Figures|How to cite|Expand all sections|View|Open figure|Copy|doi|Share on .*|Share via .*|Read more|Explore more)$'
+        r'|^(Coordinatin g Lead Authors:|Lead Authors:|Contri buting Authors:|Review Editors:|Chapter Scientists:|Contributing Authors:).*$'
+        r'|^This chapter should be cited as:.*$',
+        _RAG_FLAGS),
+    re.compile(r'^\d+\s+.{,100}$', _RAG_FLAGS),
+    re.compile(r'^(Executive Summary|Technical Summary|Summary for Policymakers|Frequently Asked Questions)$', _RAG_FLAGS),
+    re.compile(r'Copyright National Academy of Sciences\. All rights reserved\.', _RAG_FLAGS),
+    re.compile(r'EVIDENCE & CAUSES 2020', _RAG_FLAGS),
+    re.compile(r'CLIMATE CHANGE', _RAG_FLAGS),
+]
+_BLANK_LINES = re.compile(r'\n{2,}')
+
+
+def clean_rag_text(text):
+    for rule in RAG_RULES:
+        text = rule.sub('', text)
+
+    text = _BLANK_LINES.sub('\n', text)
+
+    return text.strip()
+
+
+def keep_long_lines(text, min_length=25):
+    """Garde les lignes (strippées) de plus de min_length caractères."""
+    return '\n'.join(line for line in (raw.strip() for raw in text.split('\n')) if len(line) > min_length)
+
+
+# --- filter_figure_sections (pages PDF) ------------------------------------
+
+FIGURE_KEYWORDS = [
+    'Figure', 'Fig.', 'Table', 'Box', 'Panel',
+    'Chart', 'Graph', 'Diagram', 'Map', 'Image'
+]
+# Un match par mot (séparé par des blancs) qui contient au moins un mot-clé ;
+# le lookbehind n'essaie le match qu'en début de mot
+_FIGURE_WORD = re.compile(r'(?<!\S)\S*?(?:' + '|'.join(map(re.escape, FIGURE_KEYWORDS)) + r')\S*')
+# Octets qui ne sont pas des lettres ASCII : en UTF-8, a-zA-Z ne sont codés que par eux-mêmes
+_NON_ALPHA_BYTES = bytes(b for b in range(256) if not (65 <= b <= 90 or 97 <= b <= 122))
+
+
+def count_ascii_letters(text):
+    """Équivalent rapide de len(re.sub(r'[^a-zA-Z]', '', text))."""
+    return len(text.encode('utf-8', 'surrogatepass').translate(None, _NON_ALPHA_BYTES))
+
+
+def filter_figure_sections(text):
+    """Filtre les sections entières dédiées aux figures et tableaux."""
+    filtered_paragraphs = []
+
+    for paragraph in text.split('\n\n'):
+        paragraph = paragraph.strip()
+
+        # Ignorer les paragraphes courts (souvent des labels)
+        if len(paragraph) < 20:
+            continue
+
+        # Si plus de 20% des mots sont liés aux figures, ignorer
+        word_count = len(paragraph.split())
+        if word_count > 0 and len(_FIGURE_WORD.findall(paragraph)) / word_count > 0.2:
+            continue
+
+        # Ignorer les paragraphes qui sont des listes de références
+        if paragraph.count('(') > len(paragraph) / 20:
+            continue
+
+        # Ignorer les paragraphes qui sont principalement des chiffres et symboles
+        if count_ascii_letters(paragraph) < len(paragraph) * 0.5:
+            continue
+
+        filtered_paragraphs.append(paragraph)
+
+    return '\n\n'.join(filtered_paragraphs)
+
+
+# --- clean_extracted_text (texte PDF assemblé) -----------------------------
+
+IGNORE_LINE_PATTERNS = [
+    # Figures et tableaux
+    r'^\s*Figure\s+\d+',
+    r'^\s*Fig\.\s+\d+',
+    r'^\s*Table\s+\d+',
+    r'^\s*Box\s+\d+',
+    r'^\s*Panel\s+[A-Z]',
+    r'^\s*\([a-z]\)\s*$',  # (a), (b), etc.
+    r'^\s*[A-Z]\)\s*$',    # A), B), etc.
+
+    # Navigation et références
+    r'^\s*SPM-\d+',
+    r'^\s*WG[I]+\s*-\s*\d+',
+    r'^\s*AR6\s+',
+    r'^\s*IPCC\s+',
+    r'^\s*See\s+',
+    r'^\s*\{[^}]*\}',      # {références}
+
+    # Numéros de page et headers
+    r'^\s*\d+\s*$',
+    r'^\s*Page\s+\d+',
+    r'^\s*Chapter\s+\d+',
+    r'^\s*Summary\s+for\s+Policymakers',
+
+    # Éléments de structure PDF
+    r'^\s*===\s*Page\s+\d+\s*===',
+    r'^\s*\.\.\.',
+    r'^\s*…',
+
+    # Légendes courtes et labels
+    r'^\s*[a-z]\.\s*$',
+    r'^\s*\d+\.\s*$',
+    r'^\s*\([^)]{1,3}\)\s*$',
+]
+# re.match sur l'alternation <=> au moins un des patterns matche
+_IGNORE_LINE = re.compile('|'.join(f'(?:{pattern})' for pattern in IGNORE_LINE_PATTERNS), re.IGNORECASE)
+_WHITESPACE = re.compile(r'\s+')
+_CONTROL_CHARS = re.compile(r'[\x00-\x1f\x7f-\x9f]')
+# Vrai seulement si l'une des deux substitutions ci-dessus changerait la ligne
+_NEEDS_NORMALIZE = re.compile(r'\s\s|[^\S ]|[\x00-\x1f\x7f-\x9f]')
+
+
+def iter_clean_lines(lines):
+    """Nettoie un flux de lignes et produit les lignes conservées."""
+    for line in lines:
+        line = line.strip()
+
+        # Ignorer les lignes très courtes
+        if len(line) < 5:
+            continue
+
+        # Ignorer les lignes qui matchent les patterns
+        if _IGNORE_LINE.match(line):
+            continue
+
+        # Ignorer les lignes qui sont principalement des caractères spéciaux
+        if count_ascii_letters(line) < len(line) * 0.3:
+            continue
+
+        # Ignorer les lignes répétitives (souvent des artefacts)
+        if line.count('.') > len(line) * 0.5:
+            continue
+
+        if line.count('_') > len(line) * 0.3:
+            continue
+
+        if _NEEDS_NORMALIZE.search(line):
+            line = _WHITESPACE.sub(' ', line)
+            line = _CONTROL_CHARS.sub('', line)
+
+        yield line
+
+
+def clean_extracted_text(text):
+    """Nettoie le texte extrait des PDFs - élimine figures, navigation et artefacts."""
+    return '\n'.join(iter_clean_lines(text.split('\n')))
@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+Index vectoriels interchangeables derrière une même interface VectorStore.
+
+    chroma   collection Chroma persistante (vectorstore.py)
+    numpy    recherche exacte : produit matriciel BLAS sur l'artefact mappé en mémoire
+    hnsw     graphe HNSW approché (faiss IndexHNSWFlat), construit depuis l'artefact
+    int8     codes int8 en RAM, candidats rescorés sur les float32 mappés en mémoire
+    binary   codes 1 bit (signe autour de la moyenne), distance de Hamming par popcount
+
+Toutes les distances sont des L2 au carré (la métrique par défaut de Chroma) :
+les trois backends renvoient les mêmes voisins, au rappel de HNSW près.
+
+    python vector_index.py bench [--queries 200] [--k 8]
+"""
+
+import argparse
+import hashlib
+import importlib.util
+import json
+import os
+import time
+
+import numpy as np
+
+from artifacts import EMBEDDINGS_DIR, EmbeddingsArtifact
+
+PERSIST_DIRECTORY = "chroma_db_climate_facts"
+COLLECTION_NAME = "climate_facts_chunks"
+INDEX_DIR = ".vector_index"  # Index HNSW construits, un par version de l'artefact
+
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+
+# Index quantifiés : k * facteur candidats rescorés en float32 (lus dans le memmap)
+RESCORE_FACTOR = {"int8": 4, "binary": 16}
+INT8_BLOCK_ROWS = 4096  # Lignes converties en float32 à la fois pendant la recherche int8
+
+BENCH_QUERIES = 200
+BENCH_K = 8
+BENCH_NOISE = 0.05  # Requêtes du bench : lignes de l'artefact bruitées
+
+
+# Champs de meta.json qui décrivent le contenu (pas created_at : un ré-embedding identique garde sa version)
+FINGERPRINT_FIELDS = ("format_version", "model", "count", "dim", "dtype", "content_sha256")
+
+
+def artifact_fingerprint(artifact):
+    if "content_sha256" in artifact.meta:
+        fields = {field: artifact.meta.get(field) for field in FINGERPRINT_FIELDS}
+    else:
+        fields = artifact.meta  # Artefact antérieur à content_sha256 : seule la date distingue deux contenus
+    return hashlib.sha256(json.dumps(fields, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+class VectorStore:
+    """query(vecteur, k) -> [{'id', 'text', 'source', 'sources', 'distance'}, ...] du plus proche au plus loin."""
+
+    name = None
+    modules = ()
+
+    @classmethod
+    def is_available(cls):
+        return all(importlib.util.find_spec(module) is not None for module in cls.modules)
+
+    def query(self, embedding, k):
+        raise NotImplementedError
+
+    def memory_bytes(self):
+        """Octets de l'index gardés en RAM (None si inconnu)."""
+        return None
+
+    def version(self):
+        """Identifiant du contenu indexé ; change quand l'index est reconstruit ou modifié."""
+        raise NotImplementedError
+
+
+class ChromaStore(VectorStore):
+    name = "chroma"
+    modules = ("chromadb",)
+
+    def __init__(self, path=PERSIST_DIRECTORY, collection_name=COLLECTION_NAME):
+        import chromadb
+
+        client = chromadb.PersistentClient(path=path)
+        self.collection = client.get_collection(name=collection_name, embedding_function=None)
+
+    def version(self):
+        # Incrémentée par vectorstore.py à chaque chargement qui modifie la collection
+        return f"chroma-{(self.collection.metadata or {}).get('index_version', 0)}"
+
+    def query(self, embedding, k):
+        results = self.collection.query(query_embeddings=[np.asarray(embedding, dtype=np.float32)], n_results=k,
+                                        include=['documents', 'metadatas', 'distances'])
+        return [{'id': chunk_id, 'text': text, 'source': metadata.get('source'),
+                 'sources': metadata.get('sources'), 'distance': float(distance)}
+                for chunk_id, text, metadata, distance in zip(results['ids'][0], results['documents'][0],
+                                                              results['metadatas'][0], results['distances'][0])]
+
+
+class _ArtifactStore(VectorStore):
+    """Base des index construits sur l'artefact : les textes sont relus par ligne dans chunks.jsonl."""
+
+    def __init__(self, path=EMBEDDINGS_DIR):
+        self.artifact = EmbeddingsArtifact(path)
+
+    def version(self):
+        return artifact_fingerprint(self.artifact)
+
+    def hits(self, indices, distances):
+        records = self.artifact.records(indices)
+        return [{'id': record['id'], 'text': record['text'], 'source': record['source'],
+                 'sources': ", ".join(record.get('sources', [record['source']])), 'distance': float(distance)}
+                for record, distance in zip(records, distances)]
+
+
+class NumpyStore(_ArtifactStore):
+    name = "numpy"
+
+    def __init__(self, path=EMBEDDINGS_DIR):
+        super().__init__(path)
+        vectors = self.artifact.vectors
+        # float32 : lu directement dans le memmap ; float16 : converti une fois en RAM
+        self.vectors = vectors if vectors.dtype == np.float32 else np.asarray(vectors, dtype=np.float32)
+        self.norms = np.einsum('ij,ij->i', self.vectors, self.vectors)
+
+    def memory_bytes(self):
+        return self.vectors.nbytes + self.norms.nbytes
+
+    def search(self, embedding, k):
+        """(indices, distances L2 au carré) des k plus proches, triés."""
+        query = np.asarray(embedding, dtype=np.float32)
+        distances = self.norms - 2 * (self.vectors @ query) + query @ query
+        k = min(k, len(distances))
+        top = np.argpartition(distances, k - 1)[:k] if k < len(distances) else np.arange(len(distances))
+        top = top[np.argsort(distances[top], kind='stable')]
+        return top, np.maximum(distances[top], 0)
+
+    def query(self, embedding, k):
+        return self.hits(*self.search(embedding, k))
+
+
+class HnswStore(_ArtifactStore):
+    name = "hnsw"
+    modules = ("faiss",)
+
+    def __init__(self, path=EMBEDDINGS_DIR, ef_search=HNSW_EF_SEARCH):
+        import faiss
+
+        super().__init__(path)
+        index_path = os.path.join(INDEX_DIR, f"hnsw-{artifact_fingerprint(self.artifact)}-m{HNSW_M}.faiss")
+        if os.path.exists(index_path):
+            self.index = faiss.read_index(index_path)
+        else:
+            self.index = faiss.IndexHNSWFlat(self.artifact.meta['dim'], HNSW_M)
+            self.index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+            self.index.add(self.artifact.float32_vectors())
+            os.makedirs(INDEX_DIR, exist_ok=True)
+            faiss.write_index(self.index, index_path + '.tmp')
+            os.replace(index_path + '.tmp', index_path)
+        self.index.hnsw.efSearch = ef_search
+
+    def memory_bytes(self):
+        import faiss
+
+        return faiss.serialize_index(self.index).nbytes
+
+    def search(self, embedding, k):
+        distances, indices = self.index.search(np.asarray(embedding, dtype=np.float32).reshape(1, -1), k)
+        keep = indices[0] >= 0
+        return indices[0][keep], distances[0][keep]
+
+    def query(self, embedding, k):
+        return self.hits(*self.search(embedding, k))
+
+
+if hasattr(np, 'bitwise_count'):  # numpy >= 2.0
+    popcount = np.bitwise_count
+else:
+    _POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+    def popcount(codes):
+        return _POPCOUNT_TABLE[codes]
+
+
+class _QuantizedStore(_ArtifactStore):
+    """Recherche grossière sur des codes compacts, puis rescoring exact des k * RESCORE_FACTOR meilleurs.
+
+    Seuls les codes restent en RAM ; les float32 de l'artefact ne sont lus
+    (memmap) que pour les candidats.
+    """
+
+    def __init__(self, path=EMBEDDINGS_DIR):
+        super().__init__(path)
+        codes_path = os.path.join(INDEX_DIR, f"{self.name}-{artifact_fingerprint(self.artifact)}.npz")
+        if os.path.exists(codes_path):
+            with np.load(codes_path) as data:
+                self.load_codes(data)
+        else:
+            arrays = self.build_codes(self.artifact)
+            os.makedirs(INDEX_DIR, exist_ok=True)
+            with open(codes_path + '.tmp', 'wb') as f:
+                np.savez(f, **arrays)
+            os.replace(codes_path + '.tmp', codes_path)
+            self.load_codes(arrays)
+
+    def search(self, embedding, k):
+        query = np.asarray(embedding, dtype=np.float32)
+        scores = self.approximate_distances(query)
+        candidates = min(len(scores), k * RESCORE_FACTOR[self.name])
+        if candidates < len(scores):
+            top = np.sort(np.argpartition(scores, candidates - 1)[:candidates])
+        else:
+            top = np.arange(len(scores))
+        vectors = np.asarray(self.artifact.vectors[top], dtype=np.float32)
+        distances = ((vectors - query) ** 2).sum(axis=1)
+        best = np.argsort(distances, kind='stable')[:k]
+        return top[best], distances[best]
+
+    def query(self, embedding, k):
+        return self.hits(*self.search(embedding, k))
+
+
+class Int8Store(_QuantizedStore):
+    name = "int8"
+
+    @staticmethod
+    def build_codes(artifact):
+        # Centré sur la moyenne, une seule échelle : les distances entre codes restent proportionnelles
+        mean = np.zeros(artifact.meta['dim'], dtype=np.float64)
+        for start in range(0, len(artifact), INT8_BLOCK_ROWS):
+            mean += artifact.float32_vectors(start, start + INT8_BLOCK_ROWS).sum(axis=0)
+        mean = (mean / max(1, len(artifact))).astype(np.float32)
+        peak = max((np.abs(artifact.float32_vectors(start, start + INT8_BLOCK_ROWS) - mean).max()
+                    for start in range(0, len(artifact), INT8_BLOCK_ROWS)), default=1.0)
+        scale = np.float32(peak / 127 if peak else 1.0)
+        codes = np.empty((len(artifact), artifact.meta['dim']), dtype=np.int8)
+        for start in range(0, len(artifact), INT8_BLOCK_ROWS):
+            block = artifact.float32_vectors(start, start + INT8_BLOCK_ROWS)
+            codes[start:start + len(block)] = np.clip(np.rint((block - mean) / scale), -127, 127)
+        return {'codes': codes, 'mean': mean, 'scale': np.array(scale)}
+
+    def load_codes(self, data):
+        self.codes = np.asarray(data['codes'])
+        self.mean = np.asarray(data['mean'])
+        self.scale = float(data['scale'])
+        self.code_norms = np.einsum('ij,ij->i', self.codes, self.codes, dtype=np.int64).astype(np.float32)
+
+    def memory_bytes(self):
+        return self.codes.nbytes + self.code_norms.nbytes + self.mean.nbytes
+
+    def approximate_distances(self, query):
+        # Distance asymétrique : la requête reste en float, les lignes sont converties par blocs
+        scaled = (query - self.mean) / self.scale
+        dots = np.empty(len(self.codes), dtype=np.float32)
+        for start in range(0, len(self.codes), INT8_BLOCK_ROWS):
+            dots[start:start + INT8_BLOCK_ROWS] = self.codes[start:start + INT8_BLOCK_ROWS].astype(np.float32) @ scaled
+        return self.code_norms - 2 * dots
+
+
+class BinaryStore(_QuantizedStore):
+    name = "binary"
+
+    @staticmethod
+    def build_codes(artifact):
+        # Bit = signe autour de la moyenne du corpus (les embeddings ne sont pas centrés)
+        mean = np.zeros(artifact.meta['dim'], dtype=np.float64)
+        for start in range(0, len(artifact), INT8_BLOCK_ROWS):
+            mean += artifact.float32_vectors(start, start + INT8_BLOCK_ROWS).sum(axis=0)
+        mean = (mean / max(1, len(artifact))).astype(np.float32)
+        codes = np.empty((len(artifact), (artifact.meta['dim'] + 7) // 8), dtype=np.uint8)
+        for start in range(0, len(artifact), INT8_BLOCK_ROWS):
+            block = artifact.float32_vectors(start, start + INT8_BLOCK_ROWS)
+            codes[start:start + len(block)] = np.packbits(block > mean, axis=1)
+        return {'codes': codes, 'mean': mean}
+
+    def load_codes(self, data):
+        self.codes = np.asarray(data['codes'])
+        self.mean = np.asarray(data['mean'])
+
+    def memory_bytes(self):
+        return self.codes.nbytes + self.mean.nbytes
+
+    def approximate_distances(self, query):
+        bits = np.packbits(query > self.mean)
+        return popcount(self.codes ^ bits).sum(axis=1, dtype=np.int32)
+
+
+STORES = {store.name: store for store in (ChromaStore, NumpyStore, HnswStore, Int8Store, BinaryStore)}
+
+
+def open_store(name):
+    try:
+        store = STORES[name]
+    except KeyError:
+        raise ValueError(f"index vectoriel inconnu: {name} (choix: {', '.join(STORES)})")
+    if not store.is_available():
+        raise ImportError(f"{', '.join(store.modules)} non installé pour l'index {name}")
+    return store()
+
+
+def bench_queries(artifact, count, noise=BENCH_NOISE, seed=0):
+    """Lignes tirées au hasard dans l'artefact, bruitées pour ne pas retomber exactement dessus."""
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(artifact), size=min(count, len(artifact)), replace=False)
+    queries = artifact.float32_vectors()[np.sort(rows)]
+    scale = noise * np.linalg.norm(queries, axis=1, keepdims=True) / np.sqrt(queries.shape[1])
+    return queries + rng.standard_normal(queries.shape).astype(np.float32) * scale
+
+
+def bench(num_queries=BENCH_QUERIES, k=BENCH_K):
+    exact = NumpyStore()
+    queries = bench_queries(exact.artifact, num_queries)
+    truth = [{record['id'] for record in exact.artifact.records(exact.search(query, k)[0])} for query in queries]
+    print(f"⏱️  {len(exact.artifact)} vecteurs x {exact.artifact.meta['dim']}, {len(queries)} requêtes, k={k}")
+
+    for name, store_class in STORES.items():
+        if not store_class.is_available():
+            print(f"   {name:<7} indisponible")
+            continue
+        start = time.perf_counter()
+        try:
+            store = store_class()
+        except Exception as e:
+            print(f"   {name:<7} erreur à l'ouverture: {e}")
+            continue
+        open_time = time.perf_counter() - start
+        store.query(queries[0], k)  # Échauffement
+        latencies = []
+        recalls = []
+        for query, expected in zip(queries, truth):
+            start = time.perf_counter()
+            hits = store.query(query, k)
+            latencies.append(time.perf_counter() - start)
+            recalls.append(len(expected & {hit['id'] for hit in hits}) / len(expected))
+        memory = store.memory_bytes()
+        print(f"   {name:<7} ouverture {open_time * 1000:7.1f} ms  p50 {np.percentile(latencies, 50) * 1000:6.2f} ms  "
+              f"p99 {np.percentile(latencies, 99) * 1000:6.2f} ms  recall@{k} {np.mean(recalls):.3f}  "
+              f"RAM {memory / (1024 * 1024) if memory is not None else float('nan'):7.1f} MB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the vector index backends against exact search.")
+    parser.add_argument("command", choices=["bench"])
+    parser.add_argument("--queries", type=int, default=BENCH_QUERIES)
+    parser.add_argument("--k", type=int, default=BENCH_K)
+    args = parser.parse_args(argv)
+    bench(args.queries, args.k)
+
+
+if __name__ == "__main__":
+    main()
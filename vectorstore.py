@@ -1,37 +1,124 @@
+import hashlib
 import json
+import time
+import numpy as np
 import chromadb
-from chromadb.utils import embedding_functions # Pour utiliser les embeddings pré-calculés
+from artifacts import EMBEDDINGS_DIR, EmbeddingsArtifact
 
-INPUT_EMBEDDINGS_FILE = "climate_embeddings_data.json"
+INPUT_EMBEDDINGS_DIR = EMBEDDINGS_DIR
 PERSIST_DIRECTORY = "chroma_db_climate_facts"
 COLLECTION_NAME = "climate_facts_chunks"
 
+# Lignes envoyées par appel (bornées aussi par client.get_max_batch_size())
+LOAD_BATCH_SIZE = 1000
 
 
-with open(INPUT_EMBEDDINGS_FILE, 'r', encoding='utf-8') as f:
-    all_data = json.load(f)
+def content_hash(record, vector, model_name):
+    """Empreinte d'une ligne : texte, métadonnées, modèle et octets du vecteur stocké.
 
+    Les octets changent avec le backend, la normalisation ou le dtype de
+    l'artefact : un ré-embedding sous le même nom de modèle est bien rechargé.
+    """
+    payload = json.dumps([record['text'], record['source'], record.get('sources'), model_name], ensure_ascii=False)
+    digest = hashlib.sha256(payload.encode('utf-8'))
+    digest.update(str(vector.dtype).encode('ascii'))
+    digest.update(np.ascontiguousarray(vector).tobytes())
+    return digest.hexdigest()[:16]
 
-client = chromadb.PersistentClient(path=PERSIST_DIRECTORY)
 
-default_ef = embedding_functions.DefaultEmbeddingFunction()
+def record_metadata(record, record_hash):
+    # 'sources' : toutes les sources d'un chunk fusionné par dedupe.py (les métadonnées Chroma sont scalaires)
+    return {
+        'source': record['source'],
+        'sources': ", ".join(record.get('sources', [record['source']])),
+        'content_hash': record_hash,
+    }
 
-collection = client.get_or_create_collection(
-    name=COLLECTION_NAME,
-    embedding_function=default_ef
-)
 
-ids = [item['id'] for item in all_data]
-documents = [item['text'] for item in all_data]
-embeddings = [item['embedding'] for item in all_data]
-metadatas = [{'source': item['source']} for item in all_data] # Créer les métadonnées
+def existing_hashes(collection, batch_size):
+    """{id: content_hash} de la collection, lue par pages (sans documents ni vecteurs)."""
+    hashes = {}
+    offset = 0
+    while True:
+        page = collection.get(include=['metadatas'], limit=batch_size, offset=offset)
+        for chunk_id, metadata in zip(page['ids'], page['metadatas']):
+            hashes[chunk_id] = (metadata or {}).get('content_hash')
+        if len(page['ids']) < batch_size:
+            return hashes
+        offset += batch_size
 
 
+def iter_changed_batches(artifact, existing, batch_size):
+    """Lots (indices de lignes, records, empreintes) des chunks nouveaux ou modifiés, dans l'ordre de l'artefact."""
+    model_name = artifact.meta['model']
+    indices, records, hashes = [], [], []
+    block = None
+    for index, record in enumerate(artifact.iter_records()):
+        if index % batch_size == 0:
+            # Vecteurs tels que stockés (float16 ou float32), lus par blocs depuis le memmap
+            block = np.asarray(artifact.vectors[index:index + batch_size])
+        record_hash = content_hash(record, block[index % batch_size], model_name)
+        if existing.get(record['id']) == record_hash:
+            continue
+        indices.append(index)
+        records.append(record)
+        hashes.append(record_hash)
+        if len(indices) == batch_size:
+            yield indices, records, hashes
+            indices, records, hashes = [], [], []
+    if indices:
+        yield indices, records, hashes
 
-collection.upsert(
-    ids=ids,
-    embeddings=embeddings,
-    metadatas=metadatas,
-    documents=documents # Le texte original est stocké comme 'document'
-)
 
+def load_collection(artifact, collection, batch_size):
+    """Ajoute / met à jour / supprime seulement ce qui a changé ; retourne les compteurs."""
+    existing = existing_hashes(collection, batch_size)
+    stats = {'added': 0, 'updated': 0, 'deleted': 0, 'unchanged': 0}
+    seen = set()
+
+    for indices, records, hashes in iter_changed_batches(artifact, existing, batch_size):
+        collection.upsert(
+            ids=[record['id'] for record in records],
+            embeddings=np.asarray(artifact.vectors[indices], dtype=np.float32),
+            metadatas=[record_metadata(record, record_hash) for record, record_hash in zip(records, hashes)],
+            documents=[record['text'] for record in records]  # Le texte original est stocké comme 'document'
+        )
+        for record in records:
+            stats['updated' if record['id'] in existing else 'added'] += 1
+            seen.add(record['id'])
+
+    artifact_ids = {record['id'] for record in artifact.iter_records()}
+    stats['unchanged'] = len(artifact_ids) - len(seen)
+    removed = [chunk_id for chunk_id in existing if chunk_id not in artifact_ids]
+    for i in range(0, len(removed), batch_size):
+        collection.delete(ids=removed[i:i + batch_size])
+    stats['deleted'] = len(removed)
+
+    if stats['added'] or stats['updated'] or stats['deleted']:
+        # Nouvelle version de l'index : les résultats en cache (query_cache.py) ne sont plus lus
+        metadata = dict(collection.metadata or {})
+        metadata['index_version'] = metadata.get('index_version', 0) + 1
+        collection.modify(metadata=metadata)
+    return stats
+
+
+def main():
+    artifact = EmbeddingsArtifact(INPUT_EMBEDDINGS_DIR)
+
+    client = chromadb.PersistentClient(path=PERSIST_DIRECTORY)
+    # Les embeddings sont précalculés : pas de modèle d'embedding chargé par Chroma
+    collection = client.get_or_create_collection(name=COLLECTION_NAME, embedding_function=None)
+    batch_size = min(LOAD_BATCH_SIZE, client.get_max_batch_size())
+
+    start_time = time.time()
+    stats = load_collection(artifact, collection, batch_size)
+    elapsed = time.time() - start_time
+
+    written = stats['added'] + stats['updated']
+    print(f"{COLLECTION_NAME}: +{stats['added']} ~{stats['updated']} -{stats['deleted']} "
+          f"={stats['unchanged']} chunks in {elapsed:.1f}s "
+          f"({written / elapsed if elapsed else 0:.0f} rows/sec written, batches of {batch_size})")
+
+
+if __name__ == "__main__":
+    main()